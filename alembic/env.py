@@ -30,6 +30,13 @@ from tg_assistant.config import settings
 target_metadata = Base.metadata
 
 
+def include_name(name, type_, parent_names) -> bool:
+    # FTS5-таблица и её теневые таблицы создаются вручную в миграции, autogenerate их не трогает
+    if type_ == "table" and name is not None and name.startswith("chunk_fts"):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -52,6 +59,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -61,7 +69,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
 
     with context.begin_transaction():
         context.run_migrations()
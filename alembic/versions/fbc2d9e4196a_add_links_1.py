@@ -1,7 +1,7 @@
 """add links 1
 
 Revision ID: fbc2d9e4196a
-Revises: ece05955c9de
+Revises: afc609574c9a
 Create Date: 2026-01-18 00:03:02.858392
 
 """
@@ -13,7 +13,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision: str = 'fbc2d9e4196a'
-down_revision: Union[str, Sequence[str], None] = 'ece05955c9de'
+down_revision: Union[str, Sequence[str], None] = 'afc609574c9a'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
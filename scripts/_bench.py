@@ -0,0 +1,26 @@
+"""
+Общие помощники бенчмарков из scripts/ (сам по себе не запускается).
+
+    from _bench import TICK_S, fake_updates, percentile
+"""
+import asyncio
+
+TICK_S = 0.01  # период «фейкового апдейта», по опозданию которого меряется задержка event loop
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль q (0..1) по ближайшему рангу; для пустого списка — 0."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
+
+
+async def fake_updates(stop: asyncio.Event, lags: list[float]) -> None:
+    """Тикает каждые TICK_S, пока не выставлен stop; в lags — на сколько опоздал каждый тик, с."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(TICK_S)
+        lags.append(loop.time() - t0 - TICK_S)
@@ -0,0 +1,71 @@
+"""
+Заполнение лексического индекса (chunk_texts + FTS5) из уже существующих коллекций Chroma.
+
+Новые чанки попадают в индекс сами (LexicalIndex подписан на запись в Chroma);
+скрипт нужен один раз после миграции — для файлов и ссылок, проиндексированных раньше.
+Повторный запуск безопасен: строки обновляются по chunk_id.
+
+    python scripts/backfill_lexical_index.py
+    python scripts/backfill_lexical_index.py --user-id 1
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.lexical_index import LexicalIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("backfill_lexical")
+
+PAGE = 1000
+
+
+def user_ids(chroma: ChromaService) -> list[int]:
+    out: list[int] = []
+    for col in chroma.client.list_collections():
+        name = getattr(col, "name", col)
+        prefix, _, tail = str(name).partition("_")
+        if prefix == "user" and tail.isdigit():
+            out.append(int(tail))
+    return sorted(out)
+
+
+def backfill_user(chroma: ChromaService, lexical: LexicalIndex, user_id: int) -> int:
+    col = chroma.get_user_collection(user_id)
+    n = col.count()
+    for offset in range(0, n, PAGE):
+        page = col.get(limit=PAGE, offset=offset, include=["documents", "metadatas"])
+        lexical.on_upsert(
+            user_id,
+            page["ids"],
+            [],
+            [d or "" for d in page["documents"]],
+            [m or {} for m in page["metadatas"]],
+        )
+    return n
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", type=int, help="только один пользователь")
+    args = parser.parse_args()
+
+    chroma = ChromaService()
+    lexical = LexicalIndex()
+    try:
+        users = [args.user_id] if args.user_id is not None else user_ids(chroma)
+        t0 = time.perf_counter()
+        total = 0
+        for user_id in users:
+            n = await asyncio.to_thread(backfill_user, chroma, lexical, user_id)
+            logger.info("user=%s chunks=%s", user_id, n)
+            total += n
+        logger.info("done: users=%s chunks=%s in %.1fs", len(users), total, time.perf_counter() - t0)
+    finally:
+        lexical.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Бенчмарк: задержка event loop при конкурентных запросах в Chroma.
+
+blocking — как было в хендлерах: синхронный ChromaService.query_by_embedding прямо в корутине.
+async    — AsyncChromaService: отдельный пул потоков и ограничение запросов в полёте.
+
+Пока идут запросы, каждые 10 мс тикает «фейковый апдейт»; меряем, насколько он опаздывает
+(p50/p99/max), пропускную способность и число HTTP-запросов на один поиск.
+Данные синтетические, во временной коллекции.
+
+Запуск:
+    python scripts/bench_chroma_loop_lag.py --concurrency 16 --queries 400 --dim 768
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from tg_assistant.services.chroma_service import AsyncChromaService, ChromaService
+
+from _bench import fake_updates, percentile
+
+BENCH_USER_ID = 999_999_002
+
+
+async def run(mode: str, chroma: AsyncChromaService, vectors: list[list[float]], concurrency: int) -> None:
+    queue = list(vectors)
+
+    async def worker() -> None:
+        while queue:
+            vec = queue.pop()
+            if mode == "blocking":
+                chroma.sync.query_by_embedding(BENCH_USER_ID, vec, 20)
+            else:
+                await chroma.query_by_embedding(BENCH_USER_ID, vec, 20)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--queries", type=int, default=400)
+    p.add_argument("--docs", type=int, default=2000)
+    p.add_argument("--dim", type=int, default=768)
+    p.add_argument("--max-concurrency", type=int, help="потоков у AsyncChromaService (по умолчанию из настроек)")
+    args = p.parse_args()
+
+    chroma = AsyncChromaService(ChromaService(), max_concurrency=args.max_concurrency)
+    rnd = random.Random(0)
+    ids = [f"bench_{i}" for i in range(args.docs)]
+    await chroma.upsert_many(
+        BENCH_USER_ID,
+        ids,
+        [[rnd.random() for _ in range(args.dim)] for _ in ids],
+        [f"doc {i}" for i in range(args.docs)],
+        [{"entity_type": "file", "entity_id": i, "user_id": BENCH_USER_ID} for i in range(args.docs)],
+    )
+    vectors = [[rnd.random() for _ in range(args.dim)] for _ in range(args.queries)]
+
+    try:
+        for mode in ("blocking", "async"):
+            lags: list[float] = []
+            stop = asyncio.Event()
+            chroma.requests.clear()
+            ticker = asyncio.create_task(fake_updates(stop, lags))
+            t0 = time.perf_counter()
+            await run(mode, chroma, vectors, args.concurrency)
+            wall = time.perf_counter() - t0
+            stop.set()
+            await ticker
+            print(
+                f"{mode:>8}: queries={args.queries} concurrency={args.concurrency} wall={wall:.2f}s "
+                f"qps={args.queries / wall:.0f} lag p50={percentile(lags, 0.5) * 1000:.1f}ms "
+                f"p99={percentile(lags, 0.99) * 1000:.1f}ms max={max(lags, default=0.0) * 1000:.1f}ms "
+                f"requests/query={sum(chroma.requests.values()) / args.queries:.2f}"
+            )
+        print(f"collection cache: {dict(chroma.sync.collection_cache)}")
+    finally:
+        await chroma.drop_user_collection(BENCH_USER_ID)
+        chroma.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
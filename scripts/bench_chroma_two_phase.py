@@ -0,0 +1,97 @@
+"""
+Бенчмарк: одно- и двухфазный поиск в Chroma — байты ответа и задержка.
+
+single    — как было: query(n) с documents + metadatas + distances.
+two_phase — query(n) без documents, затем get(ids) текстов только для top-K выживших
+            (как в chat.py: K=6 для QA, до 8 кандидатов на rerank файлов/ссылок).
+
+Байты считаются по телам HTTP-ответов Chroma (хук на httpx-сессии клиента).
+Без --user-id создаётся временная коллекция с синтетическими чанками ~1500 символов.
+
+Запуск:
+    python scripts/bench_chroma_two_phase.py --n 60 --keep 6
+    python scripts/bench_chroma_two_phase.py --user-id 1 --n 120 --keep 8
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from tg_assistant.services.chroma_service import AsyncChromaService, ChromaService
+
+from _bench import percentile
+
+BENCH_USER_ID = 999_999_020
+WORDS = "семестр сессия зачёт экзамен стипендия практика договор общежитие кафедра лекция".split()
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--user-id", type=int, help="реальная коллекция (по умолчанию — синтетическая)")
+    p.add_argument("--n", type=int, default=60, help="n_results первой фазы")
+    p.add_argument("--keep", type=int, default=6, help="скольким хитам нужны тексты")
+    p.add_argument("--queries", type=int, default=100)
+    p.add_argument("--docs", type=int, default=3000)
+    p.add_argument("--dim", type=int, default=768)
+    args = p.parse_args()
+
+    sync = ChromaService()
+    chroma = AsyncChromaService(sync)
+    received: list[int] = []
+
+    def on_response(response) -> None:
+        response.read()
+        received.append(len(response.content))
+
+    sync.client._server._session.event_hooks["response"].append(on_response)
+
+    rnd = random.Random(0)
+    user_id = args.user_id if args.user_id is not None else BENCH_USER_ID
+    if args.user_id is None:
+        ids = [f"bench_{i}" for i in range(args.docs)]
+        for start in range(0, args.docs, 500):
+            part = ids[start : start + 500]
+            await chroma.upsert_many(
+                BENCH_USER_ID,
+                part,
+                [[rnd.random() for _ in range(args.dim)] for _ in part],
+                [" ".join(rnd.choice(WORDS) for _ in range(180)) for _ in part],
+                [{"entity_type": "file", "entity_id": i % 50, "filename": f"doc_{i % 50}.pdf"} for i in range(len(part))],
+            )
+        dim = args.dim
+    else:
+        col = sync.get_user_collection(user_id)
+        dim = len(col.get(limit=1, include=["embeddings"])["embeddings"][0])
+    vectors = [[rnd.random() for _ in range(dim)] for _ in range(args.queries)]
+
+    async def single(vec: list[float]) -> None:
+        hits = await chroma.query_by_embedding(user_id, vec, args.n)
+        assert all(h["text"] is not None for h in hits[: args.keep])
+
+    async def two_phase(vec: list[float]) -> None:
+        hits = await chroma.query_by_embedding(user_id, vec, args.n, include_documents=False)
+        hits = await chroma.fill_documents(user_id, hits[: args.keep])
+        assert all(h["text"] is not None for h in hits)
+
+    try:
+        await single(vectors[0])  # прогрев: хэндл коллекции, соединение
+        for name, fn in (("single", single), ("two_phase", two_phase)):
+            lat: list[float] = []
+            received.clear()
+            for vec in vectors:
+                t = time.perf_counter()
+                await fn(vec)
+                lat.append(time.perf_counter() - t)
+            print(
+                f"{name:<10} n={args.n} keep={args.keep} bytes/query={sum(received) / len(vectors) / 1024:.1f}KB "
+                f"requests/query={len(received) / len(vectors):.1f} "
+                f"p50={percentile(lat, 0.5) * 1000:.1f}ms p90={percentile(lat, 0.9) * 1000:.1f}ms"
+            )
+    finally:
+        if args.user_id is None:
+            await chroma.drop_user_collection(BENCH_USER_ID)
+        chroma.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
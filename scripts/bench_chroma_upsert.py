@@ -0,0 +1,72 @@
+"""
+Бенчмарк: запись одного документа в Chroma — по чанку (upsert_embedding)
+против батчей (upsert_many). Считает HTTP-запросы на документ и время.
+
+Эмбеддинги синтетические, пишутся во временную коллекцию, которая потом удаляется.
+
+Запуск:
+    python scripts/bench_chroma_upsert.py --chunks 200 --dim 768
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from tg_assistant.services.chroma_service import AsyncChromaService
+
+BENCH_USER_ID = 999_999_001
+
+
+def make_doc(n_chunks: int, dim: int) -> tuple[list[str], list[list[float]], list[str], list[dict]]:
+    ids = [f"file_0_chunk_{i}" for i in range(n_chunks)]
+    embeddings = [[random.random() for _ in range(dim)] for _ in range(n_chunks)]
+    documents = [f"chunk {i} " + "lorem ipsum " * 120 for i in range(n_chunks)]
+    metadatas = [
+        {"entity_type": "file", "entity_id": 0, "chunk": i, "filename": "bench.pdf", "user_id": BENCH_USER_ID}
+        for i in range(n_chunks)
+    ]
+    return ids, embeddings, documents, metadatas
+
+
+async def run_per_chunk(chroma: AsyncChromaService, doc) -> None:
+    ids, embeddings, documents, metadatas = doc
+    for doc_id, emb, text, meta in zip(ids, embeddings, documents, metadatas):
+        await chroma.upsert_embedding(BENCH_USER_ID, doc_id, emb, text, meta)
+
+
+async def run_batched(chroma: AsyncChromaService, doc) -> None:
+    ids, embeddings, documents, metadatas = doc
+    await chroma.upsert_many(BENCH_USER_ID, ids, embeddings, documents, metadatas)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chroma = AsyncChromaService()
+    doc = make_doc(args.chunks, args.dim)
+    await chroma.max_batch_size()  # pre-flight не считаем в стоимость документа
+
+    try:
+        for name, fn in (("per-chunk", run_per_chunk), ("upsert_many", run_batched)):
+            times = []
+            chroma.requests.clear()
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                await fn(chroma, doc)
+                times.append(time.perf_counter() - t0)
+            per_doc = sum(chroma.requests.values()) / args.repeat
+            print(
+                f"{name:>12}: chunks={args.chunks} requests/doc={per_doc:.0f} "
+                f"wall/doc={min(times):.3f}s (best of {args.repeat}) {dict(chroma.requests)}"
+            )
+    finally:
+        await chroma.drop_user_collection(BENCH_USER_ID)
+        chroma.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Бенчмарк приёма больших документов: "скачать, потом перечитать и посчитать sha256 на event loop"
+(как было в on_document) против однопроходного write_stream_hashed.
+
+Загрузка из Telegram эмулируется потоком кусков из локального файла со случайными данными.
+Меряется время "хендлера", сколько байт перечитано с диска и задержка event loop (p99/max).
+
+Запуск:
+    python scripts/bench_download_hash.py --size-mb 200
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import AsyncIterator
+
+from tg_assistant.services.downloads import DOWNLOAD_CHUNK_SIZE, write_stream_hashed
+
+from _bench import fake_updates, percentile
+
+
+async def fake_telegram_stream(src: Path, chunk_size: int) -> AsyncIterator[bytes]:
+    with src.open("rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def sha256_file(path: Path) -> str:
+    # старый вариант из files.py: второе чтение файла целиком прямо в хендлере
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def old_path(src: Path, dst: Path) -> tuple[str, int]:
+    with dst.open("wb") as out:
+        async for chunk in fake_telegram_stream(src, 65536):
+            await asyncio.to_thread(out.write, chunk)
+    digest = sha256_file(dst)
+    return digest, dst.stat().st_size  # перечитали файл целиком
+
+
+async def new_path(src: Path, dst: Path) -> tuple[str, int]:
+    digest, _ = await write_stream_hashed(fake_telegram_stream(src, DOWNLOAD_CHUNK_SIZE), dst)
+    return digest, 0
+
+
+async def measure(fn, src: Path, dst: Path) -> dict[str, float]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    t = asyncio.create_task(fake_updates(stop, lags))
+    t0 = time.perf_counter()
+    digest, reread = await fn(src, dst)
+    wall = time.perf_counter() - t0
+    stop.set()
+    await t
+    return {
+        "digest": digest,
+        "wall_s": wall,
+        "reread_mb": reread / 1024 / 1024,
+        "p99_ms": percentile(lags, 0.99) * 1000,
+        "max_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "src.bin"
+        with src.open("wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        results = {}
+        for name, fn in (("old", old_path), ("single-pass", new_path)):
+            results[name] = await measure(fn, src, Path(tmp) / f"dst_{name}.bin")
+            r = results[name]
+            print(
+                f"{name:>11}: size={args.size_mb}MB handler={r['wall_s']:.2f}s "
+                f"re-read={r['reread_mb']:.0f}MB loop lag p99={r['p99_ms']:.1f}ms max={r['max_ms']:.1f}ms"
+            )
+        assert results["old"]["digest"] == results["single-pass"]["digest"]
+
+        # повторная отправка того же файла: раньше — скачать и захэшировать, теперь — только запрос в БД
+        print(
+            f"{'re-sent':>11}: old handler={results['old']['wall_s']:.2f}s "
+            f"downloaded={args.size_mb}MB re-read={args.size_mb}MB; new: 0MB downloaded (dedup by tg_file_unique_id)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
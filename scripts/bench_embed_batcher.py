@@ -0,0 +1,75 @@
+"""
+Бенчмарк: embed() под нагрузкой с микро-батчингом и без.
+
+--users одновременных «пользователей», каждый последовательно эмбеддит свои запросы
+по одному (как chat.py). Дополнительно --ingest-batch имитирует индексацию: один большой вызов
+embed() в начале прогона. Кэш эмбеддингов отключён, тексты уникальные.
+Печатаются embeds/sec, p50/p95 задержки одного вызова и число HTTP-запросов в Ollama.
+
+Запуск:
+    python scripts/bench_embed_batcher.py --users 16 --per-user 20
+    python scripts/bench_embed_batcher.py --users 32 --window-ms 10 --max-batch 128 --ingest-batch 500
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from tg_assistant.services.ollama_service import OllamaService
+
+from _bench import percentile
+
+
+async def run(ollama: OllamaService, users: int, per_user: int, ingest_batch: int) -> tuple[float, list[float]]:
+    lat: list[float] = []
+    tag = uuid.uuid4().hex[:8]
+
+    async def user(u: int) -> None:
+        for i in range(per_user):
+            t = time.perf_counter()
+            await ollama.embed([f"{tag} пользователь {u} вопрос {i} про расписание сессии"])
+            lat.append(time.perf_counter() - t)
+
+    async def ingest() -> None:
+        await ollama.embed([f"{tag} чанк документа {i}" for i in range(ingest_batch)])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)), *([ingest()] if ingest_batch else []))
+    return time.perf_counter() - t0, lat
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=16)
+    p.add_argument("--per-user", type=int, default=20)
+    p.add_argument("--ingest-batch", type=int, default=0, help="размер одного «индексационного» вызова")
+    p.add_argument("--window-ms", type=float, help="окно батчера (по умолчанию из настроек)")
+    p.add_argument("--max-batch", type=int, help="текстов в одном /api/embed (по умолчанию из настроек)")
+    args = p.parse_args()
+
+    for batching in (False, True):
+        ollama = OllamaService(embed_batching=batching)
+        ollama.embed_cache = None
+        if ollama.embed_batcher is not None:
+            if args.window_ms is not None:
+                ollama.embed_batcher.window_s = args.window_ms / 1000
+            if args.max_batch is not None:
+                ollama.embed_batcher.max_batch = args.max_batch
+        await ollama.start()
+        try:
+            await ollama.embed(["прогрев"])
+            wall, lat = await run(ollama, args.users, args.per_user, args.ingest_batch)
+        finally:
+            await ollama.close()
+
+        n = args.users * args.per_user + args.ingest_batch
+        http = ollama.embed_batcher.stats["http_requests"] - 1 if ollama.embed_batcher else "-"
+        print(
+            f"batching={'on ' if batching else 'off'} embeds/sec={n / wall:.0f} "
+            f"p50={percentile(lat, 0.5) * 1000:.0f}ms p95={percentile(lat, 0.95) * 1000:.0f}ms "
+            f"http_requests={http if batching else args.users * args.per_user + (args.ingest_batch > 0)}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
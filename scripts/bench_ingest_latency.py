@@ -0,0 +1,86 @@
+"""
+Бенчмарк: задержка обработки апдейтов, пока бот индексирует документы.
+
+Во время парсинга файлов крутится "фейковый апдейт" каждые 10 мс; меряем,
+на сколько event loop опаздывает его обработать (p50/p99/max).
+Сравниваются два режима: inline (как было в on_document) и через IngestionPool.
+
+Запуск:
+    python scripts/bench_ingest_latency.py big.pdf other.docx --copies 4 --workers 2
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from tg_assistant.services.ingestion import IngestionPool, extract_and_chunk
+
+from _bench import fake_updates, percentile
+
+
+def guess_mime(path: Path) -> str:
+    if path.suffix.lower() == ".pdf":
+        return "application/pdf"
+    return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+async def ingest_inline(path: Path) -> int:
+    # так работал on_document: парсинг прямо в хендлере
+    return len(extract_and_chunk(str(path), guess_mime(path)))
+
+
+async def run_mode(mode: str, files: list[Path], pool: IngestionPool | None) -> dict[str, float]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(fake_updates(stop, lags))
+    await asyncio.sleep(0.1)
+
+    t0 = time.perf_counter()
+    if mode == "inline":
+        results = await asyncio.gather(*(ingest_inline(p) for p in files))
+    else:
+        assert pool is not None
+        results = await asyncio.gather(*(pool.extract_chunks(p, guess_mime(p)) for p in files))
+        results = [len(r) for r in results]
+    wall = time.perf_counter() - t0
+
+    stop.set()
+    await ticker
+    return {
+        "wall_s": wall,
+        "chunks": float(sum(results)),
+        "p50_ms": percentile(lags, 0.50) * 1000,
+        "p99_ms": percentile(lags, 0.99) * 1000,
+        "max_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--copies", type=int, default=4, help="сколько раз загрузить каждый файл параллельно")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--mode", choices=["inline", "pool", "both"], default="both")
+    args = parser.parse_args()
+
+    files = [p for p in args.files for _ in range(args.copies)]
+    modes = ["inline", "pool"] if args.mode == "both" else [args.mode]
+
+    pool = IngestionPool(max_workers=args.workers)
+    pool.start()
+    # прогрев: spawn воркеров и импорт pypdf не должны попадать в замер
+    await asyncio.gather(*(pool.extract_chunks(p, guess_mime(p)) for p in args.files))
+
+    try:
+        for mode in modes:
+            r = await run_mode(mode, files, pool)
+            print(
+                f"{mode:>6}: docs={len(files)} chunks={int(r['chunks'])} wall={r['wall_s']:.2f}s "
+                f"update lag p50={r['p50_ms']:.1f}ms p99={r['p99_ms']:.1f}ms max={r['max_ms']:.1f}ms"
+            )
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Бенчмарк: задержка «интент + вектор запроса» до и после роутера интентов.
+
+baseline — как было: classify_intent (LLM), затем эмбеддинг переписанного запроса.
+router   — каскад правила -> центроиды -> LLM, эмбеддинг текста считается параллельно.
+С --user-id к обоим путям добавляется запрос в Chroma (как в chat.py).
+Кэш эмбеддингов отключается, чтобы второй прогон не выигрывал за счёт первого.
+
+Запуск:
+    python scripts/bench_intent_router.py --rounds 3
+    python scripts/bench_intent_router.py --queries queries.txt --user-id 1
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.intent_router import IntentRouter, classify_with_llm
+from tg_assistant.services.ollama_service import OllamaService
+
+from _bench import percentile
+
+DEFAULT_QUERIES = [
+    "пришли файл с расписанием сессии",
+    "скинь ссылку на личный кабинет",
+    "как оформить академический отпуск?",
+    "что нужно для повышенной стипендии",
+    "отправь документ по практике",
+    "дай линк на репозиторий курса",
+    "когда пересдача по физике",
+    "методичка по схемотехнике",
+    "тот сайт с задачами по алгоритмам",
+    "договор на общежитие",
+    "расскажи про правила перевода на бюджет",
+    "нужна презентация с защиты диплома",
+]
+
+
+async def baseline(ollama: OllamaService, chroma: AsyncChromaService | None, user_id: int | None, text: str) -> None:
+    decision = await classify_with_llm(ollama, text)
+    q_emb = (await ollama.embed([decision.query]))[0]
+    if chroma is not None:
+        await chroma.query_by_embedding(user_id, q_emb, 60, None)
+
+
+async def routed(
+    router: IntentRouter,
+    ollama: OllamaService,
+    chroma: AsyncChromaService | None,
+    user_id: int | None,
+    text: str,
+) -> None:
+    async def embed_one() -> list[float]:
+        return (await ollama.embed([text]))[0]
+
+    text_emb = asyncio.create_task(embed_one())
+    decision = await router.route(text, embedding=text_emb)
+    q_emb = await text_emb
+    if decision.query != text:
+        q_emb = (await ollama.embed([decision.query]))[0]
+    if chroma is not None:
+        await chroma.query_by_embedding(user_id, q_emb, 60, None)
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--queries", type=Path, help="файл с запросами, по одному на строку")
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--user-id", type=int, help="добавить запрос в Chroma к коллекции пользователя")
+    args = p.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        queries = [q.strip() for q in args.queries.read_text(encoding="utf-8").splitlines() if q.strip()]
+
+    ollama = OllamaService()
+    ollama.embed_cache = None
+    await ollama.start()
+    chroma = AsyncChromaService() if args.user_id is not None else None
+    router = IntentRouter(ollama)
+    await router.centroids()  # прогрев: центроиды считаются один раз на процесс
+
+    results: dict[str, list[float]] = {"baseline": [], "router": []}
+    try:
+        for _ in range(args.rounds):
+            for text in queries:
+                t = time.perf_counter()
+                await baseline(ollama, chroma, args.user_id, text)
+                results["baseline"].append(time.perf_counter() - t)
+
+                t = time.perf_counter()
+                await routed(router, ollama, chroma, args.user_id, text)
+                results["router"].append(time.perf_counter() - t)
+    finally:
+        await ollama.close()
+        if chroma is not None:
+            chroma.close()
+
+    for name, lat in results.items():
+        print(
+            f"{name:<9} n={len(lat)} p50={percentile(lat, 0.5) * 1000:.0f}ms "
+            f"p90={percentile(lat, 0.9) * 1000:.0f}ms mean={sum(lat) / len(lat) * 1000:.0f}ms"
+        )
+    for tier, st in router.stats().items():
+        print(f"  {tier:<9} count={st['count']} share={st['share'] * 100:.0f}% avg={st['avg_ms']}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
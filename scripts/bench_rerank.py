@@ -0,0 +1,97 @@
+"""
+Бенчмарк: oneshot vs pointwise rerank на реальных кандидатах пользователя.
+
+Для каждого запроса берутся top-N чанков из Chroma (как в chat.py), затем один и тот же список
+ранжируется обоими движками. Печатаются задержки (p50/p90) и согласие порядков:
+совпадение лучшего кандидата и пересечение top-3. Для pointwise — распределение оценок,
+чтобы подобрать rerank_min_score.
+
+Запуск:
+    python scripts/bench_rerank.py --user-id 1
+    python scripts/bench_rerank.py --user-id 1 --candidates 12 --concurrency 8 --queries queries.txt
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.ollama_service import OllamaService
+from tg_assistant.services.rerank_service import RerankService
+
+from _bench import percentile
+
+DEFAULT_QUERIES = [
+    "расписание сессии",
+    "договор на общежитие",
+    "как оформить академический отпуск",
+    "требования к курсовой работе",
+    "методичка по лабораторной",
+    "правила перевода на бюджет",
+]
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--user-id", type=int, required=True)
+    p.add_argument("--queries", type=Path, help="файл с запросами, по одному на строку")
+    p.add_argument("--candidates", type=int, default=8, help="сколько кандидатов ранжировать")
+    p.add_argument("--concurrency", type=int, help="параллельность pointwise (по умолчанию из настроек)")
+    args = p.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        queries = [q.strip() for q in args.queries.read_text(encoding="utf-8").splitlines() if q.strip()]
+
+    ollama = OllamaService()
+    await ollama.start()
+    chroma = AsyncChromaService()
+    oneshot = RerankService(ollama, engine="oneshot")
+    pointwise = RerankService(ollama, engine="pointwise", concurrency=args.concurrency)
+
+    lat: dict[str, list[float]] = {"oneshot": [], "pointwise": []}
+    top1_same = 0
+    top3_overlap = 0.0
+    scores: list[float] = []
+    n = 0
+    try:
+        for query in queries:
+            q_emb = (await ollama.embed([query]))[0]
+            hits = await chroma.query_by_embedding(args.user_id, q_emb, args.candidates)
+            if len(hits) < 2:
+                continue
+            n += 1
+
+            t = time.perf_counter()
+            a = await oneshot.rerank_hits(query, hits, max_items=args.candidates)
+            lat["oneshot"].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            b = await pointwise.rerank_hits(query, hits, max_items=args.candidates)
+            lat["pointwise"].append(time.perf_counter() - t)
+
+            top1_same += a[0]["id"] == b[0]["id"]
+            top3_overlap += len({h["id"] for h in a[:3]} & {h["id"] for h in b[:3]}) / 3
+            scores.extend(h["rerank_score"] for h in b)
+    finally:
+        await ollama.close()
+        chroma.close()
+
+    if not n:
+        print("нет запросов с >= 2 кандидатами")
+        return
+    for name, values in lat.items():
+        print(
+            f"{name:<9} n={len(values)} p50={percentile(values, 0.5) * 1000:.0f}ms "
+            f"p90={percentile(values, 0.9) * 1000:.0f}ms mean={sum(values) / len(values) * 1000:.0f}ms"
+        )
+    print(f"agreement: top1={top1_same / n * 100:.0f}% top3 overlap={top3_overlap / n * 100:.0f}%")
+    print(
+        "pointwise scores: "
+        + " ".join(f"p{int(q * 100)}={percentile(scores, q):.2f}" for q in (0.1, 0.5, 0.9))
+        + f" >=0.5: {sum(s >= 0.5 for s in scores) / len(scores) * 100:.0f}%"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+Бенчмарк: поиск через Chroma (HTTP) против VectorMirror (NumPy в памяти процесса).
+
+Во временную коллекцию пишутся синтетические чанки, затем одни и те же запросы
+гоняются обоими путями: задержка p50/p99, время ленивой загрузки зеркала, прирост RSS
+и совпадение top-k (HNSW в Chroma приближённый, зеркало — точный перебор).
+В конце проверяется синхронизация: upsert и delete_file_chunks видны зеркалу без перезагрузки.
+
+Запуск:
+    python scripts/bench_vector_mirror.py --docs 5000 --dim 768 --queries 200
+"""
+import argparse
+import asyncio
+import random
+import resource
+import time
+from pathlib import Path
+
+from tg_assistant.services.chroma_service import AsyncChromaService, ChromaService
+from tg_assistant.services.vector_mirror import VectorMirror
+
+from _bench import percentile
+
+BENCH_USER_ID = 999_999_003
+TOP_K = 60
+
+
+def rss_mb() -> float:
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def timed_queries(chroma: AsyncChromaService, vectors: list[list[float]]) -> tuple[list[float], list[list[str]]]:
+    lat, ids = [], []
+    for vec in vectors:
+        t = time.perf_counter()
+        hits = await chroma.query_by_embedding(BENCH_USER_ID, vec, TOP_K, {"entity_type": "file"})
+        lat.append(time.perf_counter() - t)
+        ids.append([h["id"] for h in hits])
+    return lat, ids
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--docs", type=int, default=5000)
+    p.add_argument("--dim", type=int, default=768)
+    p.add_argument("--queries", type=int, default=200)
+    args = p.parse_args()
+
+    rnd = random.Random(0)
+    sync = ChromaService()
+    http = AsyncChromaService(sync)
+    http.mirror = None  # чистый HTTP-путь, даже если зеркало включено в настройках
+
+    ids = [f"file_{i // 50}_chunk_{i % 50}" for i in range(args.docs)]
+    await http.upsert_many(
+        BENCH_USER_ID,
+        ids,
+        [[rnd.gauss(0, 1) for _ in range(args.dim)] for _ in ids],
+        ["lorem ipsum " * 120 for _ in ids],
+        [
+            {"entity_type": "file" if i % 10 else "link", "entity_id": i // 50, "chunk": i % 50, "user_id": BENCH_USER_ID}
+            for i in range(args.docs)
+        ],
+    )
+    vectors = [[rnd.gauss(0, 1) for _ in range(args.dim)] for _ in range(args.queries)]
+
+    mirror = VectorMirror(sync, max_rows=args.docs * 2)
+    local = AsyncChromaService(sync, mirror=mirror)
+    try:
+        await timed_queries(http, vectors[:5])  # прогрев
+        lat_http, ids_http = await timed_queries(http, vectors)
+
+        rss0 = rss_mb()
+        t0 = time.perf_counter()
+        await local.query_by_embedding(BENCH_USER_ID, vectors[0], TOP_K)
+        load_s = time.perf_counter() - t0
+        rss1 = rss_mb()
+        lat_local, ids_local = await timed_queries(local, vectors)
+
+        overlap = sum(len(set(a[:10]) & set(b[:10])) for a, b in zip(ids_http, ids_local)) / (10 * len(vectors))
+        for name, lat in (("chroma", lat_http), ("mirror", lat_local)):
+            print(
+                f"{name:>7}: docs={args.docs} dim={args.dim} p50={percentile(lat, 0.5) * 1000:.2f}ms "
+                f"p99={percentile(lat, 0.99) * 1000:.2f}ms"
+            )
+        print(
+            f"mirror load={load_s:.2f}s size={mirror.memory_bytes() / 1024 / 1024:.1f} MB "
+            f"rss +{rss1 - rss0:.0f} MB (с разбором JSON при загрузке), "
+            f"top-10 overlap with chroma={overlap * 100:.1f}%"
+        )
+
+        # синхронизация: новый файл и удаление старого видны без перезагрузки зеркала
+        probe = [rnd.gauss(0, 1) for _ in range(args.dim)]
+        await local.upsert_many(
+            BENCH_USER_ID,
+            ["file_new_chunk_0"],
+            [probe],
+            ["new"],
+            [{"entity_type": "file", "entity_id": 10**6, "chunk": 0, "user_id": BENCH_USER_ID}],
+        )
+        top = await local.query_by_embedding(BENCH_USER_ID, probe, 1)
+        await local.delete_file_chunks(BENCH_USER_ID, 10**6)
+        after = await local.query_by_embedding(BENCH_USER_ID, probe, 1)
+        print(
+            f"sync: upsert visible={top[0]['id'] == 'file_new_chunk_0'} "
+            f"delete visible={after[0]['id'] != 'file_new_chunk_0'} mirror stats={dict(mirror.stats)}"
+        )
+    finally:
+        await http.drop_user_collection(BENCH_USER_ID)
+        http.close()
+        local.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
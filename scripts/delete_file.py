@@ -4,7 +4,7 @@ from sqlalchemy import select, delete
 
 from tg_assistant.db.engine import SessionMaker
 from tg_assistant.db.models.files import StoredFile
-from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.chroma_service import AsyncChromaService
 
 
 USER_ID = 1
@@ -12,8 +12,9 @@ FILE_ID = 3
 
 
 async def main():
-    chroma = ChromaService()
-    chroma.delete_file_chunks(user_id=USER_ID, file_id=FILE_ID)
+    chroma = AsyncChromaService()
+    await chroma.delete_file_chunks(user_id=USER_ID, file_id=FILE_ID)
+    chroma.close()
 
     async with SessionMaker() as session:
         res = await session.execute(
@@ -0,0 +1,160 @@
+"""
+Оценка Matryoshka-усечения на своих данных: recall@k, задержка поиска и размер индекса по размерностям.
+
+Корпус — векторы коллекции пользователя (должны быть полноразмерными: усечение сравнивается
+с тем, что лежит в Chroma). Запросы — строки --queries-file, эмбеддятся через Ollama в полной
+размерности, либо (по умолчанию) случайные чанки самого корпуса; тогда сам чанк из выдачи исключается.
+
+Эталон — точный top-k по полным векторам. Для каждой размерности печатаются:
+  recall@k  — доля эталонного top-k в точном top-k по усечённым векторам;
+  exact_p50 — точный поиск на NumPy (как VectorMirror);
+  hnsw_*    — с --chroma: временная коллекция в Chroma с усечёнными векторами,
+              recall@k её HNSW-выдачи относительно того же эталона и p50 query();
+  MB        — float32-векторы корпуса (без служебных структур HNSW).
+
+    python scripts/eval_embed_dim.py --user-id 1
+    python scripts/eval_embed_dim.py --user-id 1 --dims 128,256,512 --k 10 --chroma
+    python scripts/eval_embed_dim.py --user-id 1 --queries-file questions.txt
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from chromadb.errors import NotFoundError
+
+from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.ollama_service import OllamaService
+
+from _bench import percentile
+
+BENCH_USER_ID = 999_999_025
+PAGE = 1000
+
+
+def truncate(matrix: np.ndarray, dim: int) -> np.ndarray:
+    """То же, что truncate_embedding, для матрицы целиком."""
+    head = np.ascontiguousarray(matrix[:, :dim])
+    norms = np.linalg.norm(head, axis=1, keepdims=True)
+    return head / np.where(norms == 0, 1.0, norms)
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int, exclude: np.ndarray | None) -> np.ndarray:
+    """Точный top-k по косинусу (векторы нормированы — совпадает с порядком по L2)."""
+    sims = queries @ corpus.T
+    if exclude is not None:
+        sims[np.arange(len(queries)), exclude] = -np.inf
+    idx = np.argpartition(-sims, k, axis=1)[:, :k]
+    order = np.take_along_axis(sims, idx, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def recall(found: list[set[int]], truth: np.ndarray) -> float:
+    return float(np.mean([len(f & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def load_corpus(chroma: ChromaService, user_id: int) -> tuple[list[str], np.ndarray, dict]:
+    col = chroma.client.get_collection(chroma.collection_name(user_id))
+    ids: list[str] = []
+    blocks: list[np.ndarray] = []
+    for offset in range(0, col.count(), PAGE):
+        page = col.get(limit=PAGE, offset=offset, include=["embeddings"])
+        ids.extend(page["ids"])
+        blocks.append(np.asarray(page["embeddings"], dtype=np.float32).reshape(len(page["ids"]), -1))
+    return ids, np.concatenate(blocks), dict(col.metadata or {})
+
+
+def eval_chroma(
+    chroma: ChromaService,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    exclude: np.ndarray | None,
+) -> tuple[list[set[int]], list[float]]:
+    """HNSW-выдача временной коллекции: найденные строки корпуса и задержки query()."""
+    try:
+        chroma.drop_user_collection(BENCH_USER_ID)  # остаток прерванного прогона
+    except NotFoundError:
+        pass
+    col = chroma.get_user_collection(BENCH_USER_ID)
+    step = min(PAGE, chroma.max_batch_size())
+    for start in range(0, len(corpus), step):
+        part = corpus[start : start + step]
+        col.add(ids=[str(i) for i in range(start, start + len(part))], embeddings=part.tolist())
+
+    found: list[set[int]] = []
+    lat: list[float] = []
+    n = k + (exclude is not None)
+    for qi, vec in enumerate(queries):
+        t = time.perf_counter()
+        res = col.query(query_embeddings=[vec.tolist()], n_results=n, include=[])
+        lat.append(time.perf_counter() - t)
+        rows = [int(x) for x in res["ids"][0]]
+        if exclude is not None:
+            rows = [r for r in rows if r != exclude[qi]]
+        found.append(set(rows[:k]))
+    chroma.drop_user_collection(BENCH_USER_ID)
+    return found, lat
+
+
+async def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--user-id", type=int, required=True)
+    p.add_argument("--dims", default="64,128,256,512", help="через запятую; больше полной размерности — пропускаются")
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--queries", type=int, default=200, help="сколько чанков брать запросами (без --queries-file)")
+    p.add_argument("--queries-file", help="вопросы, по одному на строку")
+    p.add_argument("--chroma", action="store_true", help="мерить и HNSW в Chroma (временная коллекция)")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    chroma = ChromaService()
+    ids, corpus, meta = await asyncio.to_thread(load_corpus, chroma, args.user_id)
+    if meta.get("embed_dim", 0):
+        print(f"warning: collection already holds embed_dim={meta['embed_dim']} vectors, recall is relative to them")
+    full = corpus.shape[1]
+    corpus = truncate(corpus, full)
+
+    exclude: np.ndarray | None = None
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        ollama = OllamaService()
+        await ollama.start()
+        try:
+            queries = np.asarray(await ollama.embed(texts, dim=0), dtype=np.float32)
+        finally:
+            await ollama.close()
+        if queries.shape[1] != full:
+            raise SystemExit(f"query vectors have {queries.shape[1]} dims, collection has {full}")
+    else:
+        rnd = np.random.default_rng(args.seed)
+        exclude = rnd.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+        queries = corpus[exclude]
+    queries = truncate(queries, full)
+
+    truth = top_k(corpus, queries, args.k, exclude)
+    dims = sorted({int(d) for d in args.dims.split(",") if d.strip() and 0 < int(d) < full}) + [full]
+    print(f"user={args.user_id} vectors={len(ids)} full_dim={full} queries={len(queries)} k={args.k}")
+
+    for dim in dims:
+        c, q = truncate(corpus, dim), truncate(queries, dim)
+        lat: list[float] = []
+        found: list[set[int]] = []
+        for qi in range(len(q)):
+            t = time.perf_counter()
+            rows = top_k(c, q[qi : qi + 1], args.k, None if exclude is None else exclude[qi : qi + 1])
+            lat.append(time.perf_counter() - t)
+            found.append(set(rows[0].tolist()))
+        line = (
+            f"dim={dim:<5} recall@{args.k}={recall(found, truth):.3f} "
+            f"exact_p50={percentile(lat, 0.5) * 1000:.2f}ms MB={c.nbytes / 2**20:.1f}"
+        )
+        if args.chroma:
+            hnsw_found, hnsw_lat = await asyncio.to_thread(eval_chroma, chroma, c, q, args.k, exclude)
+            line += f" hnsw_recall@{args.k}={recall(hnsw_found, truth):.3f} hnsw_p50={percentile(hnsw_lat, 0.5) * 1000:.1f}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+"""
+Перевод коллекций Chroma на усечённые (Matryoshka) эмбеддинги без переиндексации.
+
+Векторы каждой коллекции user_* усекаются до --dim компонент и нормируются заново — так же,
+как OllamaService.embed делает это для новых текстов при EMBED_DIM. Данные пишутся
+во временную коллекцию user_<id>__dim<N>, затем она подменяет исходную (удаление + переименование).
+Упавший между этими шагами запуск доводится до конца повторным запуском.
+Записи index_manifest этих пользователей получают новую сигнатуру модели (см. settings.embed_signature),
+чтобы reindex_files.py не счёл файлы устаревшими.
+
+Уменьшить размерность можно сколько угодно раз; вернуть отброшенные компоненты — только
+переиндексацией (reindex_files.py --force с прежним EMBED_DIM).
+
+Порядок: остановить бота, прописать EMBED_DIM в .env, запустить скрипт, запустить бота.
+
+    python scripts/migrate_embed_dim.py --dry-run
+    python scripts/migrate_embed_dim.py                # до settings.embed_dim
+    python scripts/migrate_embed_dim.py --dim 256 --user-id 1
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import or_, select, update
+
+from tg_assistant.config import settings
+from tg_assistant.db.engine import SessionMaker
+from tg_assistant.db.models.files import StoredFile
+from tg_assistant.db.models.index_manifest import IndexManifest
+from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.ollama_service import truncate_embedding
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("migrate_embed_dim")
+
+PAGE = 1000
+
+
+def collection_names(chroma: ChromaService) -> set[str]:
+    return {str(getattr(col, "name", col)) for col in chroma.client.list_collections()}
+
+
+def user_ids(names: set[str]) -> list[int]:
+    out: set[int] = set()
+    for name in names:
+        prefix, _, tail = name.partition("_")
+        tail = tail.split("__dim")[0]  # временная коллекция недоделанного запуска
+        if prefix == "user" and tail.isdigit():
+            out.add(int(tail))
+    return sorted(out)
+
+
+def signature(dim: int) -> str:
+    return f"{settings.ollama_embed_model}@{dim}" if dim else settings.ollama_embed_model
+
+
+def migrate_user(chroma: ChromaService, names: set[str], user_id: int, dim: int, dry_run: bool) -> tuple[str, int, int]:
+    """Возвращает (итог, число векторов, прежняя embed_dim коллекции)."""
+    client = chroma.client
+    name = chroma.collection_name(user_id)
+    tmp_name = f"{name}__dim{dim}"
+
+    if name not in names:
+        if tmp_name not in names:
+            return "missing", 0, 0
+        # прошлый запуск удалил исходную коллекцию, но не успел переименовать новую
+        tmp = client.get_collection(tmp_name)
+        if not dry_run:
+            tmp.modify(name=name)
+            chroma.invalidate_collection(user_id)
+        return "resumed", tmp.count(), int((tmp.metadata or {}).get("embed_dim", 0))
+
+    src = client.get_collection(name)
+    meta = dict(src.metadata or {})
+    current = int(meta.get("embed_dim", 0))
+    n = src.count()
+    if current == dim:
+        return "up_to_date", n, current
+
+    if n:
+        width = len(src.get(limit=1, include=["embeddings"])["embeddings"][0])
+        if dim == 0 or dim > width:
+            raise SystemExit(
+                f"{name}: vectors have {width} dims, cannot migrate to {dim or 'full'} — "
+                f"run reindex_files.py --force instead"
+            )
+    if dry_run:
+        return "would_migrate", n, current
+
+    if tmp_name in names:
+        client.delete_collection(tmp_name)  # остаток прерванного запуска до подмены — строим заново
+    dst = client.create_collection(
+        tmp_name,
+        metadata={**meta, "embed_model": meta.get("embed_model", settings.ollama_embed_model), "embed_dim": dim},
+    )
+    page_size = min(PAGE, chroma.max_batch_size())
+    for offset in range(0, n, page_size):
+        page = src.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        dst.add(
+            ids=page["ids"],
+            embeddings=[truncate_embedding(list(v), dim) for v in page["embeddings"]],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+        )
+    if dst.count() != n:
+        raise SystemExit(f"{tmp_name}: copied {dst.count()} of {n} vectors, {name} left untouched")
+
+    client.delete_collection(name)
+    dst.modify(name=name)
+    chroma.invalidate_collection(user_id)
+    return "migrated", n, current
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=settings.embed_dim, help="целевая размерность (по умолчанию EMBED_DIM)")
+    parser.add_argument("--user-id", type=int, help="только один пользователь")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет сделано")
+    args = parser.parse_args()
+
+    if args.dim != settings.embed_dim:
+        logger.warning("--dim=%s differs from EMBED_DIM=%s: set EMBED_DIM before starting the bot", args.dim, settings.embed_dim)
+
+    chroma = ChromaService()
+    names = await asyncio.to_thread(collection_names, chroma)
+    users = [args.user_id] if args.user_id is not None else user_ids(names)
+
+    t0 = time.perf_counter()
+    total = 0
+    for user_id in users:
+        t = time.perf_counter()
+        result, n, old_dim = await asyncio.to_thread(migrate_user, chroma, names, user_id, args.dim, args.dry_run)
+        logger.info(
+            "user=%s %s vectors=%s dim %s -> %s in %.1fs",
+            user_id, result, n, old_dim or "full", args.dim or "full", time.perf_counter() - t,
+        )
+        if result in ("migrated", "resumed"):
+            total += n
+            async with SessionMaker() as session:
+                await session.execute(
+                    update(IndexManifest)
+                    .where(IndexManifest.file_id.in_(select(StoredFile.id).where(StoredFile.user_id == user_id)))
+                    # та же модель при любой прежней размерности (после resume прежняя неизвестна)
+                    .where(
+                        or_(
+                            IndexManifest.embed_model == settings.ollama_embed_model,
+                            IndexManifest.embed_model.like(f"{settings.ollama_embed_model}@%"),
+                        )
+                    )
+                    .values(embed_model=signature(args.dim))
+                )
+                await session.commit()
+    logger.info("done: users=%s vectors=%s in %.1fs", len(users), total, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,85 +1,122 @@
+"""
+Переиндексация файлов в Chroma.
+
+Обрабатываются только файлы, чья запись в index_manifest устарела (нет записи,
+поменялся sha256, версия экстрактора, параметры чанкера или модель эмбеддингов).
+Манифест пишется после каждого файла, поэтому прерванный запуск продолжится с того же места.
+
+Файлы идут через конвейер extract -> embed -> upsert (services/reindex_pipeline.py),
+у каждой стадии своя параллельность; в конце печатаются docs/sec, chunks/sec и загрузка стадий.
+
+    python scripts/reindex_files.py            # только устаревшие
+    python scripts/reindex_files.py --dry-run  # показать, сколько работы осталось
+    python scripts/reindex_files.py --force    # всё заново
+    python scripts/reindex_files.py --extract-workers 4 --embed-workers 2 --upsert-workers 2
+"""
+import argparse
 import asyncio
 import logging
+import time
+from collections import Counter
 from pathlib import Path
 
 from sqlalchemy import select
 
+from tg_assistant.config import settings
 from tg_assistant.db.engine import SessionMaker
 from tg_assistant.db.models.files import StoredFile
 from tg_assistant.services.ollama_service import OllamaService
-from tg_assistant.services.chroma_service import ChromaService
-from tg_assistant.services.document_parser import (
-    extract_text_from_pdf,
-    extract_text_from_docx,
-    chunk_text,
-)
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.ingestion import IngestionPool
+from tg_assistant.services.index_manifest import load_manifest, stale_reason
+from tg_assistant.services.reindex_pipeline import ReindexPipeline
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("reindex")
 
 
 async def main() -> None:
-    ollama = OllamaService()
-    chroma = ChromaService()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, что будет переиндексировано")
+    parser.add_argument("--force", action="store_true", help="игнорировать манифест")
+    parser.add_argument("--extract-workers", type=int, default=settings.ingest_workers)
+    parser.add_argument("--embed-workers", type=int, default=1)
+    parser.add_argument("--upsert-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=4, help="документов в очереди между стадиями")
+    parser.add_argument("--progress-every", type=float, default=30.0, help="секунд между логами прогресса")
+    args = parser.parse_args()
 
     async with SessionMaker() as session:
         res = await session.execute(select(StoredFile).order_by(StoredFile.id.asc()))
         files = list(res.scalars().all())
+        manifest = await load_manifest(session)
 
-    logger.info("Found %s files to reindex", len(files))
-
+    pending: list[StoredFile] = []
+    reasons: Counter[str] = Counter()
     for f in files:
-        path = Path(f.local_path)
-        if not path.exists():
+        reason = "force" if args.force else stale_reason(manifest.get(f.id), f)
+        if reason is None:
+            continue
+        if not Path(f.local_path).exists():
             logger.warning("Skip file_id=%s, path missing: %s", f.id, f.local_path)
+            reasons["path_missing"] += 1
             continue
+        reasons[reason] += 1
+        pending.append(f)
+
+    pending_bytes = sum(f.size or 0 for f in pending)
+    logger.info(
+        "Files: total=%s up_to_date=%s pending=%s (%.1f MB) reasons=%s",
+        len(files),
+        len(files) - sum(reasons.values()),
+        len(pending),
+        pending_bytes / 1024 / 1024,
+        dict(reasons),
+    )
+    if args.dry_run or not pending:
+        return
 
-        # 1) удалить старые чанки (если были)
-        try:
-            chroma.delete_file_chunks(user_id=f.user_id, file_id=f.id)
-        except Exception:
-            logger.exception("Failed delete old chunks for file_id=%s", f.id)
-
-        # 2) извлечь текст
-        try:
-            if f.mime == "application/pdf":
-                text = extract_text_from_pdf(path)
-            else:
-                text = extract_text_from_docx(path)
-        except Exception:
-            logger.exception("Failed extract text for file_id=%s", f.id)
-            continue
+    ollama = OllamaService()
+    chroma = AsyncChromaService()
+    ingestion = IngestionPool(max_workers=args.extract_workers)
+    ingestion.start()
+
+    pipeline = ReindexPipeline(
+        ollama,
+        chroma,
+        ingestion,
+        extract_workers=args.extract_workers,
+        embed_workers=args.embed_workers,
+        upsert_workers=args.upsert_workers,
+        queue_size=args.queue_size,
+    )
+
+    async def report_progress() -> None:
+        t0 = time.perf_counter()
+        while True:
+            await asyncio.sleep(args.progress_every)
+            p = pipeline.progress()
+            elapsed = time.perf_counter() - t0
+            logger.info(
+                "Progress: docs=%s/%s chunks=%s docs/sec=%.2f",
+                p["docs"], len(pending), p["chunks"], p["docs"] / elapsed,
+            )
 
-        chunks = chunk_text(text)
-        if not chunks:
-            logger.warning("No text extracted for file_id=%s (%s)", f.id, f.orig_name)
-            continue
+    reporter = asyncio.create_task(report_progress())
+    try:
+        report = await pipeline.run(pending)
+    finally:
+        reporter.cancel()
 
-        # 3) embeddings батчем
-        try:
-            embs = await ollama.embed(chunks)
-        except Exception:
-            logger.exception("Failed embeddings for file_id=%s", f.id)
-            continue
+    for line in report.as_lines():
+        logger.info(line)
 
-        # 4) upsert
-        for i, (chunk, emb) in enumerate(zip(chunks, embs)):
-            chroma.upsert_embedding(
-                user_id=f.user_id,
-                doc_id=f"file_{f.id}_chunk_{i}",
-                embedding=emb,
-                document=chunk,
-                metadata={
-                    "user_id": f.user_id,
-                    "entity_type": "file",
-                    "entity_id": f.id,
-                    "chunk": i,
-                    "filename": f.orig_name,
-                    "mime": f.mime,
-                },
-            )
+    if ollama.embed_cache is not None:
+        logger.info("Embedding cache: %s", ollama.embed_cache.stats())
 
-        logger.info("Reindexed file_id=%s chunks=%s name=%s", f.id, len(chunks), f.orig_name)
+    ingestion.shutdown()
+    chroma.close()
+    await ollama.close()
 
 
 if __name__ == "__main__":
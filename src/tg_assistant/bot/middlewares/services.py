@@ -4,7 +4,12 @@ from aiogram.dispatcher.middlewares.base import BaseMiddleware
 from aiogram.types import TelegramObject
 
 from tg_assistant.services.ollama_service import OllamaService
-from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.ingestion import IngestionPool
+from tg_assistant.services.index_queue import IndexQueue
+from tg_assistant.services.intent_router import IntentRouter
+from tg_assistant.services.rerank_service import RerankService
+from tg_assistant.services.answer_cache import AnswerCache
 from tg_assistant.services.speech_to_text import SpeechToTextService
 
 
@@ -12,12 +17,22 @@ class ServicesMiddleware(BaseMiddleware):
     def __init__(
         self,
         ollama: OllamaService,
-        chroma: ChromaService | None,
+        chroma: AsyncChromaService | None,
         speech_to_text: SpeechToTextService | None,
+        ingestion: IngestionPool,
+        index_queue: IndexQueue | None,
+        intent_router: IntentRouter | None = None,
+        reranker: RerankService | None = None,
+        answer_cache: AnswerCache | None = None,
     ):
         self.ollama = ollama
         self.chroma = chroma
         self.speech_to_text = speech_to_text
+        self.ingestion = ingestion
+        self.index_queue = index_queue
+        self.intent_router = intent_router
+        self.reranker = reranker
+        self.answer_cache = answer_cache
 
     async def __call__(
         self,
@@ -28,4 +43,9 @@ class ServicesMiddleware(BaseMiddleware):
         data["ollama"] = self.ollama
         data["chroma"] = self.chroma  # может быть None
         data["speech_to_text"] = self.speech_to_text
+        data["ingestion"] = self.ingestion
+        data["index_queue"] = self.index_queue  # None, если Chroma недоступна
+        data["intent_router"] = self.intent_router  # None — всегда классифицирует LLM
+        data["reranker"] = self.reranker  # общий на процесс: кэш и лимит параллельности
+        data["answer_cache"] = self.answer_cache  # None — без Chroma или выключен в настройках
         return await handler(event, data)
@@ -3,20 +3,26 @@ from __future__ import annotations
 import asyncio
 import logging
 from pathlib import Path
+import re
 import shutil
+import time
 from typing import Any
 
 from aiogram import Router, F
 from aiogram.types import Message, FSInputFile
 from sqlalchemy import select
 
+from tg_assistant.bot.streaming import send_long_text, stream_to_message
 from tg_assistant.services.rerank_service import RerankService
+from tg_assistant.services.answer_cache import AnswerCache
 from tg_assistant.db.models.files import StoredFile
 from tg_assistant.db.models.user import User
 from tg_assistant.db.models.link import Link
 from tg_assistant.config import settings
 from tg_assistant.services.ollama_service import OllamaService
-from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.intent_router import IntentRouter, classify_with_llm
+from tg_assistant.services.lexical_index import clear_winner, rrf_fuse
 from tg_assistant.services.speech_to_text import SpeechToTextService
 
 logger = logging.getLogger(__name__)
@@ -26,6 +32,12 @@ FILE_DISTANCE_THRESHOLD = 0.90
 LINK_DISTANCE_THRESHOLD = 0.90
 AMBIGUOUS_DELTA = 0.05
 
+QUERY_N_RESULTS = 60
+# спекулятивный поиск идёт без фильтра по типу — берём с запасом, чтобы после фильтра хватило
+SPECULATIVE_N_RESULTS = 120
+# переписанный запрос с таким сходством слов считаем тем же и не эмбеддим заново
+REWRITE_SAME_JACCARD = 0.8
+
 def pick_best_links(hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
     link_hits = [h for h in hits if (h.get("metadata") or {}).get("entity_type") == "link"]
     best_by_link: dict[int, dict[str, Any]] = {}
@@ -39,6 +51,59 @@ def pick_best_links(hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
             best_by_link[link_id] = h
     return sorted(best_by_link.values(), key=lambda x: x["distance"])
 
+def _query_tokens(q: str) -> set[str]:
+    return set(re.findall(r"\w+", q.lower()))
+
+
+def query_rewrite_differs(original: str, rewritten: str) -> bool:
+    a, b = _query_tokens(original), _query_tokens(rewritten)
+    if not a or not b:
+        return a != b
+    return len(a & b) / len(a | b) < REWRITE_SAME_JACCARD
+
+
+def filter_hits(hits: list[dict[str, Any]], where: dict | None) -> list[dict[str, Any]]:
+    if not where:
+        return hits
+    return [h for h in hits if (h.get("metadata") or {}).get("entity_type") == where["entity_type"]]
+
+
+def best_per_entity(hits: list[dict[str, Any]], entity_type: str) -> list[dict[str, Any]]:
+    """Лучший хит на сущность, сохраняя порядок входа (для BM25-хитов без distance)."""
+    seen: set[int] = set()
+    out: list[dict[str, Any]] = []
+    for h in hits:
+        meta = h.get("metadata") or {}
+        if meta.get("entity_type") != entity_type:
+            continue
+        try:
+            entity_id = int(meta["entity_id"])
+        except Exception:
+            continue
+        if entity_id not in seen:
+            seen.add(entity_id)
+            out.append(h)
+    return out
+
+
+def entity_key(h: dict[str, Any]) -> int:
+    return int(h["metadata"]["entity_id"])
+
+
+def hit_key(h: dict[str, Any]) -> str:
+    return h["id"]
+
+
+def rerank_confident(h: dict[str, Any]) -> bool:
+    """Pointwise-reranker уверен в кандидате (у oneshot оценок нет)."""
+    return h.get("rerank_score", 0.0) >= settings.rerank_min_score
+
+
+def fmt_distance(h: dict[str, Any]) -> str:
+    d = h.get("distance")
+    return f"dist={float(d):.3f}" if d is not None else "по тексту"
+
+
 def build_context(items: list[dict[str, Any]], max_chars: int = 1200) -> str:
     parts: list[str] = []
     total = 0
@@ -80,199 +145,337 @@ def pick_best_files(hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
 
     return sorted(best_by_file.values(), key=lambda x: x["distance"])
 
+
+def _drop_tasks(*tasks: asyncio.Task | None) -> None:
+    """Отменяет незавершённые задачи; у упавших забирает исключение, чтобы asyncio не писал «never retrieved»."""
+    for task in tasks:
+        if task is None:
+            continue
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
+
 async def handle_text_query(
     message: Message,
     session,
     current_user: User,
     ollama: OllamaService,
-    chroma: ChromaService | None,
+    chroma: AsyncChromaService | None,
     text: str,
     status_message: Message | None = None,
+    intent_router: IntentRouter | None = None,
+    reranker: RerankService | None = None,
+    answer_cache: AnswerCache | None = None,
 ) -> None:
     text = text.strip()
     if not text:
         return
     status = status_message or await message.answer("Определяю тип запроса")
 
-    intent_data = await ollama.classify_intent(text)
-    intent = (intent_data or {}).get("intent", "qa")
-    search_query = (intent_data or {}).get("query") or text
+    timings: dict[str, float] = {}
+
+    async def timed(stage: str, coro):
+        t = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t
+
+    async def search(q_emb: list[float], where: dict | None, n_results: int) -> list[dict[str, Any]]:
+        assert chroma is not None
+        return await chroma.query_by_embedding(
+            current_user.id, q_emb, n_results, where, include_documents=not settings.chroma_two_phase_query
+        )
+
+    async def embed_one(query: str) -> list[float]:
+        return (await timed("embed", ollama.embed([query])))[0]
 
-    status = await status.edit_text("Обрабатываю запрос, это может занять до 1–2 минут...")
+    async def embed_and_search(query: str, where: dict | None, n_results: int):
+        q_emb = await embed_one(query)
+        return q_emb, await timed("query", search(q_emb, where, n_results))
 
+    # Спекулятивно: пока определяется интент, эмбеддим исходный текст и ищем без фильтра.
+    # Тот же вектор нужен роутеру интентов для сравнения с центроидами.
+    t0 = time.perf_counter()
+    text_emb: asyncio.Task | None = None
+    speculative: asyncio.Task | None = None
+    lexical_task: asyncio.Task | None = None
     try:
-        if chroma is None:
-            await status.edit_text("Думаю...")
-            reply = await ollama.chat([{"role": "user", "content": text}])
-            await status.edit_text(reply)
-            return
-
-        reranker = RerankService(ollama)
-
-        async def run_retrieval(where: dict | None) -> list[dict[str, Any]]:
-            q_emb = (await ollama.embed([search_query]))[0]
-            return chroma.query_by_embedding(current_user.id, q_emb, n_results=60, where=where)
-
-        # 1) intent-based retrieval
-        where: dict | None = None
-        if intent == "file":
-            where = {"entity_type": "file"}
-        elif intent == "link":
-            where = {"entity_type": "link"}
-
-        raw_hits = await run_retrieval(where)
-
-        # Если intent=file/link и ничего не нашли — пробуем fallback на общий поиск (qa)
-        if not raw_hits and intent in {"file", "link"}:
-            raw_hits = await run_retrieval(where=None)
-            intent = "qa"
-
-        # Если вообще ничего не нашли
-        if not raw_hits:
-            await status.edit_text("Ничего не нашлось, отвечаю без контекста...")
-            reply = await ollama.chat([{"role": "user", "content": text}])
-            await status.edit_text(reply)
-            return
-
-        # 2) FILE branch
-        if intent == "file":
-            candidates = pick_best_files(raw_hits)
-            if not candidates:
-                await status.edit_text("Похожих документов не нашлось. Попробуй уточнить или посмотри /files")
+        if chroma is not None or intent_router is not None:
+            text_emb = asyncio.create_task(embed_one(text))
+        if chroma is not None:
+            assert text_emb is not None
+
+            async def speculative_search():
+                q_emb = await text_emb
+                return q_emb, await timed("query", search(q_emb, None, SPECULATIVE_N_RESULTS))
+
+            speculative = asyncio.create_task(speculative_search())
+
+        if intent_router is not None:
+            decision = await timed("intent", intent_router.route(text, embedding=text_emb))
+        else:
+            decision = await timed("intent", classify_with_llm(ollama, text))
+        intent = decision.intent
+        search_query = decision.query
+
+        status = await status.edit_text("Обрабатываю запрос, это может занять до 1–2 минут...")
+
+        try:
+            if chroma is None:
+                await status.edit_text("Думаю...")
+                await stream_to_message(status, ollama.chat_stream([{"role": "user", "content": text}]))
                 return
 
-            if len(candidates) >= 2:
-                d0 = float(candidates[0].get("distance") or 999.0)
-                d1 = float(candidates[1].get("distance") or 999.0)
-                if d0 <= FILE_DISTANCE_THRESHOLD and (d1 - d0) >= AMBIGUOUS_DELTA:
-                    reranked_files = candidates[:1]
-                else:
-                    await status.edit_text("Нашёл кандидатов, уточняю релевантность (rerank)...")
-                    reranked_files = await reranker.rerank_hits_oneshot(
-                        search_query,
-                        candidates[:8],
-                        max_items=min(8, len(candidates)),
-                        timeout_s=240,
+            if reranker is None:
+                reranker = RerankService(ollama)
+
+            # 1) intent-based retrieval
+            where: dict | None = None
+            if intent == "file":
+                where = {"entity_type": "file"}
+            elif intent == "link":
+                where = {"entity_type": "link"}
+
+            # лексический поиск (BM25) идёт параллельно с векторным
+            if chroma.lexical is not None:
+                lexical_task = asyncio.create_task(
+                    timed(
+                        "lexical",
+                        chroma.lexical.search_async(
+                            current_user.id, search_query, QUERY_N_RESULTS, where["entity_type"] if where else None
+                        ),
                     )
+                )
+
+            spec: tuple[list[float], list[dict[str, Any]]] | None = None
+            try:
+                assert speculative is not None
+                spec = await speculative
+            except Exception:
+                logger.warning("speculative retrieval failed, falling back to sequential", exc_info=True)
+            # выигрыш: классификация и поиск шли параллельно, а не друг за другом
+            saved = timings["intent"] + timings.get("embed", 0.0) + timings.get("query", 0.0) - (time.perf_counter() - t0)
+
+            reused = spec is not None and not query_rewrite_differs(text, search_query)
+            if reused:
+                assert spec is not None
+                q_emb, spec_hits = spec
+                raw_hits = filter_hits(spec_hits, where)[:QUERY_N_RESULTS]
+                if not raw_hits and where is not None:
+                    # в общем топе нет нужного типа — ищем с фильтром тем же вектором, без эмбеддинга
+                    raw_hits = await timed("query", search(q_emb, where, QUERY_N_RESULTS))
             else:
-                reranked_files = candidates[:1]
-
-            best = reranked_files[0]
-            best_meta = best["metadata"]
-            best_file_id = int(best_meta["entity_id"])
-            best_distance = float(best.get("distance") or 999.0)
-
-            if best_distance > FILE_DISTANCE_THRESHOLD:
-                lines = ["Нашёл что-то похожее, но не уверен достаточно. Выбери файл вручную:"]
-                for c in candidates[:3]:
-                    m = c["metadata"]
-                    lines.append(
-                        f"#{m['entity_id']} — {m.get('filename', 'без имени')} "
-                        f"(dist={float(c.get('distance') or 0.0):.3f})"
-                    )
-                lines.append("Можно отправить так: /file ID")
-                await status.edit_text("\n".join(lines))
-                return
+                q_emb, raw_hits = await embed_and_search(search_query, where, QUERY_N_RESULTS)
+
+            lex_hits: list[dict[str, Any]] = await lexical_task if lexical_task is not None else []
 
-            stmt = select(StoredFile).where(
-                StoredFile.id == best_file_id,
-                StoredFile.user_id == current_user.id,
+            # Если intent=file/link и ничего не нашли — пробуем fallback на общий поиск (qa)
+            if not raw_hits and not lex_hits and intent in {"file", "link"}:
+                if reused:
+                    assert spec is not None
+                    raw_hits = spec[1][:QUERY_N_RESULTS]
+                else:
+                    raw_hits = await timed("query", search(q_emb, None, QUERY_N_RESULTS))
+                if chroma.lexical is not None:
+                    lex_hits = await timed("lexical", chroma.lexical.search_async(current_user.id, search_query))
+                intent = "qa"
+
+            logger.info(
+                "retrieval user=%s intent=%s tier=%s reused=%s vector=%s lexical=%s "
+                "intent=%.0fms embed=%.0fms query=%.0fms lexical=%.0fms total=%.0fms saved=%.0fms",
+                current_user.id,
+                intent,
+                decision.tier,
+                reused,
+                len(raw_hits),
+                len(lex_hits),
+                timings["intent"] * 1000,
+                timings.get("embed", 0.0) * 1000,
+                timings.get("query", 0.0) * 1000,
+                timings.get("lexical", 0.0) * 1000,
+                (time.perf_counter() - t0) * 1000,
+                max(saved, 0.0) * 1000 if reused else 0.0,
             )
-            res = await session.execute(stmt)
-            stored = res.scalar_one_or_none()
-            if stored is None:
-                await status.edit_text("Нашёл индекс файла, но записи файла в БД нет.")
+
+            # Если вообще ничего не нашли
+            if not raw_hits and not lex_hits:
+                await status.edit_text("Ничего не нашлось, отвечаю без контекста...")
+                await stream_to_message(status, ollama.chat_stream([{"role": "user", "content": text}]))
                 return
 
-            await status.edit_text("Готово, отправляю файл...")
-            await message.answer_document(
-                FSInputFile(stored.local_path, filename=stored.orig_name),
-                caption=stored.orig_name,
-            )
-            await status.delete()
-            return
-
-        # 3) LINK branch
-        if intent == "link":
-            candidates = pick_best_links(raw_hits)
-            if not candidates:
-                await status.edit_text("Похожих ссылок не нашлось. Попробуй уточнить или посмотри /links")
+            # 2) FILE branch
+            if intent == "file":
+                ranked = [pick_best_files(raw_hits), best_per_entity(lex_hits, "file")]
+                candidates = rrf_fuse(ranked, key=entity_key)
+                if not candidates:
+                    await status.edit_text("Похожих документов не нашлось. Попробуй уточнить или посмотри /files")
+                    return
+
+                # вектор и BM25 согласны насчёт лучшего файла и он достаточно близко — LLM-rerank не нужен;
+                # без порога по distance BM25 «соглашается» и из-за одного случайного общего слова
+                d0 = float(candidates[0].get("distance") or 999.0)
+                if d0 <= FILE_DISTANCE_THRESHOLD and clear_winner(ranked, key=entity_key):
+                    logger.info("rerank skipped: fused clear winner file_id=%s", entity_key(candidates[0]))
+                    reranked_files = candidates[:1]
+                elif len(candidates) >= 2:
+                    d1 = float(candidates[1].get("distance") or 999.0)
+                    if d0 <= FILE_DISTANCE_THRESHOLD and (d1 - d0) >= AMBIGUOUS_DELTA:
+                        reranked_files = candidates[:1]
+                    else:
+                        await status.edit_text("Нашёл кандидатов, уточняю релевантность (rerank)...")
+                        reranked_files = await reranker.rerank_hits(
+                            search_query,
+                            await chroma.fill_documents(current_user.id, candidates[:8]),
+                            max_items=min(8, len(candidates)),
+                            timeout_s=240,
+                        )
+                else:
+                    reranked_files = candidates[:1]
+
+                best = reranked_files[0]
+                best_meta = best["metadata"]
+                best_file_id = int(best_meta["entity_id"])
+                best_distance = float(best.get("distance") or 999.0)
+
+                if best_distance > FILE_DISTANCE_THRESHOLD and not rerank_confident(best):
+                    lines = ["Нашёл что-то похожее, но не уверен достаточно. Выбери файл вручную:"]
+                    for c in candidates[:3]:
+                        m = c["metadata"]
+                        lines.append(f"#{m['entity_id']} — {m.get('filename', 'без имени')} ({fmt_distance(c)})")
+                    lines.append("Можно отправить так: /file ID")
+                    await status.edit_text("\n".join(lines))
+                    return
+
+                stmt = select(StoredFile).where(
+                    StoredFile.id == best_file_id,
+                    StoredFile.user_id == current_user.id,
+                )
+                res = await session.execute(stmt)
+                stored = res.scalar_one_or_none()
+                if stored is None:
+                    await status.edit_text("Нашёл индекс файла, но записи файла в БД нет.")
+                    return
+
+                await status.edit_text("Готово, отправляю файл...")
+                await message.answer_document(
+                    FSInputFile(stored.local_path, filename=stored.orig_name),
+                    caption=stored.orig_name,
+                )
+                await status.delete()
                 return
 
-            if len(candidates) >= 2:
+            # 3) LINK branch
+            if intent == "link":
+                ranked = [pick_best_links(raw_hits), best_per_entity(lex_hits, "link")]
+                candidates = rrf_fuse(ranked, key=entity_key)
+                if not candidates:
+                    await status.edit_text("Похожих ссылок не нашлось. Попробуй уточнить или посмотри /links")
+                    return
+
                 d0 = float(candidates[0].get("distance") or 999.0)
-                d1 = float(candidates[1].get("distance") or 999.0)
-                if d0 <= LINK_DISTANCE_THRESHOLD and (d1 - d0) >= AMBIGUOUS_DELTA:
+                if d0 <= LINK_DISTANCE_THRESHOLD and clear_winner(ranked, key=entity_key):
+                    logger.info("rerank skipped: fused clear winner link_id=%s", entity_key(candidates[0]))
                     reranked_links = candidates[:1]
+                elif len(candidates) >= 2:
+                    d1 = float(candidates[1].get("distance") or 999.0)
+                    if d0 <= LINK_DISTANCE_THRESHOLD and (d1 - d0) >= AMBIGUOUS_DELTA:
+                        reranked_links = candidates[:1]
+                    else:
+                        await status.edit_text("Нашёл кандидатов, уточняю релевантность (rerank)...")
+                        reranked_links = await reranker.rerank_hits(
+                            search_query,
+                            await chroma.fill_documents(current_user.id, candidates[:8]),
+                            max_items=min(8, len(candidates)),
+                            timeout_s=240,
+                        )
                 else:
-                    await status.edit_text("Нашёл кандидатов, уточняю релевантность (rerank)...")
-                    reranked_links = await reranker.rerank_hits_oneshot(
-                        search_query,
-                        candidates[:8],
-                        max_items=min(8, len(candidates)),
-                        timeout_s=240,
-                    )
-            else:
-                reranked_links = candidates[:1]
-
-            best = reranked_links[0]
-            link_id = int(best["metadata"]["entity_id"])
-            best_distance = float(best.get("distance") or 999.0)
-
-            if best_distance > LINK_DISTANCE_THRESHOLD:
-                lines = ["Нашёл несколько похожих ссылок, но не уверен. Выбери вручную:"]
-                for c in candidates[:3]:
-                    m = c["metadata"]
-                    title = m.get("title") or m.get("url") or "без названия"
-                    lines.append(
-                        f"#{m['entity_id']} — {title} "
-                        f"(dist={float(c.get('distance') or 0.0):.3f})"
-                    )
-                lines.append("Можно отправить так: /link ID")
-                await status.edit_text("\n".join(lines))
-                return
+                    reranked_links = candidates[:1]
 
-            stmt = select(Link).where(Link.id == link_id, Link.user_id == current_user.id)
-            res = await session.execute(stmt)
-            link = res.scalar_one_or_none()
-            if not link:
-                await status.edit_text("Нашёл ссылку в индексе, но записи в БД нет.")
+                best = reranked_links[0]
+                link_id = int(best["metadata"]["entity_id"])
+                best_distance = float(best.get("distance") or 999.0)
+
+                if best_distance > LINK_DISTANCE_THRESHOLD and not rerank_confident(best):
+                    lines = ["Нашёл несколько похожих ссылок, но не уверен. Выбери вручную:"]
+                    for c in candidates[:3]:
+                        m = c["metadata"]
+                        title = m.get("title") or m.get("url") or "без названия"
+                        lines.append(f"#{m['entity_id']} — {title} ({fmt_distance(c)})")
+                    lines.append("Можно отправить так: /link ID")
+                    await status.edit_text("\n".join(lines))
+                    return
+
+                stmt = select(Link).where(Link.id == link_id, Link.user_id == current_user.id)
+                res = await session.execute(stmt)
+                link = res.scalar_one_or_none()
+                if not link:
+                    await status.edit_text("Нашёл ссылку в индексе, но записи в БД нет.")
+                    return
+
+                await status.edit_text("Готово, отправляю ссылку...")
+                await message.answer(f"{link.url}")
+                await status.delete()
                 return
 
-            await status.edit_text("Готово, отправляю ссылку...")
-            await message.answer(f"{link.url}")
-            await status.delete()
-            return
-
-        # 4) QA branch
-        short_hits = raw_hits[:12]
-        await status.edit_text("Подбираю контекст (rerank)...")
-        reranked_hits = await reranker.rerank_hits_oneshot(
-            search_query,
-            short_hits,
-            max_items=min(6, len(short_hits)),
-            timeout_s=240,
-        )
-
-        context = build_context(reranked_hits)
-        prompt = (
-            "Ты личный ассистент.\n"
-            "Ответь на вопрос пользователя, опираясь на КОНТЕКСТ ниже.\n"
-            "Если в контексте нет ответа — скажи, что данных не найдено, и уточни, что нужно.\n\n"
-            f"КОНТЕКСТ:\n{context}\n\n"
-            f"ВОПРОС:\n{search_query}"
-        )
+            # 4) QA branch
+            ranked = [raw_hits, lex_hits]
+            short_hits = rrf_fuse(ranked, key=hit_key)[:12]
+
+            question_emb: list[float] | None = None
+            if answer_cache is not None and text_emb is not None:
+                question_emb = await text_emb
+                cached = answer_cache.get(current_user.id, question_emb, [h["id"] for h in short_hits])
+                if cached is not None:
+                    # в кэше весь ответ — он мог стримиться в несколько сообщений
+                    await send_long_text(status, cached)
+                    return
+
+            # вторая фаза поиска: тексты нужны только тем чанкам, что пойдут в rerank и контекст
+            short_hits = await chroma.fill_documents(current_user.id, short_hits[:6])
+
+            if clear_winner(ranked, key=hit_key):
+                logger.info("rerank skipped: fused clear winner chunk=%s", short_hits[0]["id"])
+                reranked_hits = short_hits
+            else:
+                await status.edit_text("Подбираю контекст (rerank)...")
+                reranked_hits = await reranker.rerank_hits(
+                    search_query,
+                    short_hits,
+                    max_items=min(6, len(short_hits)),
+                    timeout_s=240,
+                )
+                # pointwise-оценки калиброваны: явно нерелевантные чанки в контекст не берём
+                relevant = [h for h in reranked_hits if h.get("rerank_score", 1.0) >= settings.rerank_min_score]
+                reranked_hits = relevant or reranked_hits[:1]
+
+            context = build_context(reranked_hits)
+            prompt = (
+                "Ты личный ассистент.\n"
+                "Ответь на вопрос пользователя, опираясь на КОНТЕКСТ ниже.\n"
+                "Если в контексте нет ответа — скажи, что данных не найдено, и уточни, что нужно.\n\n"
+                f"КОНТЕКСТ:\n{context}\n\n"
+                f"ВОПРОС:\n{search_query}"
+            )
 
-        await status.edit_text("Формирую ответ...")
-        reply = await ollama.chat([{"role": "user", "content": prompt}], timeout_s=240)
-        await status.edit_text(reply)
+            await status.edit_text("Формирую ответ...")
+            reply = await stream_to_message(
+                status, ollama.chat_stream([{"role": "user", "content": prompt}], timeout_s=240)
+            )
+            if answer_cache is not None and question_emb is not None and reply:
+                answer_cache.put(current_user.id, text, question_emb, [h["id"] for h in reranked_hits], reply)
 
-    except Exception:
-        logger.exception("chat_handler failed")
-        try:
-            await status.edit_text("Ошибка при обработке запроса. Посмотри логи бота.")
         except Exception:
-            pass
+            logger.exception("chat_handler failed")
+            try:
+                await status.edit_text("Ошибка при обработке запроса. Посмотри логи бота.")
+            except Exception:
+                pass
+    finally:
+        # на любом выходе (в т.ч. при ошибке до основного блока) фоновые задачи не должны висеть
+        _drop_tasks(text_emb, speculative, lexical_task)
 
 
 async def convert_voice_to_wav(source_path: Path, target_path: Path) -> None:
@@ -303,8 +506,11 @@ async def voice_handler(
     session,
     current_user: User,
     ollama: OllamaService,
-    chroma: ChromaService | None,
+    chroma: AsyncChromaService | None,
     speech_to_text: SpeechToTextService | None,
+    intent_router: IntentRouter | None = None,
+    reranker: RerankService | None = None,
+    answer_cache: AnswerCache | None = None,
 ) -> None:
     import shutil
 
@@ -368,6 +574,9 @@ async def voice_handler(
         chroma=chroma,
         text=transcript,
         status_message=status,
+        intent_router=intent_router,
+        reranker=reranker,
+        answer_cache=answer_cache,
     )
 
 
@@ -377,7 +586,10 @@ async def chat_handler(
     session,
     current_user: User,
     ollama: OllamaService,
-    chroma: ChromaService | None,
+    chroma: AsyncChromaService | None,
+    intent_router: IntentRouter | None = None,
+    reranker: RerankService | None = None,
+    answer_cache: AnswerCache | None = None,
 ) -> None:
     await handle_text_query(
         message=message,
@@ -386,4 +598,7 @@ async def chat_handler(
         ollama=ollama,
         chroma=chroma,
         text=(message.text or ""),
+        intent_router=intent_router,
+        reranker=reranker,
+        answer_cache=answer_cache,
     )
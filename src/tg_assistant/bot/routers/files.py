@@ -1,7 +1,6 @@
 from __future__ import annotations
 import logging
 
-import hashlib
 from pathlib import Path
 
 from aiogram import Router
@@ -14,13 +13,8 @@ import re
 from tg_assistant.config import settings
 from tg_assistant.db.models.files import StoredFile
 from tg_assistant.db.models.user import User
-from tg_assistant.services.ollama_service import OllamaService
-from tg_assistant.services.chroma_service import ChromaService
-from tg_assistant.services.document_parser import (
-    extract_text_from_pdf,
-    extract_text_from_docx,
-    chunk_text,
-)
+from tg_assistant.services.downloads import download_file_hashed
+from tg_assistant.services.index_queue import IndexQueue, enqueue_index_job
 
 router = Router()
 
@@ -30,13 +24,6 @@ def sanitize_filename(name: str) -> str:
     name = name[:200].rstrip()
     return name or "document"
 
-def sha256_file(path: Path) -> str:
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
 logger = logging.getLogger(__name__)
 
 @router.message(lambda m: m.document is not None)
@@ -45,8 +32,7 @@ async def on_document(
     bot,
     session,
     current_user: User,
-    ollama: OllamaService,
-    chroma: ChromaService | None,
+    index_queue: IndexQueue | None,
 ) -> None:
     doc = message.document
     if not doc:
@@ -70,17 +56,7 @@ async def on_document(
     orig_name = sanitize_filename(doc.file_name or f"document_{doc.file_id}")
     tmp_path = base_dir / f"tmp_{doc.file_id}"
 
-    # 1) download to tmp
-    file = await bot.get_file(doc.file_id)
-    await bot.download_file(file.file_path, destination=tmp_path)
-
-    # 2) compute sha
-    digest = sha256_file(tmp_path)
-
-    # 3) final path based on sha
-    final_path = base_dir / f"file_{digest[:8]}_{orig_name}"
-
-    # 4) дедуп по tg_file_unique_id (если есть)
+    # 1) дедуп по tg_file_unique_id (если есть) — до скачивания, повторную отправку не качаем
     tg_unique = doc.file_unique_id
     if tg_unique:
         stmt = select(StoredFile).where(
@@ -90,11 +66,21 @@ async def on_document(
         res = await session.execute(stmt)
         existing = res.scalar_one_or_none()
         if existing:
-            tmp_path.unlink(missing_ok=True)
             await message.answer(f"Этот файл уже загружен как #{existing.id} — {existing.orig_name}")
             return
 
-    # 5) дедуп по sha256
+    # 2) download to tmp + sha256 за один проход
+    file = await bot.get_file(doc.file_id)
+    try:
+        digest, _ = await download_file_hashed(bot, file.file_path, tmp_path)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    # 3) final path based on sha
+    final_path = base_dir / f"file_{digest[:8]}_{orig_name}"
+
+    # 4) дедуп по sha256
     stmt = select(StoredFile).where(
         StoredFile.user_id == current_user.id,
         StoredFile.sha256 == digest,
@@ -127,7 +113,10 @@ async def on_document(
 
     await session.refresh(stored)
 
-    # 6) переименовываем tmp -> final (и только тут)
+    # строка в БД есть — сразу отвечаем, индексация пойдёт в фоне
+    status = await message.answer(f"✅ Файл сохранён: #{stored.id} ({orig_name})\n⏳ Индексация в очереди...")
+
+    # 5) переименовываем tmp -> final (и только тут)
     try:
         if final_path.exists():
             # на всякий случай: если уже есть файл с таким именем (например, гонки)
@@ -136,51 +125,13 @@ async def on_document(
             tmp_path.rename(final_path)
     except Exception:
         logger.exception("Failed to move tmp file to final_path for file_id=%s", stored.id)
-        await message.answer(f"✅ Файл сохранён: #{stored.id} ({orig_name})\n⚠️ Не удалось переместить файл в финальный путь.")
+        await status.edit_text(f"✅ Файл сохранён: #{stored.id} ({orig_name})\n⚠️ Не удалось переместить файл в финальный путь.")
         return
 
-    # 7) индексация
-    if chroma is not None:
-        try:
-            path = Path(stored.local_path)
-            if stored.mime == "application/pdf":
-                text = extract_text_from_pdf(path)
-            else:
-                text = extract_text_from_docx(path)
-
-            chunks = chunk_text(text)
-            if not chunks:
-                await message.answer(
-                    f"✅ Файл сохранён: #{stored.id} ({orig_name})\n"
-                    f"⚠️ Не удалось извлечь текст для индексации."
-                )
-                return
-
-            embeddings = await ollama.embed(chunks)
-
-            for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-                chroma.upsert_embedding(
-                    user_id=current_user.id,
-                    doc_id=f"file_{stored.id}_chunk_{i}",
-                    embedding=emb,
-                    document=chunk,
-                    metadata={
-                        "entity_type": "file",
-                        "entity_id": stored.id,
-                        "chunk": i,
-                        "filename": stored.orig_name,
-                        "mime": stored.mime,
-                        "user_id": current_user.id,
-                    },
-                )
-
-            await message.answer(f"✅ Файл сохранён и проиндексирован: #{stored.id} ({orig_name})")
-        except Exception:
-            logger.exception("Indexing failed for file_id=%s", stored.id)
-            await message.answer(f"✅ Файл сохранён: #{stored.id} ({orig_name})\n⚠️ Индексация не удалась (см. логи).")
-            return
-    else:
-        await message.answer(f"✅ Файл сохранён: #{stored.id} ({orig_name})")
+    # 6) индексация: задача в index_jobs, прогресс воркер пишет в status
+    await enqueue_index_job(session, stored, chat_id=status.chat.id, status_message_id=status.message_id)
+    if index_queue is not None:
+        index_queue.notify()
 
 @router.message(Command("files"))
 async def list_files(message: Message, session, current_user: User) -> None:
@@ -10,7 +10,8 @@ from tg_assistant.config import settings
 
 from tg_assistant.db.models.user import User
 from tg_assistant.services.ollama_service import OllamaService
-from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.ollama_scheduler import NORMAL
 from tg_assistant.services.link_fetcher import extract_urls, fetch_url_text,html_to_text,fetch_url_html
 from tg_assistant.services.links import create_link, list_links, get_link
 
@@ -18,7 +19,7 @@ logger = logging.getLogger(__name__)
 router = Router()
 
 @router.message(F.text.regexp(r"https?://"))
-async def on_link_message(message: Message, session, current_user: User, ollama: OllamaService, chroma: ChromaService | None):
+async def on_link_message(message: Message, session, current_user: User, ollama: OllamaService, chroma: AsyncChromaService | None):
     text = message.text or ""
     urls = extract_urls(text)
     if not urls:
@@ -54,8 +55,8 @@ async def on_link_message(message: Message, session, current_user: User, ollama:
         if chroma is not None:
             try:
                 doc = f"{title}\nURL: {url}\n\n{page_text}"
-                emb = (await ollama.embed([doc]))[0]
-                chroma.upsert_embedding(
+                emb = (await ollama.embed([doc], priority=NORMAL))[0]
+                await chroma.upsert_embedding(
                     user_id=current_user.id,
                     doc_id=f"link_{link.id}",
                     embedding=emb,
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_TEXT_LIMIT = 4096
+# Telegram ограничивает частоту правок сообщения — куски ответа копим и правим не чаще раза в интервал
+STREAM_EDIT_INTERVAL_S = 1.5
+CURSOR = " ▍"
+
+
+def split_point(text: str, limit: int = TELEGRAM_TEXT_LIMIT) -> int:
+    """Где резать длинный текст: по абзацу, строке или пробелу во второй половине лимита."""
+    if len(text) <= limit:
+        return len(text)
+    for sep in ("\n\n", "\n", " "):
+        i = text.rfind(sep, limit // 2, limit)
+        if i > 0:
+            return i
+    return limit
+
+
+async def _edit(message: Message, text: str, *, final: bool) -> bool:
+    """edit_text с учётом лимитов Telegram; промежуточную правку при RetryAfter просто пропускаем."""
+    for _ in range(3):
+        try:
+            await message.edit_text(text)
+            return True
+        except TelegramRetryAfter as e:
+            if not final:
+                return False
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            # «message is not modified» и т.п. — следующая правка всё исправит
+            logger.debug("stream edit skipped: %s", e)
+            return False
+    return False
+
+
+async def send_long_text(message: Message, text: str, *, limit: int = TELEGRAM_TEXT_LIMIT) -> None:
+    """Готовый текст (например, ответ из кэша): правит message, продолжение — новыми сообщениями."""
+    parts: list[str] = []
+    while len(text) > limit:
+        cut = split_point(text, limit)
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text.strip() or not parts:
+        parts.append(text)
+    await _edit(message, parts[0], final=True)
+    for part in parts[1:]:
+        await message.answer(part)
+
+
+async def stream_to_message(
+    message: Message,
+    chunks: AsyncIterator[str],
+    *,
+    edit_interval_s: float = STREAM_EDIT_INTERVAL_S,
+    limit: int = TELEGRAM_TEXT_LIMIT,
+) -> str:
+    """
+    Показывает ответ модели по мере генерации, правя message (обычно статусное сообщение).
+    Правки прореживаются до одной в edit_interval_s; если текст длиннее лимита Telegram,
+    готовая часть фиксируется, а продолжение идёт новым сообщением. Возвращает весь ответ.
+    """
+    t0 = time.perf_counter()
+    first_token_s: float | None = None
+    first_visible_s: float | None = None
+    edits = 0
+    messages = 1
+
+    current = message
+    full: list[str] = []
+    buf = ""  # текст текущего сообщения
+    shown = ""  # какой buf отрисован последней правкой
+    displayed = ""  # что сейчас на экране в current — вместе с курсором
+    next_edit_at = 0.0
+
+    async with aclosing(chunks) as it:
+        async for piece in it:
+            if first_token_s is None:
+                first_token_s = time.perf_counter() - t0
+            full.append(piece)
+            buf += piece
+
+            while len(buf) > limit:
+                cut = split_point(buf, limit)
+                head, buf = buf[:cut].rstrip(), buf[cut:].lstrip()
+                # сравниваем с тем, что на экране: если там head + курсор, правка всё равно нужна
+                if head != displayed and await _edit(current, head, final=True):
+                    edits += 1
+                displayed = buf[: limit - len(CURSOR)] + CURSOR if buf.strip() else "…"
+                current = await current.answer(displayed)
+                messages += 1
+                shown = buf
+
+            now = time.monotonic()
+            if now >= next_edit_at and buf.strip() and buf != shown:
+                text = buf + CURSOR if len(buf) + len(CURSOR) <= limit else buf
+                if await _edit(current, text, final=False):
+                    edits += 1
+                    shown = buf
+                    displayed = text
+                    if first_visible_s is None:
+                        first_visible_s = time.perf_counter() - t0
+                next_edit_at = now + edit_interval_s
+
+    tail = buf.strip()
+    if tail:
+        if tail != displayed and await _edit(current, tail, final=True):
+            edits += 1
+        if first_visible_s is None:
+            first_visible_s = time.perf_counter() - t0
+    elif current is not message:
+        # ответ закончился ровно на границе — заглушка продолжения не нужна
+        try:
+            await current.delete()
+        except TelegramBadRequest:
+            pass
+    elif not any(p.strip() for p in full):
+        await _edit(current, "Модель вернула пустой ответ.", final=True)
+
+    logger.info(
+        "stream: first_token=%.0fms first_visible=%.0fms total=%.0fms chars=%s edits=%s messages=%s",
+        (first_token_s or 0.0) * 1000,
+        (first_visible_s or 0.0) * 1000,
+        (time.perf_counter() - t0) * 1000,
+        sum(len(p) for p in full),
+        edits,
+        messages,
+    )
+    return "".join(full)
@@ -9,21 +9,96 @@ class Settings(BaseSettings):
     data_dir: str = "/data"
     tz: str = "Europe/Moscow"
     ollama_base_url: str = "http://nginx-ollama:11434"
+    # несколько бэкендов: "http://gpu1:11434=Qwen3-4B-q8,nomic-embed-text-v2-moe; http://gpu2:11434"
+    # (без "=" — узел обслуживает любые модели); пусто — только ollama_base_url
+    ollama_endpoints: str = ""
+    ollama_breaker_failures: int = 3  # столько ошибок подряд — узел выводится из ротации
+    ollama_breaker_cooldown_s: float = 30.0  # через сколько пробуем выведенный узел снова
+    ollama_retries: int = 1  # повторов на другом узле для идемпотентных вызовов (embed, классификация, rerank)
+    # сколько Ollama держит модель в памяти после запроса: длительность с единицей ("30m", "-1m" — всегда)
+    # или число секунд ("-1" — всегда; уходит в Ollama числом, строку без единицы она не принимает)
+    ollama_keep_alive_chat: str = "30m"
+    ollama_keep_alive_embed: str = "30m"
+    ollama_keep_alive_rerank: str = "30m"
+    residency_warmup: bool = True  # загрузить модели при старте бота, а не на первом сообщении
+    residency_ping_interval_s: int = 600  # пинговать модель без запросов дольше этого (0 — без пингов); < keep_alive
+    residency_active_window_s: int = 3 * 3600  # пинги — только пока за это время был трафик
     ollama_chat_model: str = "Qwen3-4B-q8"        # твоя Qwen
     ollama_embed_model: str = "nomic-embed-text-v2-moe"  # пример (можешь заменить)    
     ollama_rerank_model: str = "dengcao/Qwen3-Reranker-0.6B:Q8_0"
+    rerank_engine: str = "oneshot"  # oneshot — один запрос с порядком кандидатов; pointwise — оценка каждой пары yes/no
+    rerank_concurrency: int = 4  # pointwise: сколько пар оцениваем одновременно
+    rerank_min_score: float = 0.5  # pointwise: ниже этого P(yes) кандидат считается нерелевантным
+    rerank_cache_enabled: bool = True  # кэш результатов rerank (запрос + набор кандидатов)
+    rerank_cache_size: int = 1024  # записей в LRU
+    rerank_cache_ttl_s: int = 3600  # сколько живёт запись, даже если кандидаты не менялись
+    answer_cache_enabled: bool = True  # повторные QA-вопросы отвечаются из кэша
+    answer_cache_max_distance: float = 0.08  # косинусное расстояние между вопросами, чтобы считать их одинаковыми
+    answer_cache_ttl_s: int = 1800
+    answer_cache_max_per_user: int = 50
+    answer_cache_max_users: int = 1000
     database_url: str
     chroma_host: str = "chroma"
     chroma_port: int = 8000
+    chroma_max_concurrency: int = 4  # одновременных HTTP-запросов к Chroma из бота
+    chroma_two_phase_query: bool = True  # поиск без текстов, тексты дозапрашиваются только для отобранных чанков
+    chroma_collection_ttl_s: int = 300  # сколько живёт закэшированный хэндл коллекции
+    chroma_collection_cache_size: int = 256  # хэндлов коллекций в LRU
+    vector_mirror_enabled: bool = False  # поиск по копии векторов в памяти бота вместо HTTP в Chroma
+    vector_mirror_budget_mb: int = 512  # сколько памяти занимают зеркала всех пользователей
+    vector_mirror_max_rows: int = 20_000  # коллекции больше — всегда через Chroma
+    vector_mirror_ttl_s: int = 600  # перечитывать из Chroma (изменения из других процессов, напр. reindex_files.py)
+    lexical_index_enabled: bool = True  # BM25 по SQLite FTS5 рядом с векторным поиском
+    rrf_k: int = 60  # константа reciprocal rank fusion
     whisper_model: str = "base"
     whisper_device: str = "cpu"
     whisper_compute_type: str = "int8"
     whisper_language: str | None = "ru"
+    ingest_workers: int = 2  # процессы для парсинга документов
+    ingest_page_window: int = 16  # страниц PDF на одну задачу потокового парсинга
+    embed_batch_size: int = 32  # чанков в одном запросе эмбеддингов при индексации
+    index_workers: int = 2  # фоновые воркеры очереди индексации
+    text_cache_enabled: bool = True  # gzip-сайдкары с извлечённым текстом в data_dir/text_cache
+    embed_cache_enabled: bool = True
+    embed_cache_max_entries: int = 100_000  # ~300 МБ для 768-мерных векторов
+    embed_batching_enabled: bool = True  # склеивать одновременные embed() разных запросов в один HTTP-запрос
+    embed_batch_window_ms: float = 5.0  # сколько первый вызов ждёт попутчиков
+    embed_max_batch: int = 64  # текстов в одном /api/embed; большие вызовы режутся на части
+    # Matryoshka: первые N компонент вектора + нормировка (0 — полная размерность модели).
+    # Смена значения требует scripts/migrate_embed_dim.py для уже проиндексированных коллекций
+    embed_dim: int = 0
+    ollama_max_inflight: int = 4  # одновременных запросов к Ollama из процесса, всего
+    # из них — чат, интент, rerank, эмбеддинг запроса; меньше max_inflight, чтобы индексации всегда оставался слот
+    ollama_concurrency_interactive: int = 3
+    ollama_concurrency_normal: int = 2  # эмбеддинг сохраняемых ссылок
+    ollama_concurrency_background: int = 1  # индексация документов: остальные слоты остаются чату
+    # сколько фоновый запрос может ждать слот; его timeout_s отсчитывается уже от допуска
+    ollama_background_queue_timeout_s: float = 1800.0
+    intent_router_enabled: bool = True  # правила и центроиды интентов перед LLM-классификатором
+    intent_centroid_min_sim: float = 0.5  # минимальная косинусная близость к центроиду
+    intent_centroid_margin: float = 0.05  # отрыв лучшего интента от второго, иначе решает LLM
     @property
     def admin_ids(self) -> set[int]:
         if not self.admin_user_ids.strip():
             return set()
         return {int(x.strip()) for x in self.admin_user_ids.split(",") if x.strip()}
 
+    @property
+    def ollama_backends(self) -> list[tuple[str, frozenset[str] | None]]:
+        """(url, модели узла или None — любые) из ollama_endpoints; по умолчанию — ollama_base_url."""
+        out: list[tuple[str, frozenset[str] | None]] = []
+        for entry in self.ollama_endpoints.split(";"):
+            url, _, models = entry.strip().partition("=")
+            if not url.strip():
+                continue
+            names = frozenset(m.strip() for m in models.split(",") if m.strip())
+            out.append((url.strip().rstrip("/"), names or None))
+        return out or [(self.ollama_base_url.rstrip("/"), None)]
+
+    @property
+    def embed_signature(self) -> str:
+        """Модель эмбеддингов вместе с размерностью — то, чем посчитаны векторы в индексе."""
+        return f"{self.ollama_embed_model}@{self.embed_dim}" if self.embed_dim else self.ollama_embed_model
+
 
 settings = Settings()
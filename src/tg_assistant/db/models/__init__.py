@@ -2,4 +2,7 @@ from .user import User
 from .task import Task
 from .files import StoredFile
 from .link import Link
-__all__ = ["User", "Task", "StoredFile", "Link"]
+from .index_job import IndexJob
+from .index_manifest import IndexManifest
+from .chunk_text import ChunkText
+__all__ = ["User", "Task", "StoredFile", "Link", "IndexJob", "IndexManifest", "ChunkText"]
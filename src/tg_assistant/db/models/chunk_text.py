@@ -0,0 +1,22 @@
+from sqlalchemy import Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from tg_assistant.db.base import Base
+
+
+class ChunkText(Base):
+    """
+    Текст проиндексированных чанков (файлы и ссылки) для лексического поиска.
+    Полнотекстовый индекс — виртуальная FTS5-таблица chunk_fts поверх этой таблицы
+    (создаётся миграцией вместе с триггерами синхронизации).
+    """
+
+    __tablename__ = "chunk_texts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chunk_id: Mapped[str] = mapped_column(String(128), nullable=False, unique=True)  # id в Chroma
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    entity_type: Mapped[str] = mapped_column(String(16), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    metadata_json: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    text: Mapped[str] = mapped_column(Text, nullable=False)
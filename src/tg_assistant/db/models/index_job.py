@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from tg_assistant.db.base import Base
+
+
+class IndexJob(Base):
+    __tablename__ = "index_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True, nullable=False)
+    file_id: Mapped[int] = mapped_column(ForeignKey("files.id"), index=True, nullable=False)
+
+    status: Mapped[str] = mapped_column(String(32), index=True, nullable=False, default="pending")  # pending/running/done/failed
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[str | None] = mapped_column(String(1024), nullable=True)
+
+    # куда писать прогресс (сообщение-статус в чате пользователя)
+    chat_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    status_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    run_after: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from tg_assistant.db.base import Base
+
+
+class IndexManifest(Base):
+    """С какими параметрами файл последний раз попал в векторный индекс."""
+
+    __tablename__ = "index_manifest"
+
+    file_id: Mapped[int] = mapped_column(ForeignKey("files.id"), primary_key=True)
+
+    sha256: Mapped[str] = mapped_column(String(64), nullable=False)
+    extractor_version: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_overlap: Mapped[int] = mapped_column(Integer, nullable=False)
+    embed_model: Mapped[str] = mapped_column(String(256), nullable=False)
+    chunks: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    indexed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
@@ -17,8 +17,13 @@ from tg_assistant.bot.routers.links import router as links_router
 
 from tg_assistant.services.reminders import remind_overdue_tasks
 from tg_assistant.services.ollama_service import OllamaService
-from tg_assistant.services.chroma_service import ChromaService
+from tg_assistant.services.chroma_service import AsyncChromaService
 from tg_assistant.services.speech_to_text import SpeechToTextService
+from tg_assistant.services.ingestion import IngestionPool
+from tg_assistant.services.index_queue import IndexQueue
+from tg_assistant.services.intent_router import IntentRouter
+from tg_assistant.services.rerank_service import RerankService
+from tg_assistant.services.answer_cache import AnswerCache
 
 
 async def main() -> None:
@@ -35,18 +40,52 @@ async def main() -> None:
     ollama = OllamaService()
     await ollama.start()
 
+    chroma: AsyncChromaService | None = None
     try:
-        chroma = ChromaService()
-        chroma.client.heartbeat()
+        chroma = AsyncChromaService()
+        await chroma.heartbeat()
         logging.info("Chroma OK")
     except Exception:
         logging.exception("Chroma unavailable, continue without it for now")
+        if chroma is not None:
+            chroma.close()
         chroma = None
 
     speech_to_text = SpeechToTextService()
 
+    intent_router = IntentRouter(ollama) if settings.intent_router_enabled else None
+
+    reranker = RerankService(ollama)
+    if chroma is not None and reranker.cache is not None:
+        # перезапись/удаление чанков сбрасывает закэшированные rerank с их участием
+        chroma.sync.subscribe(reranker.cache)
+
+    # без подписки на изменения корпуса кэш ответов мог бы отдавать устаревшее — только вместе с Chroma
+    answer_cache = None
+    if chroma is not None and settings.answer_cache_enabled:
+        answer_cache = AnswerCache()
+        chroma.sync.subscribe(answer_cache)
+
+    ingestion = IngestionPool()
+    ingestion.start()
+
+    # Фоновая индексация: без Chroma задачи просто копятся в index_jobs до следующего старта
+    index_queue = None
+    if chroma is not None:
+        index_queue = IndexQueue(bot, ollama=ollama, chroma=chroma, ingestion=ingestion)
+        await index_queue.start()
+
     dp.update.middleware(
-        ServicesMiddleware(ollama=ollama, chroma=chroma, speech_to_text=speech_to_text)
+        ServicesMiddleware(
+            ollama=ollama,
+            chroma=chroma,
+            speech_to_text=speech_to_text,
+            ingestion=ingestion,
+            index_queue=index_queue,
+            intent_router=intent_router,
+            reranker=reranker,
+            answer_cache=answer_cache,
+        )
     )
 
     # Routers (подключаем ДО polling) [web:371]
@@ -60,13 +99,28 @@ async def main() -> None:
     # Scheduler
     scheduler = AsyncIOScheduler()
     scheduler.add_job(remind_overdue_tasks, "interval", minutes=60, args=[bot])
+    if settings.residency_ping_interval_s > 0:
+        # продлеваем keep_alive моделям, которыми недавно пользовались, чтобы следующий запрос не ждал загрузки
+        scheduler.add_job(
+            ollama.residency.ping_idle, "interval", seconds=settings.residency_ping_interval_s // 2, max_instances=1
+        )
     scheduler.start()
 
+    # прогрев в фоне: polling стартует сразу, первые запросы просто подождут загрузку, как и раньше
+    warmup = asyncio.create_task(ollama.residency.warmup()) if settings.residency_warmup else None
+
     try:
         # Запускаем polling один раз, после регистрации всего [web:93]
         await dp.start_polling(bot)
     finally:
+        if warmup is not None:
+            warmup.cancel()
         scheduler.shutdown(wait=False)
+        if index_queue is not None:
+            await index_queue.stop()
+        ingestion.shutdown()
+        if chroma is not None:
+            chroma.close()
         await ollama.close()
 
 
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from tg_assistant.config import settings
+from tg_assistant.services.chroma_service import ChromaListener
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(v: list[float]) -> list[float]:
+    n = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / n for x in v]
+
+
+def _dot(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+@dataclass
+class _Answer:
+    question: str
+    embedding: list[float]  # нормированный вектор вопроса
+    context_ids: frozenset[str]  # чанки, на которых построен ответ
+    answer: str
+    created_at: float
+
+
+class AnswerCache(ChromaListener):
+    """
+    Семантический кэш ответов QA по пользователю.
+    Ответ отдаётся повторно, если новый вопрос близок к закэшированному (косинусное расстояние
+    не больше max_distance) и все чанки его контекста снова нашлись поиском.
+    Любое изменение коллекции пользователя (upsert/delete/drop) сбрасывает его кэш целиком.
+    """
+
+    def __init__(
+        self,
+        max_distance: float | None = None,
+        ttl_s: int | None = None,
+        max_per_user: int | None = None,
+        max_users: int | None = None,
+    ):
+        self.max_distance = settings.answer_cache_max_distance if max_distance is None else max_distance
+        self.ttl_s = ttl_s or settings.answer_cache_ttl_s
+        self.max_per_user = max_per_user or settings.answer_cache_max_per_user
+        self.max_users = max_users or settings.answer_cache_max_users
+        self._users: OrderedDict[int, list[_Answer]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Counter[str] = Counter()  # hit / miss / stale_context / expired / invalidate
+
+    def get(self, user_id: int, embedding: list[float], retrieved_ids: list[str]) -> str | None:
+        q = _normalize(embedding)
+        retrieved = set(retrieved_ids)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._users.get(user_id)
+            if not entries:
+                self.stats["miss"] += 1
+                return None
+            fresh = [e for e in entries if now - e.created_at < self.ttl_s]
+            self.stats["expired"] += len(entries) - len(fresh)
+            entries[:] = fresh
+            self._users.move_to_end(user_id)
+
+            best: _Answer | None = None
+            best_dist = self.max_distance
+            for e in fresh:
+                dist = max(0.0, 1.0 - _dot(q, e.embedding))
+                if dist <= best_dist:
+                    best, best_dist = e, dist
+            if best is None:
+                self.stats["miss"] += 1
+                return None
+            if not best.context_ids <= retrieved:
+                # вопрос тот же, но поиск теперь приносит другие чанки — отвечаем заново
+                self.stats["stale_context"] += 1
+                return None
+            self.stats["hit"] += 1
+        logger.info("answer cache hit user=%s dist=%.3f question=%r", user_id, best_dist, best.question)
+        return best.answer
+
+    def put(self, user_id: int, question: str, embedding: list[float], context_ids: list[str], answer: str) -> None:
+        entry = _Answer(question, _normalize(embedding), frozenset(context_ids), answer, time.monotonic())
+        with self._lock:
+            entries = self._users.setdefault(user_id, [])
+            entries.append(entry)
+            del entries[: -self.max_per_user]
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hit"] + self.stats["miss"] + self.stats["stale_context"]
+        return self.stats["hit"] / lookups if lookups else 0.0
+
+    def _invalidate(self, user_id: int) -> None:
+        with self._lock:
+            if self._users.pop(user_id, None):
+                self.stats["invalidate"] += 1
+
+    # --- синхронизация с ChromaService ---
+
+    def on_upsert(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        self._invalidate(user_id)
+
+    def on_delete(self, user_id: int, where: dict[str, Any]) -> None:
+        self._invalidate(user_id)
+
+    def on_drop(self, user_id: int) -> None:
+        self._invalidate(user_id)
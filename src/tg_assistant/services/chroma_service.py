@@ -1,14 +1,86 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable
 
 import chromadb
 from chromadb.config import Settings as ChromaSettings
+from chromadb.errors import NotFoundError
 import logging
 logger = logging.getLogger(__name__)
 
 from tg_assistant.config import settings
 
+if TYPE_CHECKING:
+    from tg_assistant.services.lexical_index import LexicalIndex
+    from tg_assistant.services.vector_mirror import VectorMirror
+
+# если сервер не ответил на pre-flight, режем батчи консервативно
+DEFAULT_MAX_BATCH_SIZE = 1000
+
+_COMPARE = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def match_where(meta: dict[str, Any] | None, where: dict[str, Any] | None) -> bool:
+    """Проверка метаданных по where-фильтру Chroma ($and/$or, равенство и операторы сравнения)."""
+    if not where:
+        return True
+    meta = meta or {}
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                if op not in _COMPARE:
+                    raise ValueError(f"unsupported where operator {op}")
+                if not _COMPARE[op](value, arg):
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+class ChromaListener:
+    """
+    Подписчик на изменения коллекций (локальные зеркала, кэши поверх поиска).
+    Методы вызываются после успешной записи в Chroma, из потока, который её сделал.
+    """
+
+    def on_upsert(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        pass
+
+    def on_delete(self, user_id: int, where: dict[str, Any]) -> None:
+        pass
+
+    def on_drop(self, user_id: int) -> None:
+        pass
+
 
 class ChromaService:
     def __init__(self):
@@ -17,12 +89,99 @@ class ChromaService:
             port=settings.chroma_port,
             settings=ChromaSettings(anonymized_telemetry=False),
         )
+        # сколько HTTP-запросов к Chroma сделано, по операциям
+        self.requests: Counter[str] = Counter()
+        self._max_batch_size: int | None = None
+        # user_id -> (хэндл коллекции, когда получен); LRU + TTL
+        self._collections: OrderedDict[int, tuple[Any, float]] = OrderedDict()
+        self._collections_lock = threading.Lock()
+        self.collection_cache: Counter[str] = Counter()  # hit / miss / evict / invalidate
+        self._listeners: list[ChromaListener] = []
+
+    def subscribe(self, listener: ChromaListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, *args: Any) -> None:
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception:
+                # слушатель не должен ломать запись: Chroma остаётся источником истины
+                logger.exception("chroma listener %s.%s failed", type(listener).__name__, event)
+
+    def max_batch_size(self) -> int:
+        if self._max_batch_size is None:
+            self.requests["pre_flight"] += 1
+            try:
+                self._max_batch_size = int(self.client.get_max_batch_size())
+            except Exception:
+                logger.warning("chroma: max batch size unavailable, using %s", DEFAULT_MAX_BATCH_SIZE)
+                self._max_batch_size = DEFAULT_MAX_BATCH_SIZE
+        return self._max_batch_size
+
+    @staticmethod
+    def collection_name(user_id: int) -> str:
+        return f"user_{user_id}"
+
+    @staticmethod
+    def collection_metadata(user_id: int) -> dict[str, Any]:
+        """Метаданные новой коллекции: чья она и какими векторами заполняется."""
+        return {
+            "user_id": str(user_id),
+            "embed_model": settings.ollama_embed_model,
+            "embed_dim": settings.embed_dim,  # 0 — полная размерность модели
+        }
 
     def get_user_collection(self, user_id: int):
-        return self.client.get_or_create_collection(
-            name=f"user_{user_id}",
-            metadata={"user_id": str(user_id)},
+        """Хэндл коллекции пользователя; get_or_create_collection — только при промахе кэша."""
+        now = time.monotonic()
+        with self._collections_lock:
+            cached = self._collections.get(user_id)
+            if cached is not None and now - cached[1] < settings.chroma_collection_ttl_s:
+                self._collections.move_to_end(user_id)
+                self.collection_cache["hit"] += 1
+                return cached[0]
+
+        self.collection_cache["miss"] += 1
+        self.requests["get_or_create_collection"] += 1
+        col = self.client.get_or_create_collection(
+            name=self.collection_name(user_id),
+            metadata=self.collection_metadata(user_id),
         )
+        # у существующей коллекции Chroma метаданные не меняет; коллекции без embed_dim — полноразмерные
+        dim = (col.metadata or {}).get("embed_dim", 0)
+        if dim != settings.embed_dim:
+            logger.warning(
+                "chroma: %s holds embed_dim=%s vectors, settings say %s — run scripts/migrate_embed_dim.py",
+                col.name, dim, settings.embed_dim,
+            )
+        with self._collections_lock:
+            self._collections[user_id] = (col, now)
+            self._collections.move_to_end(user_id)
+            while len(self._collections) > settings.chroma_collection_cache_size:
+                self._collections.popitem(last=False)
+                self.collection_cache["evict"] += 1
+        return col
+
+    def invalidate_collection(self, user_id: int) -> None:
+        with self._collections_lock:
+            if self._collections.pop(user_id, None) is not None:
+                self.collection_cache["invalidate"] += 1
+
+    def drop_user_collection(self, user_id: int) -> None:
+        self.invalidate_collection(user_id)
+        self.requests["delete_collection"] += 1
+        self.client.delete_collection(self.collection_name(user_id))
+        self._notify("on_drop", user_id)
+
+    def _with_collection(self, user_id: int, fn: Callable[[Any], Any]) -> Any:
+        col = self.get_user_collection(user_id)
+        try:
+            return fn(col)
+        except NotFoundError:
+            # коллекцию удалили мимо нас (другой процесс/скрипт) — берём новый хэндл и повторяем
+            self.invalidate_collection(user_id)
+            return fn(self.get_user_collection(user_id))
 
     def upsert_embedding(
         self,
@@ -32,13 +191,59 @@ class ChromaService:
         document: str,
         metadata: dict[str, Any],
     ) -> None:
-        col = self.get_user_collection(user_id)
-        col.upsert(
-            ids=[doc_id],
-            embeddings=[embedding],
-            documents=[document],
-            metadatas=[metadata],
-        )
+        def op(col) -> None:
+            self.requests["upsert"] += 1
+            col.upsert(
+                ids=[doc_id],
+                embeddings=[embedding],
+                documents=[document],
+                metadatas=[metadata],
+            )
+
+        self._with_collection(user_id, op)
+        self._notify("on_upsert", user_id, [doc_id], [embedding], [document], [metadata])
+
+    def upsert_many(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        """Upsert параллельных списков: одна коллекция и по одному запросу на батч."""
+        n = len(ids)
+        if not (len(embeddings) == len(documents) == len(metadatas) == n):
+            raise ValueError(
+                f"upsert_many: lists differ in length ids={n} embeddings={len(embeddings)} "
+                f"documents={len(documents)} metadatas={len(metadatas)}"
+            )
+        if n == 0:
+            return
+
+        batch = self.max_batch_size()
+        for start in range(0, n, batch):
+            end = start + batch
+
+            def op(col) -> None:
+                self.requests["upsert"] += 1
+                col.upsert(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                )
+
+            self._with_collection(user_id, op)
+            self._notify(
+                "on_upsert",
+                user_id,
+                ids[start:end],
+                embeddings[start:end],
+                documents[start:end],
+                metadatas[start:end],
+            )
+        logger.info("chroma.upsert_many user=%s n=%s batches=%s", user_id, n, (n + batch - 1) // batch)
 
     def query_by_embedding(
         self,
@@ -46,35 +251,185 @@ class ChromaService:
         query_embedding: list[float],
         n_results: int = 3,
         where: dict | None = None,
+        include_documents: bool = True,
     ) -> list[dict[str, Any]]:
-        col = self.get_user_collection(user_id)
-        res = col.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where,
-            include=["documents", "metadatas", "distances"],
-        )
+        """include_documents=False — первая фаза двухфазного поиска: без текстов (text=None), см. get_documents."""
+        include = ["metadatas", "distances"]
+        if include_documents:
+            include.append("documents")
+
+        def op(col) -> dict[str, Any]:
+            self.requests["query"] += 1
+            return col.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include=include,
+            )
+
+        res = self._with_collection(user_id, op)
         items: list[dict[str, Any]] = []
         for i in range(len(res["ids"][0])):
             items.append(
                 {
                     "id": res["ids"][0][i],
-                    "text": res["documents"][0][i],
+                    "text": res["documents"][0][i] if include_documents else None,
                     "metadata": res["metadatas"][0][i],
                     "distance": res["distances"][0][i],
                 }
             )
         logger.info("chroma.query user=%s n=%s", user_id, n_results)
         return items
+
+    def get_documents(self, user_id: int, ids: list[str]) -> dict[str, str]:
+        """Вторая фаза поиска: тексты только для отобранных чанков."""
+        if not ids:
+            return {}
+
+        def op(col) -> dict[str, Any]:
+            self.requests["get"] += 1
+            return col.get(ids=ids, include=["documents"])
+
+        res = self._with_collection(user_id, op)
+        return {doc_id: doc or "" for doc_id, doc in zip(res["ids"], res["documents"])}
+
     def delete_file_chunks(self, user_id: int, file_id: int) -> None:
-        col = self.get_user_collection(user_id)
-        col.delete(
-            where={
-                "$and": [
-                    {"entity_type": "file"},
-                    {"entity_id": file_id},
-                    {"user_id": user_id},
-                ]
-            }
+        where = {
+            "$and": [
+                {"entity_type": "file"},
+                {"entity_id": file_id},
+                {"user_id": user_id},
+            ]
+        }
+
+        def op(col) -> None:
+            self.requests["delete"] += 1
+            col.delete(where=where)
+
+        self._with_collection(user_id, op)
+        self._notify("on_delete", user_id, where)
+
+
+class AsyncChromaService:
+    """
+    Асинхронный фасад над ChromaService для хендлеров и фоновых задач.
+    HTTP-клиент Chroma синхронный, поэтому вызовы уходят в отдельный пул потоков
+    (не в общий to_thread-пул), а число запросов в полёте ограничено семафором —
+    остальные ждут своей очереди в event loop, не занимая потоки.
+    """
+
+    def __init__(
+        self,
+        sync: ChromaService | None = None,
+        max_concurrency: int | None = None,
+        mirror: VectorMirror | None = None,
+        lexical: LexicalIndex | None = None,
+    ):
+        self.sync = sync or ChromaService()
+        if mirror is None and settings.vector_mirror_enabled:
+            from tg_assistant.services.vector_mirror import VectorMirror
+
+            mirror = VectorMirror(self.sync)
+        if mirror is not None:
+            self.sync.subscribe(mirror)
+        self.mirror = mirror
+
+        if lexical is None and settings.lexical_index_enabled:
+            from tg_assistant.services.lexical_index import LexicalIndex, sqlite_path
+
+            if sqlite_path(settings.database_url) is not None:
+                lexical = LexicalIndex()
+        if lexical is not None:
+            self.sync.subscribe(lexical)
+        self.lexical = lexical
+        self.max_concurrency = max(1, max_concurrency or settings.chroma_max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="chroma")
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.waiting = 0  # запросы, ждущие свободного слота
+        self.max_wait_s = 0.0
+
+    @property
+    def requests(self) -> Counter[str]:
+        return self.sync.requests
+
+    async def _run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        t0 = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.max_wait_s = max(self.max_wait_s, time.perf_counter() - t0)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.lexical is not None:
+            self.lexical.close()
+
+    async def heartbeat(self) -> int:
+        return await self._run(self.sync.client.heartbeat)
+
+    async def max_batch_size(self) -> int:
+        return await self._run(self.sync.max_batch_size)
+
+    async def upsert_embedding(
+        self,
+        user_id: int,
+        doc_id: str,
+        embedding: list[float],
+        document: str,
+        metadata: dict[str, Any],
+    ) -> None:
+        await self._run(self.sync.upsert_embedding, user_id, doc_id, embedding, document, metadata)
+
+    async def upsert_many(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        await self._run(self.sync.upsert_many, user_id, ids, embeddings, documents, metadatas)
+
+    async def query_by_embedding(
+        self,
+        user_id: int,
+        query_embedding: list[float],
+        n_results: int = 3,
+        where: dict | None = None,
+        include_documents: bool = True,
+    ) -> list[dict[str, Any]]:
+        if self.mirror is not None:
+            if not self.mirror.is_ready(user_id):
+                try:
+                    await self._run(self.mirror.load, user_id)
+                except Exception:
+                    logger.warning("vector mirror: load failed for user=%s, querying Chroma", user_id, exc_info=True)
+            # в потоке, а не в цикле событий: query ждёт lock зеркала, который upsert/delete держат
+            # в потоках Chroma, а первый поиск с новым where строит маску обходом всех метаданных
+            hits = await self._run(self.mirror.query, user_id, query_embedding, n_results, where)
+            if hits is not None:
+                return hits
+        return await self._run(
+            self.sync.query_by_embedding, user_id, query_embedding, n_results, where, include_documents
         )
 
+    async def fill_documents(self, user_id: int, hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Дозагружает text хитам первой фазы (text=None) одним запросом; остальные возвращает как есть."""
+        missing = [h["id"] for h in hits if h.get("text") is None]
+        if not missing:
+            return hits
+        docs = await self._run(self.sync.get_documents, user_id, missing)
+        return [h if h.get("text") is not None else {**h, "text": docs.get(h["id"], "")} for h in hits]
+
+    async def delete_file_chunks(self, user_id: int, file_id: int) -> None:
+        await self._run(self.sync.delete_file_chunks, user_id, file_id)
+
+    async def drop_user_collection(self, user_id: int) -> None:
+        await self._run(self.sync.drop_user_collection, user_id)
@@ -1,28 +1,77 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from pypdf import PdfReader
 import docx
 
+# поднимать при любом изменении извлечения текста — файлы будут переиндексированы
+EXTRACTOR_VERSION = 2
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
 
-def extract_text_from_pdf(path: Path) -> str:
+PDF_MIME = "application/pdf"
+
+# (номер страницы с 1, текст страницы); пустые страницы не выдаются
+Page = tuple[int, str]
+
+
+def _clean_page(text: str) -> str:
+    # \f — разделитель страниц в кэше текста
+    return text.replace("\f", "\n")
+
+
+def iter_pdf_pages(path: Path, start: int = 0, end: int | None = None) -> Iterator[Page]:
     reader = PdfReader(str(path))
-    parts: list[str] = []
-    for page in reader.pages:
-        t = page.extract_text() or ""
+    pages = reader.pages
+    end = len(pages) if end is None else min(end, len(pages))
+    for idx in range(start, end):
+        t = _clean_page(pages[idx].extract_text() or "")
         if t.strip():
-            parts.append(t)
-    return "\n".join(parts).strip()
+            yield idx + 1, t
+
+
+def pdf_page_count(path: Path) -> int:
+    return len(PdfReader(str(path)).pages)
+
+
+def extract_text_from_pdf(path: Path) -> str:
+    return "\n".join(t for _, t in iter_pdf_pages(path)).strip()
 
 
 def extract_text_from_docx(path: Path) -> str:
     d = docx.Document(str(path))
     parts = [p.text for p in d.paragraphs if p.text and p.text.strip()]
-    return "\n".join(parts).strip()
+    return _clean_page("\n".join(parts)).strip()
+
+
+def document_page_count(path: Path, mime: str | None) -> int:
+    # у docx нет страниц — весь документ считаем одной страницей
+    return pdf_page_count(path) if mime == PDF_MIME else 1
+
+
+def extract_page_window(path: Path, mime: str | None, start: int, end: int) -> list[Page]:
+    """Страницы [start, end) документа — единица работы для потокового парсинга."""
+    if mime == PDF_MIME:
+        return list(iter_pdf_pages(path, start, end))
+    if start > 0:
+        return []
+    text = extract_text_from_docx(path)
+    return [(1, text)] if text else []
+
 
+def extract_pages(path: Path, mime: str | None) -> list[Page]:
+    return extract_page_window(path, mime, 0, document_page_count(path, mime))
 
-def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> list[str]:
+
+def extract_text(path: Path, mime: str | None) -> str:
+    if mime == PDF_MIME:
+        return extract_text_from_pdf(path)
+    return extract_text_from_docx(path)
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
     text = text.strip()
     if not text:
         return []
@@ -36,3 +85,85 @@ def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> list[st
             break
         i = max(j - overlap, 0)
     return out
+
+
+# (текст чанка, первая страница, последняя страница)
+PageChunk = tuple[str, int, int]
+
+
+class PageChunker:
+    """
+    Потоковый вариант chunk_text: страницы подаются по одной, перекрытие переносится через
+    границы страниц, в памяти держится только хвост текста. Для одних и тех же страниц чанки
+    совпадают с chunk_text("\\n".join(pages)); дополнительно известны страницы каждого чанка.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buf = ""
+        self._buf_start = 0  # глобальное смещение buf[0]
+        self._pos = 0  # глобальное начало следующего чанка
+        self._pages: list[tuple[int, int]] = []  # (смещение начала страницы, номер страницы)
+
+    def feed(self, page_no: int, text: str) -> list[PageChunk]:
+        if not text.strip():
+            return []
+        if not self._pages:
+            text = text.lstrip()
+            start = self._buf_start
+        else:
+            text = "\n" + text
+            start = self._buf_start + len(self._buf) + 1
+        self._pages.append((start, page_no))
+        self._buf += text
+        return self._drain(final=False)
+
+    def finish(self) -> list[PageChunk]:
+        return self._drain(final=True)
+
+    def _page_at(self, offset: int) -> int:
+        page = self._pages[0][1]
+        for start, no in self._pages:
+            if start > offset:
+                break
+            page = no
+        return page
+
+    def _drain(self, final: bool) -> list[PageChunk]:
+        out: list[PageChunk] = []
+        if not self._pages:
+            return out
+
+        end = self._buf_start + len(self._buf.rstrip())
+        while self._pos < end:
+            j = min(self._pos + self.chunk_size, end)
+            # пока поток не закончился, чанк до конца буфера может оказаться не последним — ждём
+            if not final and j >= end:
+                break
+            a, b = self._pos - self._buf_start, j - self._buf_start
+            out.append((self._buf[a:b], self._page_at(self._pos), self._page_at(j - 1)))
+            if j == end:
+                self._pos = end
+                break
+            self._pos = max(j - self.overlap, 0)
+
+        # выкидываем всё, что уже не попадёт ни в один чанк
+        cut = self._pos - self._buf_start
+        if cut > 0:
+            self._buf = self._buf[cut:]
+            self._buf_start = self._pos
+        while len(self._pages) > 1 and self._pages[1][0] <= self._pos:
+            self._pages.pop(0)
+        return out
+
+
+def iter_page_chunks(
+    pages: Iterable[Page],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[PageChunk]:
+    chunker = PageChunker(chunk_size, overlap)
+    for page_no, text in pages:
+        yield from chunker.feed(page_no, text)
+    yield from chunker.finish()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator
+
+from aiogram import Bot
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _local_reader(path: Path, chunk_size: int) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def write_stream_hashed(stream: AsyncIterator[bytes], destination: Path) -> tuple[str, int]:
+    """
+    Пишет поток байтов в файл и одновременно считает sha256 — за один проход, без перечитывания.
+    Запись и хэширование идут в потоке; пока он обрабатывает кусок N, event loop уже принимает N+1.
+    Возвращает (sha256 hex, размер в байтах).
+    """
+    h = hashlib.sha256()
+    size = 0
+    pending: asyncio.Future | None = None
+
+    with destination.open("wb") as out:
+        def sink(chunk: bytes) -> None:
+            out.write(chunk)
+            h.update(chunk)
+
+        try:
+            async for chunk in stream:
+                if pending is not None:
+                    await pending
+                pending = asyncio.ensure_future(asyncio.to_thread(sink, chunk))
+                size += len(chunk)
+        finally:
+            # файл нельзя закрывать, пока поток в него пишет
+            if pending is not None:
+                await pending
+
+    return h.hexdigest(), size
+
+
+async def download_file_hashed(
+    bot: Bot,
+    file_path: str,
+    destination: Path,
+    *,
+    timeout: int = 300,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+) -> tuple[str, int]:
+    """Скачивает файл Telegram в destination, считая sha256 на лету."""
+    api = bot.session.api
+    if api.is_local:
+        stream = _local_reader(Path(api.wrap_local_file.to_local(file_path)), chunk_size)
+    else:
+        stream = bot.session.stream_content(
+            url=api.file_url(bot.token, file_path),
+            timeout=timeout,
+            chunk_size=chunk_size,
+            raise_for_status=True,
+        )
+
+    try:
+        return await write_stream_hashed(stream, destination)
+    finally:
+        await stream.aclose()
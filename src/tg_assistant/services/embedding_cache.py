@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any
+
+from tg_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SQL_BATCH = 500  # лимит параметров в одном IN (...)
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Персистентный кэш эмбеддингов в локальном SQLite.
+    Ключ — (модель, sha256 текста), вектор хранится как float32 BLOB.
+    При превышении max_entries выкидываются давно не использованные записи (LRU).
+    Методы синхронные — из async-кода вызывать через asyncio.to_thread.
+    """
+
+    def __init__(self, path: Path | None = None, max_entries: int | None = None):
+        self.path = path or Path(settings.data_dir) / "cache" / "embeddings.sqlite"
+        self.max_entries = max_entries or settings.embed_cache_max_entries
+        self.hits = 0
+        self.misses = 0
+        self.miss_time_s = 0.0  # сколько времени ушло на эмбеддинг промахов в модели
+        self._entries = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, key TEXT NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        keys = [text_key(t) for t in texts]
+        found: dict[str, list[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            conn = self._connect()
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), _SQL_BATCH):
+                part = unique[start:start + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec.tolist()
+            if found:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, k) for k in found],
+                )
+                conn.commit()
+
+        out = [found.get(k) for k in keys]
+        n_hits = sum(1 for v in out if v is not None)
+        self.hits += n_hits
+        self.misses += len(out) - n_hits
+        return out
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]) -> None:
+        now = time.time()
+        rows = [(model, text_key(t), array("f", v).tobytes(), now) for t, v in zip(texts, vectors)]
+
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vec, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._entries += len(rows)
+            if self._entries > self.max_entries:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # чистим с запасом 10%, чтобы не вытеснять на каждой вставке
+        excess = self._entries - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        conn.execute(
+            "DELETE FROM embeddings WHERE (model, key) IN ("
+            " SELECT model, key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._entries -= excess
+        logger.info("embedding cache: evicted %s entries", excess)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        per_text_s = self.miss_time_s / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": self._entries,
+            "est_saved_s": round(self.hits * per_text_s, 1),
+        }
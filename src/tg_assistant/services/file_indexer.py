@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from tg_assistant.config import settings
+from tg_assistant.db.engine import SessionMaker
+from tg_assistant.db.models.files import StoredFile
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.document_parser import PageChunk
+from tg_assistant.services.index_manifest import record_indexed
+from tg_assistant.services.ingestion import IngestionPool
+from tg_assistant.services.ollama_scheduler import BACKGROUND
+from tg_assistant.services.ollama_service import OllamaService
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+
+async def _noop_progress(_: str) -> None:
+    return None
+
+
+def file_chunk_metadata(stored: StoredFile, i: int, page_start: int, page_end: int) -> dict[str, Any]:
+    return {
+        "entity_type": "file",
+        "entity_id": stored.id,
+        "chunk": i,
+        "page_start": page_start,
+        "page_end": page_end,
+        "filename": stored.orig_name,
+        "mime": stored.mime,
+        "user_id": stored.user_id,
+    }
+
+
+async def upsert_file_chunks(
+    chroma: AsyncChromaService,
+    stored: StoredFile,
+    chunks: list[PageChunk],
+    embeddings: list[list[float]],
+    first_index: int = 0,
+) -> None:
+    """Пишет подряд идущие чанки файла, начиная с номера first_index."""
+    idx = range(first_index, first_index + len(chunks))
+    await chroma.upsert_many(
+        user_id=stored.user_id,
+        ids=[f"file_{stored.id}_chunk_{i}" for i in idx],
+        embeddings=embeddings,
+        documents=[text for text, _, _ in chunks],
+        metadatas=[file_chunk_metadata(stored, i, p0, p1) for i, (_, p0, p1) in zip(idx, chunks)],
+    )
+
+
+async def mark_indexed(stored: StoredFile, chunks: int) -> None:
+    async with SessionMaker() as session:
+        await record_indexed(session, stored, chunks)
+
+
+async def index_stored_file(
+    stored: StoredFile,
+    ollama: OllamaService,
+    chroma: AsyncChromaService,
+    ingestion: IngestionPool,
+    progress: ProgressCallback | None = None,
+) -> int:
+    """
+    Полная (пере)индексация одного файла: страницы -> чанки -> эмбеддинги -> Chroma.
+    Работает потоково: чанки эмбеддятся и пишутся микро-батчами по мере парсинга,
+    так что память не растёт с размером документа.
+    Идемпотентна: старые чанки файла удаляются. Возвращает число чанков (0 — текста нет).
+    После успеха файл отмечается в index_manifest текущими параметрами индексации.
+    """
+    progress = progress or _noop_progress
+
+    # старые/недописанные чанки (например, после рестарта посреди индексации)
+    await chroma.delete_file_chunks(user_id=stored.user_id, file_id=stored.id)
+
+    await progress("Извлекаю текст...")
+    n_done = 0
+    batch: list[PageChunk] = []
+
+    async def flush() -> None:
+        nonlocal n_done, batch
+        embeddings = await ollama.embed([text for text, _, _ in batch], priority=BACKGROUND)
+        await upsert_file_chunks(chroma, stored, batch, embeddings, first_index=n_done)
+        n_done += len(batch)
+        last_page = batch[-1][2]
+        batch = []
+        await progress(f"проиндексировано {n_done} чанков (до стр. {last_page})")
+
+    async for chunk in ingestion.iter_chunks(Path(stored.local_path), stored.mime, stored.sha256):
+        batch.append(chunk)
+        if len(batch) >= settings.embed_batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    await mark_indexed(stored, n_done)
+    logger.info("indexed file_id=%s chunks=%s", stored.id, n_done)
+    return n_done
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tg_assistant.config import settings
+from tg_assistant.db.models.files import StoredFile
+from tg_assistant.db.models.index_manifest import IndexManifest
+from tg_assistant.services.document_parser import CHUNK_OVERLAP, CHUNK_SIZE, EXTRACTOR_VERSION
+
+
+def stale_reason(entry: IndexManifest | None, stored: StoredFile) -> str | None:
+    """Почему файл надо переиндексировать (None — индекс актуален)."""
+    if entry is None:
+        return "missing"
+    if entry.sha256 != stored.sha256:
+        return "sha256"
+    if entry.extractor_version != EXTRACTOR_VERSION:
+        return "extractor"
+    if (entry.chunk_size, entry.chunk_overlap) != (CHUNK_SIZE, CHUNK_OVERLAP):
+        return "chunker"
+    if entry.embed_model != settings.embed_signature:
+        return "embed_model"
+    return None
+
+
+async def load_manifest(session: AsyncSession) -> dict[int, IndexManifest]:
+    res = await session.execute(select(IndexManifest))
+    return {m.file_id: m for m in res.scalars().all()}
+
+
+async def record_indexed(session: AsyncSession, stored: StoredFile, chunks: int) -> None:
+    await session.merge(
+        IndexManifest(
+            file_id=stored.id,
+            sha256=stored.sha256,
+            extractor_version=EXTRACTOR_VERSION,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            embed_model=settings.embed_signature,
+            chunks=chunks,
+            indexed_at=datetime.utcnow(),
+        )
+    )
+    await session.commit()
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tg_assistant.config import settings
+from tg_assistant.db.engine import SessionMaker
+from tg_assistant.db.models.files import StoredFile
+from tg_assistant.db.models.index_job import IndexJob
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.file_indexer import index_stored_file
+from tg_assistant.services.ingestion import IngestionPool
+from tg_assistant.services.ollama_service import OllamaService
+
+logger = logging.getLogger(__name__)
+
+# Telegram ограничивает частоту правок сообщения — прогресс микро-батчей прореживаем
+PROGRESS_EDIT_INTERVAL_S = 2.0
+
+
+async def enqueue_index_job(
+    session: AsyncSession,
+    stored: StoredFile,
+    chat_id: int | None = None,
+    status_message_id: int | None = None,
+) -> IndexJob:
+    job = IndexJob(
+        user_id=stored.user_id,
+        file_id=stored.id,
+        status="pending",
+        chat_id=chat_id,
+        status_message_id=status_message_id,
+    )
+    session.add(job)
+    await session.commit()
+    await session.refresh(job)
+    return job
+
+
+class IndexQueue:
+    """
+    Фоновая индексация файлов из таблицы index_jobs.
+    Очередь живёт в SQLite, поэтому задачи переживают рестарт бота:
+    при старте всё, что было в статусе running, возвращается в pending.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        ollama: OllamaService,
+        chroma: AsyncChromaService,
+        ingestion: IngestionPool,
+        workers: int | None = None,
+        max_attempts: int = 3,
+        poll_interval_s: float = 30.0,
+    ):
+        self.bot = bot
+        self.ollama = ollama
+        self.chroma = chroma
+        self.ingestion = ingestion
+        self.workers = max(1, workers or settings.index_workers)
+        self.max_attempts = max_attempts
+        self.poll_interval_s = poll_interval_s
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        async with SessionMaker() as session:
+            res = await session.execute(
+                update(IndexJob)
+                .where(IndexJob.status == "running")
+                .values(status="pending", updated_at=datetime.utcnow())
+            )
+            await session.commit()
+        if res.rowcount:
+            logger.info("index queue: resumed %s interrupted jobs", res.rowcount)
+
+        # файлы, которые успели попасть в БД, но не в очередь (рестарт между commit и enqueue)
+        async with SessionMaker() as session:
+            res = await session.execute(
+                select(StoredFile).where(~select(IndexJob.id).where(IndexJob.file_id == StoredFile.id).exists())
+            )
+            orphans = list(res.scalars().all())
+            for stored in orphans:
+                await enqueue_index_job(session, stored)
+        if orphans:
+            logger.info("index queue: enqueued %s files without index jobs", len(orphans))
+
+        for n in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(n), name=f"index-worker-{n}"))
+        self.notify()
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _claim_next(self) -> IndexJob | None:
+        now = datetime.utcnow()
+        async with SessionMaker() as session:
+            while True:
+                res = await session.execute(
+                    select(IndexJob)
+                    .where(
+                        IndexJob.status == "pending",
+                        (IndexJob.run_after.is_(None)) | (IndexJob.run_after <= now),
+                    )
+                    .order_by(IndexJob.id.asc())
+                    .limit(1)
+                )
+                job = res.scalar_one_or_none()
+                if job is None:
+                    return None
+
+                # забираем задачу атомарно: другой воркер мог успеть раньше
+                claimed = await session.execute(
+                    update(IndexJob)
+                    .where(IndexJob.id == job.id, IndexJob.status == "pending")
+                    .values(status="running", attempts=IndexJob.attempts + 1, updated_at=now)
+                )
+                await session.commit()
+                if claimed.rowcount:
+                    await session.refresh(job)
+                    return job
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            try:
+                job = await self._claim_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("index worker %s: failed to claim job", n)
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # ошибка БД вне обработки файла (например, database is locked) не должна убивать воркер
+                logger.exception("index worker %s: job=%s failed outside of indexing (attempt %s)", n, job.id, job.attempts)
+                try:
+                    # тот же лимит попыток, что и в _run: постоянная ошибка не должна крутить задачу вечно
+                    if job.attempts < self.max_attempts:
+                        await self._finish(job, "pending", error=f"worker error: {e}"[:1024], retry_in_s=30 * job.attempts)
+                    else:
+                        await self._finish(job, "failed", error=f"worker error: {e}"[:1024])
+                except Exception:
+                    # не вышло — задача вернётся в pending при следующем старте
+                    logger.exception("index worker %s: failed to finish job=%s", n, job.id)
+
+    async def _report(self, job: IndexJob, text: str) -> None:
+        if job.chat_id is None or job.status_message_id is None:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=job.chat_id,
+                message_id=job.status_message_id,
+            )
+        except Exception:
+            # сообщение удалено / текст не изменился — прогресс не критичен
+            logger.debug("index job=%s: status edit failed", job.id, exc_info=True)
+
+    async def _finish(self, job: IndexJob, status: str, error: str | None = None, retry_in_s: int | None = None) -> None:
+        values = {"status": status, "error": error, "updated_at": datetime.utcnow()}
+        if retry_in_s is not None:
+            values["run_after"] = datetime.utcnow() + timedelta(seconds=retry_in_s)
+        async with SessionMaker() as session:
+            await session.execute(update(IndexJob).where(IndexJob.id == job.id).values(**values))
+            await session.commit()
+
+    async def _run(self, job: IndexJob) -> None:
+        async with SessionMaker() as session:
+            res = await session.execute(select(StoredFile).where(StoredFile.id == job.file_id))
+            stored = res.scalar_one_or_none()
+
+        if stored is None:
+            await self._finish(job, "failed", error="file row is missing")
+            return
+
+        title = f"#{stored.id} ({stored.orig_name})"
+
+        last_edit = 0.0
+
+        async def progress(stage: str) -> None:
+            nonlocal last_edit
+            now = time.monotonic()
+            if now - last_edit < PROGRESS_EDIT_INTERVAL_S:
+                return
+            last_edit = now
+            await self._report(job, f"✅ Файл сохранён: {title}\n⏳ Индексация: {stage}")
+
+        try:
+            n_chunks = await index_stored_file(stored, self.ollama, self.chroma, self.ingestion, progress=progress)
+        except asyncio.CancelledError:
+            # бот останавливается: задача останется running и вернётся в pending при старте
+            raise
+        except Exception as e:
+            logger.exception("index job=%s file_id=%s failed (attempt %s)", job.id, stored.id, job.attempts)
+            if job.attempts < self.max_attempts:
+                await self._finish(job, "pending", error=str(e)[:1024], retry_in_s=30 * job.attempts)
+                await self._report(
+                    job,
+                    f"✅ Файл сохранён: {title}\n⏳ Индексация: ошибка, повторю позже "
+                    f"(попытка {job.attempts}/{self.max_attempts})",
+                )
+            else:
+                await self._finish(job, "failed", error=str(e)[:1024])
+                await self._report(job, f"✅ Файл сохранён: {title}\n⚠️ Индексация не удалась (см. логи).")
+            return
+
+        await self._finish(job, "done")
+        if n_chunks:
+            await self._report(job, f"✅ Файл сохранён и проиндексирован: {title}")
+        else:
+            await self._report(job, f"✅ Файл сохранён: {title}\n⚠️ Не удалось извлечь текст для индексации.")
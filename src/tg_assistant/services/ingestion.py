@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable
+
+from tg_assistant.config import settings
+from tg_assistant.services.document_parser import (
+    Page,
+    PageChunk,
+    PageChunker,
+    chunk_text,
+    document_page_count,
+    extract_page_window,
+    extract_pages,
+)
+from tg_assistant.services.text_cache import (
+    CachedPagesWriter,
+    iter_cached_pages,
+    read_cached_pages,
+    text_cache_path,
+    write_cached_pages,
+)
+
+logger = logging.getLogger(__name__)
+
+_BROKEN_CACHE_ERRORS = (OSError, EOFError, ValueError, UnicodeDecodeError)
+
+
+def extract_and_chunk(path: str, mime: str | None, sha256: str | None = None) -> list[str]:
+    """
+    Выполняется в процессе-воркере: парсинг документа и нарезка на чанки.
+    С sha256 текст читается из кэша под data_dir, а после парсинга — кладётся туда.
+    """
+    use_cache = sha256 is not None and settings.text_cache_enabled
+    pages = read_cached_pages(sha256) if use_cache else None
+    if pages is None:
+        pages = extract_pages(Path(path), mime)
+        if use_cache:
+            try:
+                write_cached_pages(sha256, pages)
+            except OSError:
+                logger.exception("text cache: failed to store sha256=%s", sha256)
+    return chunk_text("\n".join(t for _, t in pages))
+
+
+def _page_count(path: str, mime: str | None) -> int:
+    return document_page_count(Path(path), mime)
+
+
+def _page_window(path: str, mime: str | None, start: int, end: int) -> list[Page]:
+    return extract_page_window(Path(path), mime, start, end)
+
+
+class IngestionPool:
+    """
+    Пул процессов для CPU-тяжёлой части индексации (pypdf/docx + chunk_text),
+    чтобы большой документ не блокировал event loop бота.
+    """
+
+    def __init__(self, max_workers: int | None = None, max_pending: int | None = None):
+        self.max_workers = max(1, max_workers or settings.ingest_workers)
+        # ограничиваем число задач в очереди пула: лишние ждут на семафоре, а не копятся в executor
+        self._slots = asyncio.Semaphore(max_pending or self.max_workers * 2)
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self._executor is None:
+            # spawn: не форкаем процесс с работающим event loop и потоками
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("ingestion pool started workers=%s", self.max_workers)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            self.start()
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def extract_chunks(self, path: Path, mime: str | None, sha256: str | None = None) -> list[str]:
+        return await self._submit(extract_and_chunk, str(path), mime, sha256)
+
+    async def iter_pages(
+        self,
+        path: Path,
+        mime: str | None,
+        sha256: str | None = None,
+        window: int | None = None,
+    ) -> AsyncIterator[Page]:
+        """
+        Потоковое извлечение: страницы парсятся в пуле окнами по `window` штук,
+        следующее окно парсится, пока потребитель обрабатывает текущее.
+        В памяти одновременно не больше двух окон, сколько бы страниц ни было в документе.
+        """
+        window = max(1, window or settings.ingest_page_window)
+        use_cache = sha256 is not None and settings.text_cache_enabled
+
+        cached = iter_cached_pages(sha256) if use_cache else None
+        if cached is not None:
+            try:
+                while True:
+                    batch = await asyncio.to_thread(lambda: list(islice(cached, window)))
+                    if not batch:
+                        return
+                    for page in batch:
+                        yield page
+            except _BROKEN_CACHE_ERRORS:
+                # битый кэш удаляем, чтобы повторная попытка распарсила документ заново
+                text_cache_path(sha256).unlink(missing_ok=True)
+                raise
+
+        n_pages = await self._submit(_page_count, str(path), mime)
+        writer = await asyncio.to_thread(CachedPagesWriter, sha256) if use_cache else None
+        committed = False
+        nxt: asyncio.Future | None = None
+        try:
+            if n_pages:
+                nxt = asyncio.ensure_future(self._submit(_page_window, str(path), mime, 0, window))
+            for start in range(0, n_pages, window):
+                assert nxt is not None
+                pages = await nxt
+                nxt = None
+                if start + window < n_pages:
+                    nxt = asyncio.ensure_future(
+                        self._submit(_page_window, str(path), mime, start + window, start + 2 * window)
+                    )
+                if writer is not None:
+                    await asyncio.to_thread(writer.write, pages)
+                for page in pages:
+                    yield page
+            if writer is not None:
+                await asyncio.to_thread(writer.commit)
+                committed = True
+        finally:
+            if nxt is not None:
+                nxt.cancel()
+            if writer is not None and not committed:
+                writer.abort()
+
+    async def iter_chunks(
+        self,
+        path: Path,
+        mime: str | None,
+        sha256: str | None = None,
+    ) -> AsyncIterator[PageChunk]:
+        """Чанки документа с номерами страниц по мере парсинга (перекрытие идёт через границы страниц)."""
+        chunker = PageChunker()
+        pages = self.iter_pages(path, mime, sha256)
+        try:
+            async for page_no, text in pages:
+                for chunk in chunker.feed(page_no, text):
+                    yield chunk
+        finally:
+            await pages.aclose()
+        for chunk in chunker.finish():
+            yield chunk
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any
+
+from tg_assistant.config import settings
+from tg_assistant.services.ollama_service import OllamaService
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("file", "link", "qa")
+
+_SEND = r"(пришли|пришлите|скинь|скиньте|кинь|киньте|отправь|отправьте|дай|дайте|верни|найди|найдите|покажи)"
+_FILE = r"(файл\w*|документ\w*|pdf|docx?|презентаци\w*|методичк\w*|конспект\w*|скан\w*)"
+_LINK = r"(ссылк\w*|линк\w*|url|урл\w*|сайт\w*)"
+_QUESTION = r"(что|как|почему|зачем|когда|где|кто|сколько|какой|какая|какое|какие|объясни|расскажи|подскажи)"
+
+SEND_RE = re.compile(rf"\b{_SEND}\b", re.IGNORECASE)
+FILE_RE = re.compile(rf"\b{_FILE}\b", re.IGNORECASE)
+LINK_RE = re.compile(rf"\b{_LINK}\b", re.IGNORECASE)
+QUESTION_RE = re.compile(rf"^\s*{_QUESTION}\b", re.IGNORECASE)
+
+# Примеры запросов, из которых считаются центроиды интентов (эмбеддинги кэшируются вместе с остальными)
+EXAMPLES: dict[str, list[str]] = {
+    "file": [
+        "пришли файл с расписанием",
+        "скинь документ по практике",
+        "нужна методичка по лабораторной работе",
+        "отправь pdf с договором",
+        "где тот конспект по матанализу",
+        "дай презентацию с защиты",
+        "верни мой скан паспорта",
+        "найди документ про стипендию",
+    ],
+    "link": [
+        "скинь ссылку на сайт университета",
+        "пришли ссылку на статью про нейросети",
+        "дай линк на гитхаб репозиторий",
+        "где та ссылка на видео лекции",
+        "отправь url личного кабинета",
+        "найди сохранённую ссылку на курс",
+        "ссылка на расписание экзаменов",
+        "верни адрес сайта с документацией",
+    ],
+    "qa": [
+        "как подать заявление на перевод",
+        "что нужно для получения стипендии",
+        "когда начинается сессия",
+        "объясни, как устроен отбор на практику",
+        "сколько длится учебный семестр",
+        "почему не засчитали лабораторную",
+        "какие требования к курсовой работе",
+        "расскажи, что написано про пересдачи",
+    ],
+}
+
+
+@dataclass
+class IntentDecision:
+    intent: str
+    query: str
+    tier: str  # rules | centroids | llm
+    confidence: float = 1.0
+
+
+async def classify_with_llm(ollama: OllamaService, text: str) -> IntentDecision:
+    data = await ollama.classify_intent(text)
+    intent = (data or {}).get("intent", "qa")
+    if intent not in INTENTS:
+        intent = "qa"
+    return IntentDecision(intent, (data or {}).get("query") or text, "llm")
+
+
+def match_rules(text: str) -> str | None:
+    """Однозначные запросы: глагол «пришли/скинь» + тип объекта, либо вопрос без упоминания объектов."""
+    is_file = FILE_RE.search(text) is not None
+    is_link = LINK_RE.search(text) is not None
+    if SEND_RE.search(text):
+        if is_file and not is_link:
+            return "file"
+        if is_link and not is_file:
+            return "link"
+        return None
+    if QUESTION_RE.search(text) and not is_file and not is_link:
+        return "qa"
+    return None
+
+
+def _normalize(v: list[float]) -> list[float]:
+    n = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / n for x in v]
+
+
+def _dot(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class IntentRouter:
+    """
+    Каскад перед LLM-классификатором: regex-правила -> близость к центроидам интентов -> LLM.
+    LLM вызывается, только если первые два уровня не уверены.
+    """
+
+    def __init__(
+        self,
+        ollama: OllamaService,
+        min_sim: float | None = None,
+        margin: float | None = None,
+    ):
+        self.ollama = ollama
+        self.min_sim = settings.intent_centroid_min_sim if min_sim is None else min_sim
+        self.margin = settings.intent_centroid_margin if margin is None else margin
+        self._centroids: dict[str, list[float]] | None = None
+        self._lock = asyncio.Lock()
+        # сколько решений принял каждый уровень и сколько времени на них ушло
+        self.decisions: Counter[str] = Counter()
+        self.time_s: defaultdict[str, float] = defaultdict(float)
+
+    async def centroids(self) -> dict[str, list[float]]:
+        if self._centroids is None:
+            async with self._lock:
+                if self._centroids is None:
+                    texts = [t for intent in INTENTS for t in EXAMPLES[intent]]
+                    vectors = iter(await self.ollama.embed(texts))
+                    centroids: dict[str, list[float]] = {}
+                    for intent in INTENTS:
+                        vs = [_normalize(next(vectors)) for _ in EXAMPLES[intent]]
+                        centroids[intent] = _normalize([sum(col) / len(vs) for col in zip(*vs)])
+                    self._centroids = centroids
+                    logger.info("intent router: centroids ready (%s examples)", len(texts))
+        return self._centroids
+
+    async def match_centroids(self, embedding: list[float]) -> tuple[str | None, float]:
+        """Интент ближайшего центроида и отрыв от второго; None — если отрыв или сходство малы."""
+        q = _normalize(embedding)
+        sims = sorted(((_dot(q, c), intent) for intent, c in (await self.centroids()).items()), reverse=True)
+        (best_sim, best), (second_sim, _) = sims[0], sims[1]
+        gap = best_sim - second_sim
+        if best_sim < self.min_sim or gap < self.margin:
+            return None, gap
+        return best, gap
+
+    async def route(
+        self,
+        text: str,
+        embedding: asyncio.Future[list[float]] | list[float] | None = None,
+    ) -> IntentDecision:
+        """
+        embedding — вектор запроса или future с ним (обычно уже считается для спекулятивного поиска);
+        без него второй уровень эмбеддит текст сам.
+        """
+        t0 = time.perf_counter()
+        decision = await self._route(text, embedding)
+        self.time_s[decision.tier] += time.perf_counter() - t0
+        self.decisions[decision.tier] += 1
+        if sum(self.decisions.values()) % 100 == 0:
+            logger.info("intent router stats: %s", self.stats())
+        return decision
+
+    async def _route(
+        self,
+        text: str,
+        embedding: asyncio.Future[list[float]] | list[float] | None,
+    ) -> IntentDecision:
+        intent = match_rules(text)
+        if intent is not None:
+            return IntentDecision(intent, text, "rules")
+
+        try:
+            if embedding is None:
+                vec = (await self.ollama.embed([text]))[0]
+            elif isinstance(embedding, list):
+                vec = embedding
+            else:
+                vec = await embedding
+            intent, gap = await self.match_centroids(vec)
+        except Exception:
+            logger.warning("intent router: centroid tier failed, falling back to LLM", exc_info=True)
+            intent, gap = None, 0.0
+        if intent is not None:
+            return IntentDecision(intent, text, "centroids", confidence=gap)
+
+        return await classify_with_llm(self.ollama, text)
+
+    def stats(self) -> dict[str, Any]:
+        total = sum(self.decisions.values())
+        return {
+            tier: {
+                "count": self.decisions[tier],
+                "share": round(self.decisions[tier] / total, 3) if total else 0.0,
+                "avg_ms": round(self.time_s[tier] / self.decisions[tier] * 1000, 1) if self.decisions[tier] else 0.0,
+            }
+            for tier in ("rules", "centroids", "llm")
+        }
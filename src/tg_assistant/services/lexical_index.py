@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Hashable
+
+from sqlalchemy.engine import make_url
+
+from tg_assistant.config import settings
+from tg_assistant.services.chroma_service import ChromaListener, match_where
+
+logger = logging.getLogger(__name__)
+
+# слова, которые есть почти в каждом запросе и ничего не говорят о документе
+STOPWORDS = {
+    "и", "в", "во", "не", "что", "как", "на", "с", "со", "а", "по", "к", "у", "из", "за", "о", "об", "от",
+    "для", "это", "мне", "мой", "моя", "мои", "я", "ты", "где", "когда", "какой", "какая", "какие",
+    "про", "при", "до", "под", "над", "без", "через", "или", "но", "же", "ли", "бы", "то", "так", "вот",
+    "там", "тут", "все", "всё", "он", "она", "они", "мы", "вы", "меня", "нам", "нас", "его", "её", "их",
+    "есть", "был", "была", "было", "нужен", "нужна", "нужно", "надо", "пожалуйста", "тот", "та", "те",
+    "пришли", "скинь", "отправь", "дай", "найди", "покажи", "файл", "файлы", "ссылку", "ссылка", "документ",
+}
+MAX_QUERY_TERMS = 16
+
+# поля метаданных, у которых в chunk_texts есть свои колонки
+_WHERE_COLUMNS = ("user_id", "entity_type", "entity_id")
+
+
+def sqlite_path(database_url: str) -> Path | None:
+    url = make_url(database_url)
+    if not url.drivername.startswith("sqlite") or not url.database or url.database == ":memory:":
+        return None
+    return Path(url.database)
+
+
+def fts_query(text: str) -> str:
+    """
+    Запрос FTS5 из свободного текста: OR по значимым словам.
+    Морфологии в unicode61 нет, поэтому длинные слова ищутся по префиксу («договора» -> «догов*»).
+    """
+    terms: list[str] = []
+    for tok in re.findall(r"\w+", text.lower()):
+        if len(tok) < 2 or tok in STOPWORDS:
+            continue
+        if tok.isalpha() and len(tok) > 5:
+            term = f'"{tok[:max(4, len(tok) - 2)]}"*'
+        else:
+            term = f'"{tok}"'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms[:MAX_QUERY_TERMS])
+
+
+def where_sql(where: dict[str, Any]) -> tuple[str, list[Any]] | None:
+    """
+    where-фильтр Chroma -> условие SQL по колонкам chunk_texts. Понимает только равенства
+    по entity_type / entity_id / user_id (в том числе под $and) — так удаляются чанки файла.
+    None — фильтр сложнее, проверять надо в Python через match_where.
+    """
+    clauses = where["$and"] if set(where) == {"$and"} else [{k: v} for k, v in where.items()]
+    sql: list[str] = []
+    params: list[Any] = []
+    for clause in clauses:
+        if not isinstance(clause, dict) or len(clause) != 1:
+            return None
+        ((field, cond),) = clause.items()
+        if field not in _WHERE_COLUMNS:
+            return None
+        if isinstance(cond, dict):
+            if set(cond) != {"$eq"}:
+                return None
+            cond = cond["$eq"]
+        if not isinstance(cond, (str, int)) or isinstance(cond, bool):
+            return None
+        sql.append(f"{field} = ?")
+        params.append(cond)
+    return " AND ".join(sql), params
+
+
+def rrf_fuse(
+    ranked: list[list[dict[str, Any]]],
+    key: Callable[[dict[str, Any]], Hashable],
+    k: int | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Reciprocal rank fusion: score = sum(1 / (k + rank)) по всем спискам.
+    Из одинаковых элементов остаётся первый встреченный (векторные хиты передавать первыми — у них есть distance).
+    """
+    k = settings.rrf_k if k is None else k
+    scores: dict[Hashable, float] = {}
+    items: dict[Hashable, dict[str, Any]] = {}
+    for hits in ranked:
+        for rank, h in enumerate(hits, start=1):
+            kk = key(h)
+            scores[kk] = scores.get(kk, 0.0) + 1.0 / (k + rank)
+            items.setdefault(kk, h)
+    order = sorted(scores, key=lambda kk: scores[kk], reverse=True)
+    return [{**items[kk], "rrf": scores[kk]} for kk in order]
+
+
+def clear_winner(ranked: list[list[dict[str, Any]]], key: Callable[[dict[str, Any]], Hashable]) -> bool:
+    """Явный лидер: оба способа поиска (вектор и BM25) ставят один и тот же элемент на первое место."""
+    tops = [key(hits[0]) for hits in ranked if hits]
+    return len(tops) >= 2 and len(set(tops)) == 1
+
+
+class LexicalIndex(ChromaListener):
+    """
+    BM25-поиск по тексту чанков: таблица chunk_texts + FTS5 chunk_fts в основной SQLite-базе бота.
+    Обновляется подпиской на запись в Chroma, поэтому покрывает и файлы, и ссылки.
+    Методы синхронные (вызываются из потоков Chroma); из async-кода — search_async.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or sqlite_path(settings.database_url)
+        if self.path is None:
+            raise ValueError("lexical index needs a file-backed SQLite database")
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # основная база: пишет ещё и бот через aiosqlite, поэтому ждём блокировку, а не падаем
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def on_upsert(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        rows = [
+            (
+                chunk_id,
+                user_id,
+                str((meta or {}).get("entity_type", "")),
+                int((meta or {}).get("entity_id", 0)),
+                json.dumps(meta or {}, ensure_ascii=False),
+                doc or "",
+            )
+            for chunk_id, doc, meta in zip(ids, documents, metadatas)
+        ]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO chunk_texts (chunk_id, user_id, entity_type, entity_id, metadata_json, text) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(chunk_id) DO UPDATE SET user_id = excluded.user_id, "
+                    "entity_type = excluded.entity_type, entity_id = excluded.entity_id, "
+                    "metadata_json = excluded.metadata_json, text = excluded.text",
+                    rows,
+                )
+
+    def on_delete(self, user_id: int, where: dict[str, Any]) -> None:
+        translated = where_sql(where)
+        with self._lock:
+            conn = self._connect()
+            if translated is not None:
+                cond, params = translated
+                with conn:
+                    conn.execute(
+                        "DELETE FROM chunk_texts WHERE user_id = ?" + (f" AND {cond}" if cond else ""),
+                        [user_id, *params],
+                    )
+                return
+            candidates = conn.execute(
+                "SELECT id, metadata_json FROM chunk_texts WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            doomed = [(row_id,) for row_id, meta in candidates if match_where(json.loads(meta), where)]
+            if doomed:
+                with conn:
+                    conn.executemany("DELETE FROM chunk_texts WHERE id = ?", doomed)
+
+    def on_drop(self, user_id: int) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM chunk_texts WHERE user_id = ?", (user_id,))
+
+    def search(
+        self,
+        user_id: int,
+        query: str,
+        limit: int = 60,
+        entity_type: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Хиты в формате ChromaService.query_by_embedding, отсортированные по BM25; distance нет."""
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT t.chunk_id, t.text, t.metadata_json, bm25(chunk_fts) AS score "
+            "FROM chunk_fts JOIN chunk_texts t ON t.id = chunk_fts.rowid "
+            "WHERE chunk_fts MATCH ? AND t.user_id = ?"
+        )
+        params: list[Any] = [match, user_id]
+        if entity_type:
+            sql += " AND t.entity_type = ?"
+            params.append(entity_type)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            try:
+                rows = self._connect().execute(sql, params).fetchall()
+            except sqlite3.OperationalError:
+                logger.warning("lexical search failed for query=%r", match, exc_info=True)
+                return []
+        return [
+            {"id": chunk_id, "text": text, "metadata": json.loads(meta), "distance": None, "bm25": score}
+            for chunk_id, text, meta, score in rows
+        ]
+
+    async def search_async(
+        self,
+        user_id: int,
+        query: str,
+        limit: int = 60,
+        entity_type: str | None = None,
+    ) -> list[dict[str, Any]]:
+        return await asyncio.to_thread(self.search, user_id, query, limit, entity_type)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any
+
+from tg_assistant.config import settings
+
+if TYPE_CHECKING:
+    from tg_assistant.services.ollama_service import OllamaService
+
+logger = logging.getLogger(__name__)
+
+COLD_LOAD_S = 1.0  # load_duration больше — модель грузилась с диска, а не была в памяти
+
+
+def keep_alive_value(value: str) -> str | int:
+    """
+    keep_alive для Ollama: строку без единицы («-1», «0», «3600») отдаём числом секунд —
+    строки Ollama разбирает как Go-длительность и на «-1» отвечает 400 (missing unit).
+    """
+    try:
+        return int(value.strip())
+    except ValueError:
+        return value
+
+
+class ModelResidency:
+    """
+    Чтобы модели не выгружались из VRAM между запросами:
+    keep_alive на каждом запросе (свой для чата, эмбеддингов и reranker'а), прогрев при старте бота
+    и пинги моделей, у которых недавно был трафик, — пока их keep_alive не истёк.
+    Холодные загрузки (большой load_duration в ответе Ollama) считаются и пишутся в лог.
+    """
+
+    def __init__(self, ollama: OllamaService):
+        self.ollama = ollama
+        # модель -> (вид запроса для загрузки, keep_alive)
+        self.models: dict[str, tuple[str, str | int]] = {}
+        for model, kind, keep_alive in (
+            (settings.ollama_chat_model, "chat", settings.ollama_keep_alive_chat),
+            (settings.ollama_embed_model, "embed", settings.ollama_keep_alive_embed),
+            (settings.ollama_rerank_model, "generate", settings.ollama_keep_alive_rerank),
+        ):
+            self.models.setdefault(model, (kind, keep_alive_value(keep_alive)))
+        self.last_used: dict[str, float] = {}  # реальный трафик
+        self.last_touch: dict[str, float] = {}  # трафик или пинг — когда продлевался keep_alive
+        self.requests: Counter[str] = Counter()
+        self.cold_loads: Counter[str] = Counter()
+
+    def keep_alive_for(self, model: str | None) -> str | int | None:
+        entry = self.models.get(model or "")
+        return entry[1] if entry else None
+
+    def with_keep_alive(self, payload: dict[str, Any]) -> dict[str, Any]:
+        keep_alive = self.keep_alive_for(payload.get("model"))
+        if keep_alive is None or "keep_alive" in payload:
+            return payload
+        return {**payload, "keep_alive": keep_alive}
+
+    def observe(self, model: str | None, data: dict[str, Any]) -> None:
+        """Вызывается после каждого ответа Ollama (для стрима — по финальному чанку)."""
+        if not model:
+            return
+        now = time.monotonic()
+        self.last_used[model] = now
+        self.last_touch[model] = now
+        self.requests[model] += 1
+        load_s = (data.get("load_duration") or 0) / 1e9
+        if load_s > COLD_LOAD_S:
+            self.cold_loads[model] += 1
+            logger.warning(
+                "cold start: model=%s load=%.1fs (%s of %s requests)",
+                model, load_s, self.cold_loads[model], self.requests[model],
+            )
+
+    async def warmup(self) -> None:
+        """Загружает все настроенные модели по очереди (параллельно они вытесняли бы друг друга)."""
+        for model, (kind, keep_alive) in self.models.items():
+            t0 = time.perf_counter()
+            loads = await self.ollama.load_model(model, kind, keep_alive)
+            self.last_touch[model] = time.monotonic()
+            logger.info(
+                "warmup: model=%s nodes=%s load=%s total=%.1fs",
+                model, len(loads), [round(x, 1) for x in loads], time.perf_counter() - t0,
+            )
+
+    async def ping_idle(self) -> None:
+        """
+        Продлевает keep_alive моделям, у которых был трафик за residency_active_window_s,
+        но не было запросов последние residency_ping_interval_s. Совсем неактивные не трогаем —
+        пусть выгружаются и освобождают память.
+        """
+        now = time.monotonic()
+        for model, (kind, keep_alive) in self.models.items():
+            used = self.last_used.get(model)
+            if used is None or now - used > settings.residency_active_window_s:
+                continue
+            if now - self.last_touch.get(model, 0.0) < settings.residency_ping_interval_s:
+                continue
+            loads = await self.ollama.load_model(model, kind, keep_alive)
+            self.last_touch[model] = time.monotonic()
+            if any(x > COLD_LOAD_S for x in loads):
+                logger.info("keepalive ping: model=%s was unloaded, reloaded in %.1fs", model, max(loads))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            model: {
+                "requests": self.requests[model],
+                "cold_loads": self.cold_loads[model],
+                "cold_rate": round(self.cold_loads[model] / self.requests[model], 3) if self.requests[model] else 0.0,
+            }
+            for model in self.models
+        }
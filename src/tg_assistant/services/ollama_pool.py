@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+from tg_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendError(RuntimeError):
+    pass
+
+
+@dataclass
+class OllamaEndpoint:
+    url: str
+    models: frozenset[str] | None  # None — узел обслуживает любые модели
+    outstanding: int = 0
+    failures: int = 0  # ошибок подряд
+    open_until: float = 0.0  # до этого момента узел выведен из ротации
+    probe_claimed: bool = False  # пробный запрос после cooldown выдан — остальным узел пока недоступен
+    probing: bool = False  # пробный запрос в полёте (track)
+    stats: Counter[str] = field(default_factory=Counter)  # requests / failures / ejections / probes
+
+    def serves(self, model: str | None) -> bool:
+        return self.models is None or model is None or model in self.models
+
+
+class OllamaPool:
+    """
+    Несколько бэкендов Ollama: узел выбирается по наименьшему числу запросов в полёте
+    среди тех, что обслуживают модель. Circuit breaker: после breaker_failures ошибок подряд
+    узел выводится на cooldown_s, затем получает ровно один пробный запрос (half-open):
+    успех возвращает узел в ротацию, ошибка — снова выводит на cooldown_s.
+    """
+
+    def __init__(
+        self,
+        backends: list[tuple[str, frozenset[str] | None]] | None = None,
+        breaker_failures: int | None = None,
+        cooldown_s: float | None = None,
+    ):
+        self.endpoints = [OllamaEndpoint(url, models) for url, models in (backends or settings.ollama_backends)]
+        self.breaker_failures = breaker_failures or settings.ollama_breaker_failures
+        self.cooldown_s = settings.ollama_breaker_cooldown_s if cooldown_s is None else cooldown_s
+
+    def state(self, ep: OllamaEndpoint, now: float | None = None) -> str:
+        """closed — в ротации; open — на cooldown; half_open — cooldown прошёл, ждёт пробного запроса."""
+        if ep.failures < self.breaker_failures:
+            return "closed"
+        if (time.monotonic() if now is None else now) < ep.open_until:
+            return "open"
+        return "half_open"
+
+    def pick(self, model: str | None, exclude: list[OllamaEndpoint] | None = None) -> OllamaEndpoint:
+        candidates = [ep for ep in self.endpoints if ep.serves(model)]
+        if not candidates:
+            raise NoBackendError(f"no Ollama endpoint serves model {model!r}")
+        fresh = [ep for ep in candidates if ep not in (exclude or [])] or candidates
+        now = time.monotonic()
+        usable = [
+            ep
+            for ep in fresh
+            if self.state(ep, now) == "closed" or (self.state(ep, now) == "half_open" and not ep.probe_claimed)
+        ]
+        if usable:
+            ep = min(usable, key=lambda ep: ep.outstanding)
+            if self.state(ep, now) == "half_open":
+                # этот запрос — пробный; до его исхода узел другим не выдаём
+                ep.probe_claimed = True
+                ep.stats["probes"] += 1
+                logger.info("ollama pool: probing %s", ep.url)
+            return ep
+        # все выведены — пробуем тот, что вернётся раньше всех, а не отказываем сразу
+        return min(fresh, key=lambda ep: (ep.probe_claimed, ep.open_until))
+
+    @contextmanager
+    def track(
+        self,
+        ep: OllamaEndpoint,
+        is_failure: Callable[[BaseException], bool] | None = None,
+    ) -> Iterator[None]:
+        """
+        Учёт запроса в полёте и его исхода для breaker: блок завершился — успех,
+        исключение, для которого is_failure истинно, — ошибка узла. Прочие исключения
+        (ошибка самого запроса, отмена) узел не характеризуют: пробу просто отпускаем.
+        """
+        # пробный — первый запрос, вошедший в track после pick; запросы, начатые до вывода узла, — нет
+        probe = ep.probe_claimed and not ep.probing
+        if probe:
+            ep.probing = True
+        ep.outstanding += 1
+        ep.stats["requests"] += 1
+        try:
+            yield
+        except BaseException as e:
+            if is_failure is not None and is_failure(e):
+                self.record_failure(ep, e)
+            raise
+        else:
+            self.record_success(ep)
+        finally:
+            ep.outstanding -= 1
+            if probe:
+                ep.probe_claimed = ep.probing = False
+
+    def record_success(self, ep: OllamaEndpoint) -> None:
+        if ep.failures >= self.breaker_failures:
+            logger.info("ollama pool: %s is back", ep.url)
+        ep.failures = 0
+        ep.open_until = 0.0
+
+    def record_failure(self, ep: OllamaEndpoint, error: BaseException) -> None:
+        ep.failures += 1
+        ep.stats["failures"] += 1
+        if ep.failures >= self.breaker_failures:
+            ep.open_until = time.monotonic() + self.cooldown_s
+            ep.stats["ejections"] += 1
+            logger.warning(
+                "ollama pool: %s ejected for %.0fs after %s failures (%s)%s",
+                ep.url, self.cooldown_s, ep.failures, type(error).__name__, " — probe failed" if ep.probing else "",
+            )
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "url": ep.url,
+                "models": sorted(ep.models) if ep.models else "*",
+                "state": "probing" if ep.probe_claimed else self.state(ep, now),
+                "outstanding": ep.outstanding,
+                **ep.stats,
+            }
+            for ep in self.endpoints
+        ]
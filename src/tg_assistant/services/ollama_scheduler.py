@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter, defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from tg_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета, от высшего к низшему
+INTERACTIVE = "interactive"  # ответ в чат, интент, rerank, эмбеддинг запроса
+NORMAL = "normal"  # пользователь ждёт, но не ответа модели (эмбеддинг сохранённой ссылки)
+BACKGROUND = "background"  # индексация документов
+PRIORITIES = (INTERACTIVE, NORMAL, BACKGROUND)
+
+SLOW_WAIT_S = 1.0  # дольше — пишем в лог
+
+
+class OllamaScheduler:
+    """
+    Допуск запросов к Ollama: общий лимит одновременных запросов и лимит на каждый класс.
+    Освободившийся слот получает самый приоритетный ждущий, поэтому фоновая индексация
+    уступает чату. Для интерактивных классов дедлайн = время вызова + timeout_s: ожидание в очереди
+    тратит тот же бюджет. Фоновые ждут слот отдельно (queue_timeouts) — уступить чату значит
+    задержать индексацию, а не провалить её; timeout_s для них отсчитывается от допуска.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int | None = None,
+        limits: dict[str, int] | None = None,
+        queue_timeouts: dict[str, float] | None = None,
+    ):
+        self.max_inflight = max_inflight or settings.ollama_max_inflight
+        self.limits = limits or {
+            INTERACTIVE: settings.ollama_concurrency_interactive,
+            NORMAL: settings.ollama_concurrency_normal,
+            BACKGROUND: settings.ollama_concurrency_background,
+        }
+        # класс -> предел ожидания в очереди, с; нет в словаре — ждёт в счёт timeout_s
+        self.queue_timeouts = (
+            queue_timeouts if queue_timeouts is not None else {BACKGROUND: settings.ollama_background_queue_timeout_s}
+        )
+        if self.limits[INTERACTIVE] >= self.max_inflight:
+            logger.warning(
+                "ollama scheduler: interactive limit %s >= max_inflight %s, background work can be starved",
+                self.limits[INTERACTIVE], self.max_inflight,
+            )
+        self._inflight: Counter[str] = Counter()
+        self._queues: dict[str, deque[asyncio.Future[None]]] = {p: deque() for p in PRIORITIES}
+        # admitted / timeouts по классам; время ожидания — суммарное и максимальное
+        self.counters: defaultdict[str, Counter[str]] = defaultdict(Counter)
+        self.wait_s: defaultdict[str, float] = defaultdict(float)
+        self.max_wait_s: defaultdict[str, float] = defaultdict(float)
+
+    def _can_run(self, priority: str) -> bool:
+        return sum(self._inflight.values()) < self.max_inflight and self._inflight[priority] < self.limits[priority]
+
+    def _queued_ahead(self, priority: str) -> bool:
+        """Есть ли ждущие того же или более высокого приоритета (их не обгоняем)."""
+        for p in PRIORITIES:
+            if any(not f.done() for f in self._queues[p]):
+                return True
+            if p == priority:
+                return False
+        return False
+
+    def _wake(self) -> None:
+        for p in PRIORITIES:
+            q = self._queues[p]
+            while q and self._can_run(p):
+                fut = q.popleft()
+                if fut.done():  # ждущий ушёл по таймауту или отмене
+                    continue
+                self._inflight[p] += 1
+                fut.set_result(None)
+
+    def _release(self, priority: str) -> None:
+        self._inflight[priority] -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: str, timeout_s: float) -> AsyncIterator[float]:
+        """Ждёт слот; отдаёт остаток бюджета в секундах — его и ставить таймаутом HTTP-запроса."""
+        if priority not in self.limits:
+            raise ValueError(f"unknown priority: {priority}")
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        queue_timeout_s = self.queue_timeouts.get(priority)
+        wait_s = timeout_s if queue_timeout_s is None else queue_timeout_s
+
+        if not self._queued_ahead(priority) and self._can_run(priority):
+            self._inflight[priority] += 1
+        else:
+            fut: asyncio.Future[None] = loop.create_future()
+            self._queues[priority].append(fut)
+            try:
+                async with asyncio.timeout_at(t0 + wait_s):
+                    await fut
+            except BaseException as e:
+                if fut.done() and not fut.cancelled():
+                    self._release(priority)  # слот выдали, но забрать его уже некому
+                else:
+                    fut.cancel()
+                    try:
+                        self._queues[priority].remove(fut)
+                    except ValueError:
+                        pass
+                if isinstance(e, TimeoutError):
+                    self.counters[priority]["timeouts"] += 1
+                    logger.warning("ollama scheduler: %s request timed out in queue after %.1fs", priority, wait_s)
+                raise
+
+        waited = loop.time() - t0
+        deadline = t0 + timeout_s if queue_timeout_s is None else loop.time() + timeout_s
+        self.counters[priority]["admitted"] += 1
+        self.wait_s[priority] += waited
+        self.max_wait_s[priority] = max(self.max_wait_s[priority], waited)
+        if waited > SLOW_WAIT_S:
+            logger.info(
+                "ollama scheduler: %s waited %.1fs (queued=%s inflight=%s)",
+                priority, waited, self.depth(), dict(self._inflight),
+            )
+        if sum(c["admitted"] for c in self.counters.values()) % 100 == 0:
+            logger.info("ollama scheduler stats: %s", self.stats())
+        try:
+            yield max(deadline - loop.time(), 0.001)
+        finally:
+            self._release(priority)
+
+    def depth(self) -> dict[str, int]:
+        return {p: sum(1 for f in q if not f.done()) for p, q in self._queues.items()}
+
+    def stats(self) -> dict[str, Any]:
+        depth = self.depth()
+        out: dict[str, Any] = {}
+        for p in PRIORITIES:
+            admitted = self.counters[p]["admitted"]
+            out[p] = {
+                "queued": depth[p],
+                "inflight": self._inflight[p],
+                "admitted": admitted,
+                "timeouts": self.counters[p]["timeouts"],
+                "avg_wait_ms": round(self.wait_s[p] / admitted * 1000, 1) if admitted else 0.0,
+                "max_wait_ms": round(self.max_wait_s[p] * 1000, 1),
+            }
+        return out
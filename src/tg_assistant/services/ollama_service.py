@@ -1,17 +1,214 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import itertools
+import json
+import logging
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
 
 import aiohttp
 from aiohttp import ClientTimeout
 
 from tg_assistant.config import settings
+from tg_assistant.services.embedding_cache import EmbeddingCache
+from tg_assistant.services.model_residency import ModelResidency
+from tg_assistant.services.ollama_pool import OllamaEndpoint, OllamaPool
+from tg_assistant.services.ollama_scheduler import BACKGROUND, INTERACTIVE, OllamaScheduler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EmbedRequest:
+    texts: list[str]
+    future: asyncio.Future[list[list[float]]]
+    timeout_s: int
+    priority: str
+
+
+def truncate_embedding(vec: list[float], dim: int) -> list[float]:
+    """
+    Matryoshka-усечение: первые dim компонент, снова нормированные на единичную длину.
+    Модели, обученные с MRL (nomic-embed-text v1.5/v2), держат смысл в начале вектора.
+    """
+    if dim > len(vec):
+        raise ValueError(f"embed_dim={dim} exceeds model dimension {len(vec)}")
+    if dim <= 0 or dim == len(vec):
+        return vec
+    head = vec[:dim]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+
+class EmbedBatcher:
+    """
+    Склеивает одновременные embed() разных запросов в один /api/embed: первый вызов ждёт window_s,
+    за это время подтягиваются остальные. Батч больше max_batch текстов режется на части,
+    части уходят по очереди — большой батч индексации не забивает Ollama целиком.
+    Вызовы разных приоритетов в один батч не попадают. Если часть упала не по вине узла
+    (node_failure ложно — например, 4xx на чей-то текст), тексты повторяются отдельно
+    по вызывающим: ошибка достаётся только тому, чей запрос её вызвал.
+    """
+
+    def __init__(
+        self,
+        post: Callable[[list[str], str, int, str], Awaitable[list[list[float]]]],
+        window_s: float | None = None,
+        max_batch: int | None = None,
+        node_failure: Callable[[BaseException], bool] | None = None,
+    ):
+        self._post = post
+        self._node_failure = node_failure or (lambda e: False)
+        self.window_s = settings.embed_batch_window_ms / 1000 if window_s is None else window_s
+        self.max_batch = max_batch or settings.embed_max_batch
+        self._pending: dict[tuple[str, str], list[_EmbedRequest]] = {}  # (модель, приоритет) -> ждущие вызовы
+        self._timers: dict[tuple[str, str], asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stats: Counter[str] = Counter()  # calls / batches / http_requests / texts / isolated
+
+    async def embed(
+        self,
+        texts: list[str],
+        model: str,
+        timeout_s: int,
+        priority: str = INTERACTIVE,
+    ) -> list[list[float]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        req = _EmbedRequest(texts, loop.create_future(), timeout_s, priority)
+        key = (model, priority)
+        pending = self._pending.setdefault(key, [])
+        pending.append(req)
+        self.stats["calls"] += 1
+        if sum(len(r.texts) for r in pending) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window_s, self._flush, key)
+        return await req.future
+
+    def _flush(self, key: tuple[str, str]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if batch:
+            task = asyncio.create_task(self._run(key[0], batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, model: str, batch: list[_EmbedRequest]) -> None:
+        # короткие вызовы (запросы пользователей) вперёд: они получат ответ после первой же части,
+        # не дожидаясь, пока досчитается большой батч индексации
+        batch = sorted(batch, key=lambda r: len(r.texts))
+        texts = list(dict.fromkeys(t for r in batch for t in r.texts))
+        timeout_s = max(r.timeout_s for r in batch)
+        priority = batch[0].priority
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(texts)
+
+        by_text: dict[str, list[float]] = {}
+        failed: dict[str, BaseException] = {}
+        waiting = list(batch)
+        try:
+            for start in range(0, len(texts), self.max_batch):
+                part = texts[start : start + self.max_batch]
+                self.stats["http_requests"] += 1
+                try:
+                    vectors = await self._post(part, model, timeout_s, priority)
+                    if len(vectors) != len(part):
+                        raise ValueError(f"got {len(vectors)} embeddings for {len(part)} texts")
+                    by_text.update(zip(part, vectors))
+                except Exception as e:
+                    owners = [r for r in waiting if not r.future.done() and not set(r.texts).isdisjoint(part)]
+                    if len(owners) > 1 and not self._node_failure(e):
+                        await self._isolate(owners, set(part), by_text, model, timeout_s, priority)
+                    else:
+                        failed.update((t, e) for t in part)
+                waiting = [r for r in waiting if not self._resolve(r, by_text, failed)]
+            # сюда попадать не должны, но зависший навсегда вызывающий хуже ошибки
+            for r in waiting:
+                if not r.future.done():
+                    r.future.set_exception(RuntimeError("embed batch finished without a result for this call"))
+        except BaseException as e:
+            # отменили сам батч (остановка бота) — не оставляем вызывающих ждать вечно
+            for r in waiting:
+                if not r.future.done():
+                    r.future.set_exception(e)
+            raise
+
+    async def _isolate(
+        self,
+        owners: list[_EmbedRequest],
+        part: set[str],
+        by_text: dict[str, list[float]],
+        model: str,
+        timeout_s: int,
+        priority: str,
+    ) -> None:
+        """Повтор упавшей части отдельным запросом на каждого вызывающего; ошибка — только ему."""
+
+        async def one(r: _EmbedRequest) -> None:
+            own = [t for t in dict.fromkeys(r.texts) if t in part and t not in by_text]
+            if not own:
+                return
+            self.stats["http_requests"] += 1
+            try:
+                vectors = await self._post(own, model, timeout_s, priority)
+                if len(vectors) != len(own):
+                    raise ValueError(f"got {len(vectors)} embeddings for {len(own)} texts")
+            except Exception as e:
+                if not r.future.done():
+                    r.future.set_exception(e)
+                return
+            by_text.update(zip(own, vectors))
+
+        self.stats["isolated"] += 1
+        await asyncio.gather(*(one(r) for r in owners))
+
+    @staticmethod
+    def _resolve(
+        r: _EmbedRequest,
+        by_text: dict[str, list[float]],
+        failed: dict[str, BaseException],
+    ) -> bool:
+        """Отдаёт результат вызывающему, если все его тексты уже посчитаны (или упали)."""
+        if r.future.done():  # вызывающего уже отменили
+            return True
+        err = next((failed[t] for t in r.texts if t in failed), None)
+        if err is not None:
+            r.future.set_exception(err)
+            return True
+        if all(t in by_text for t in r.texts):
+            r.future.set_result([by_text[t] for t in r.texts])
+            return True
+        return False
 
 
 class OllamaService:
-    def __init__(self, base_url: str | None = None):
-        self.base_url = (base_url or settings.ollama_base_url).rstrip("/")
+    def __init__(
+        self,
+        base_url: str | None = None,
+        embed_cache: EmbeddingCache | None = None,
+        embed_batching: bool | None = None,
+        pool: OllamaPool | None = None,
+    ):
+        if pool is None:
+            pool = OllamaPool([(base_url.rstrip("/"), None)]) if base_url else OllamaPool()
+        self.pool = pool
         self._session: aiohttp.ClientSession | None = None
+        if embed_cache is None and settings.embed_cache_enabled:
+            embed_cache = EmbeddingCache()
+        self.embed_cache = embed_cache
+        if embed_batching is None:
+            embed_batching = settings.embed_batching_enabled
+        self.embed_batcher = EmbedBatcher(self._post_embed, node_failure=self._node_failure) if embed_batching else None
+        self.scheduler = OllamaScheduler()
+        self.residency = ModelResidency(self)
 
     async def start(self) -> None:
         if self._session is None or self._session.closed:
@@ -21,18 +218,92 @@ class OllamaService:
     async def close(self) -> None:
         if self._session is not None and not self._session.closed:
             await self._session.close()
+        if self.embed_cache is not None:
+            self.embed_cache.close()
+
+    @staticmethod
+    def _node_failure(e: BaseException) -> bool:
+        """Ошибка узла (сеть, таймаут, 5xx), а не запроса — считается в circuit breaker."""
+        if isinstance(e, aiohttp.ClientResponseError):
+            return e.status >= 500
+        return isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    @staticmethod
+    def _may_retry(e: BaseException, idempotent: bool, attempt: int) -> bool:
+        # до узла не достучались — повторить можно что угодно; иначе только идемпотентное
+        return attempt < settings.ollama_retries and (idempotent or isinstance(e, aiohttp.ClientConnectorError))
+
+    async def _post_json(
+        self,
+        path: str,
+        payload: dict[str, Any],
+        timeout_s: int,
+        priority: str = INTERACTIVE,
+        idempotent: bool = False,
+    ) -> dict[str, Any]:
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        assert self._session is not None
+        tried: list[OllamaEndpoint] = []
+        payload = self.residency.with_keep_alive(payload)
 
-    async def _post_json(self, path: str, payload: dict[str, Any], timeout_s: int) -> dict[str, Any]:
+        # timeout_s — общий бюджет: ожидание своей очереди + все попытки
+        async with self.scheduler.slot(priority, timeout_s) as remaining_s:
+            deadline = time.monotonic() + remaining_s
+            for attempt in itertools.count():
+                ep = self.pool.pick(payload.get("model"), exclude=tried)
+                tried.append(ep)
+                timeout = ClientTimeout(total=max(deadline - time.monotonic(), 0.001))
+                try:
+                    # исход запроса (успех / ошибка узла) track передаёт в circuit breaker
+                    with self.pool.track(ep, self._node_failure):
+                        async with self._session.post(f"{ep.url}{path}", json=payload, timeout=timeout) as r:
+                            r.raise_for_status()
+                            data = await r.json()
+                except Exception as e:
+                    if not self._node_failure(e):
+                        raise
+                    if not self._may_retry(e, idempotent, attempt) or time.monotonic() >= deadline:
+                        raise
+                    logger.warning("ollama %s failed on %s (%s), retrying", path, ep.url, type(e).__name__)
+                    continue
+                self.residency.observe(payload.get("model"), data)
+                return data
+        raise AssertionError("unreachable")
+
+    async def load_model(self, model: str, kind: str, keep_alive: str | int, timeout_s: int = 300) -> list[float]:
+        """
+        Загружает модель (или продлевает её keep_alive) на всех узлах, которые её обслуживают.
+        kind — чем грузить: chat / generate (пустой запрос) или embed. Возвращает load_duration по узлам, с.
+        """
         if self._session is None or self._session.closed:
             await self.start()
 
         assert self._session is not None
-        url = f"{self.base_url}{path}"
-        timeout = ClientTimeout(total=timeout_s)
+        path, payload = {
+            "chat": ("/api/chat", {"model": model, "messages": [], "stream": False}),
+            "generate": ("/api/generate", {"model": model, "prompt": "", "stream": False}),
+            "embed": ("/api/embed", {"model": model, "input": "ping"}),
+        }[kind]
+        payload["keep_alive"] = keep_alive
 
-        async with self._session.post(url, json=payload, timeout=timeout) as r:
-            r.raise_for_status()
-            return await r.json()
+        loads: list[float] = []
+        for ep in self.pool.endpoints:
+            if not ep.serves(model):
+                continue
+            try:
+                async with self.scheduler.slot(BACKGROUND, timeout_s) as remaining_s:
+                    with self.pool.track(ep, self._node_failure):
+                        async with self._session.post(
+                            f"{ep.url}{path}", json=payload, timeout=ClientTimeout(total=remaining_s)
+                        ) as r:
+                            r.raise_for_status()
+                            data = await r.json()
+                loads.append((data.get("load_duration") or 0) / 1e9)
+            except Exception:
+                logger.warning("load model=%s on %s failed", model, ep.url, exc_info=True)
+        return loads
 
     async def chat(
         self,
@@ -51,18 +322,158 @@ class OllamaService:
         )
         return data["message"]["content"]
 
+    async def chat_stream(
+        self,
+        messages: list[dict[str, str]],
+        model: str | None = None,
+        timeout_s: int = 240,
+    ) -> AsyncIterator[str]:
+        """/api/chat со stream=True: куски ответа по мере генерации (NDJSON, объект на строку)."""
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        assert self._session is not None
+        payload = self.residency.with_keep_alive(
+            {
+                "model": model or settings.ollama_chat_model,
+                "messages": messages,
+                "stream": True,
+            }
+        )
+        tried: list[OllamaEndpoint] = []
+        # слот держится до конца генерации; на другой узел уходим, только пока ничего не отдали
+        async with self.scheduler.slot(INTERACTIVE, timeout_s) as remaining_s:
+            deadline = time.monotonic() + remaining_s
+            for attempt in itertools.count():
+                ep = self.pool.pick(payload["model"], exclude=tried)
+                tried.append(ep)
+                timeout = ClientTimeout(total=max(deadline - time.monotonic(), 0.001))
+                yielded = False
+                try:
+                    with self.pool.track(ep, self._node_failure):
+                        async with self._session.post(f"{ep.url}/api/chat", json=payload, timeout=timeout) as r:
+                            r.raise_for_status()
+                            async for line in r.content:
+                                if not line.strip():
+                                    continue
+                                data = json.loads(line)
+                                if data.get("error"):
+                                    raise RuntimeError(f"ollama: {data['error']}")
+                                piece = (data.get("message") or {}).get("content") or ""
+                                if piece:
+                                    yielded = True
+                                    yield piece
+                                if data.get("done"):
+                                    self.residency.observe(payload["model"], data)
+                                    break
+                except Exception as e:
+                    if not self._node_failure(e):
+                        raise
+                    if yielded or not self._may_retry(e, False, attempt):
+                        raise
+                    logger.warning("ollama chat stream failed on %s (%s), retrying", ep.url, type(e).__name__)
+                    continue
+                return
+
+    async def generate(
+        self,
+        prompt: str,
+        model: str | None = None,
+        *,
+        raw: bool = False,
+        options: dict[str, Any] | None = None,
+        top_logprobs: int = 0,
+        timeout_s: int = 120,
+    ) -> dict[str, Any]:
+        """/api/generate без стриминга; возвращает ответ Ollama целиком (с logprobs, если просили)."""
+        payload: dict[str, Any] = {
+            "model": model or settings.ollama_chat_model,
+            "prompt": prompt,
+            "stream": False,
+            "raw": raw,
+        }
+        if options:
+            payload["options"] = options
+        if top_logprobs:
+            payload["logprobs"] = True
+            payload["top_logprobs"] = top_logprobs
+        # rerank-оценка детерминирована (temperature 0) — можно повторить на другом узле
+        return await self._post_json("/api/generate", payload, timeout_s=timeout_s, idempotent=True)
+
     async def embed(
         self,
         texts: list[str],
         model: str | None = None,
         timeout_s: int = 120,
+        priority: str = INTERACTIVE,
+        dim: int | None = None,
+    ) -> list[list[float]]:
+        """
+        priority — класс очереди к Ollama (см. ollama_scheduler); индексация передаёт BACKGROUND.
+        dim — до скольких компонент усечь векторы (0 — полные); по умолчанию settings.embed_dim
+        для модели эмбеддингов из настроек. Кэш хранит полные векторы, усечение — после него.
+        """
+        model = model or settings.ollama_embed_model
+        if dim is None:
+            dim = settings.embed_dim if model == settings.ollama_embed_model else 0
+        out = await self._embed_full(texts, model, timeout_s, priority)
+        return [truncate_embedding(v, dim) for v in out] if dim else out
+
+    async def _embed_full(
+        self,
+        texts: list[str],
+        model: str,
+        timeout_s: int,
+        priority: str,
+    ) -> list[list[float]]:
+        if self.embed_cache is None or not texts:
+            return await self._embed_remote(texts, model, timeout_s, priority)
+
+        # в модель уходят только тексты, которых нет в кэше (и каждый — один раз)
+        out = await asyncio.to_thread(self.embed_cache.get_many, model, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, out) if v is None))
+        if missing:
+            t0 = time.perf_counter()
+            fresh = await self._embed_remote(missing, model, timeout_s, priority)
+            self.embed_cache.miss_time_s += time.perf_counter() - t0
+            await asyncio.to_thread(self.embed_cache.put_many, model, missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            out = [v if v is not None else by_text[t] for t, v in zip(texts, out)]
+        return out
+
+    async def _embed_remote(
+        self,
+        texts: list[str],
+        model: str,
+        timeout_s: int,
+        priority: str = INTERACTIVE,
+    ) -> list[list[float]]:
+        if self.embed_batcher is not None:
+            return await self.embed_batcher.embed(texts, model, timeout_s, priority)
+        out: list[list[float]] = []
+        for start in range(0, len(texts), settings.embed_max_batch):
+            part = texts[start : start + settings.embed_max_batch]
+            out.extend(await self._post_embed(part, model, timeout_s, priority))
+        return out
+
+    async def _post_embed(
+        self,
+        texts: list[str],
+        model: str,
+        timeout_s: int,
+        priority: str = INTERACTIVE,
     ) -> list[list[float]]:
         data = await self._post_json(
             "/api/embed",
-            {"model": model or settings.ollama_embed_model, "input": texts},
+            {"model": model, "input": texts},
             timeout_s=timeout_s,
+            priority=priority,
+            idempotent=True,
         )
-        return data["embeddings"]
+        embeddings = data["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(f"ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+        return embeddings
 
     async def classify_intent(self, text: str, timeout_s: int = 60) -> dict[str, Any]:
         schema = {
@@ -97,6 +508,7 @@ class OllamaService:
                 ],
             },
             timeout_s=timeout_s,
+            idempotent=True,
         )
         # Ollama вернет dict, где content уже будет JSON-объектом (как dict)
         return data["message"]["content"] if isinstance(data["message"]["content"], dict) else {}
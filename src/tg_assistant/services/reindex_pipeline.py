@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from tg_assistant.config import settings
+from tg_assistant.db.models.files import StoredFile
+from tg_assistant.services.chroma_service import AsyncChromaService
+from tg_assistant.services.document_parser import PageChunk
+from tg_assistant.services.file_indexer import mark_indexed, upsert_file_chunks
+from tg_assistant.services.ingestion import IngestionPool
+from tg_assistant.services.ollama_scheduler import BACKGROUND
+from tg_assistant.services.ollama_service import OllamaService
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # маркер конца очереди
+
+Emit = Callable[[Any], Awaitable[None]]
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    items: int = 0
+    failed: int = 0
+    busy_s: float = 0.0
+
+    def utilization(self, wall_s: float) -> float:
+        if wall_s <= 0:
+            return 0.0
+        return self.busy_s / (wall_s * self.workers)
+
+
+@dataclass
+class _Doc:
+    stored: StoredFile
+    chunks: int = 0  # сколько чанков извлечено (и номер следующего)
+    pending: int = 0  # батчи, ещё не записанные в Chroma
+    extracted: bool = False
+    failed: bool = False
+
+
+@dataclass
+class _Batch:
+    doc: _Doc
+    first_index: int
+    chunks: list[PageChunk]
+    embeddings: list[list[float]] = field(default_factory=list)
+
+
+@dataclass
+class ReindexReport:
+    docs: int
+    chunks: int
+    failed: int
+    wall_s: float
+    stages: list[StageStats]
+
+    def as_lines(self) -> list[str]:
+        wall = max(self.wall_s, 1e-9)
+        lines = [
+            f"docs={self.docs} chunks={self.chunks} failed={self.failed} wall={self.wall_s:.1f}s "
+            f"docs/sec={self.docs / wall:.2f} chunks/sec={self.chunks / wall:.1f}"
+        ]
+        for st in self.stages:
+            lines.append(
+                f"  {st.name:<8} workers={st.workers} items={st.items} failed={st.failed} "
+                f"busy={st.busy_s:.1f}s util={st.utilization(self.wall_s) * 100:.0f}%"
+            )
+        return lines
+
+
+class ReindexPipeline:
+    """
+    Конвейер переиндексации: extract -> embed -> upsert.
+    Стадии связаны ограниченными очередями и имеют свою степень параллелизма,
+    поэтому GPU считает эмбеддинги, пока pypdf парсит следующие страницы, а Chroma пишет предыдущие.
+    Между стадиями ходят микро-батчи по batch_size чанков, а не документы целиком:
+    память ограничена размером очередей, сколько бы страниц ни было в файле.
+    """
+
+    def __init__(
+        self,
+        ollama: OllamaService,
+        chroma: AsyncChromaService,
+        ingestion: IngestionPool,
+        extract_workers: int = 2,
+        embed_workers: int = 1,
+        upsert_workers: int = 2,
+        queue_size: int = 4,
+        batch_size: int | None = None,
+    ):
+        self.ollama = ollama
+        self.chroma = chroma
+        self.ingestion = ingestion
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size or settings.embed_batch_size)
+        self.extract = StageStats("extract", max(1, extract_workers))
+        self.embed = StageStats("embed", max(1, embed_workers))
+        self.upsert = StageStats("upsert", max(1, upsert_workers))
+        self._chunks_done = 0
+        self._docs_done = 0
+        self._docs_failed = 0
+
+    async def run(self, files: list[StoredFile]) -> ReindexReport:
+        q_extract: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        q_embed: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        q_upsert: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        t0 = time.perf_counter()
+
+        async def feed() -> None:
+            for f in files:
+                await q_extract.put(_Doc(f))
+            for _ in range(self.extract.workers):
+                await q_extract.put(_DONE)
+
+        await asyncio.gather(
+            feed(),
+            self._stage(self.extract, q_extract, q_embed, self.embed.workers, self._do_extract),
+            self._stage(self.embed, q_embed, q_upsert, self.upsert.workers, self._do_embed),
+            self._stage(self.upsert, q_upsert, None, 0, self._do_upsert),
+        )
+
+        return ReindexReport(
+            docs=self._docs_done,
+            chunks=self._chunks_done,
+            failed=self._docs_failed,
+            wall_s=time.perf_counter() - t0,
+            stages=[self.extract, self.embed, self.upsert],
+        )
+
+    async def _stage(
+        self,
+        stats: StageStats,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue | None,
+        next_workers: int,
+        fn: Callable[[Any, Emit], Awaitable[None]],
+    ) -> None:
+        async def worker() -> None:
+            blocked = 0.0
+
+            async def emit(item: _Batch) -> None:
+                # ожидание места в очереди — простой из-за следующей стадии, в busy не считаем
+                nonlocal blocked
+                t = time.perf_counter()
+                assert outbox is not None
+                await outbox.put(item)
+                blocked += time.perf_counter() - t
+
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+                doc = item if isinstance(item, _Doc) else item.doc
+                blocked = 0.0
+                t = time.perf_counter()
+                try:
+                    await fn(item, emit)
+                    stats.items += 1
+                except Exception:
+                    logger.exception("%s failed for file_id=%s", stats.name, doc.stored.id)
+                    stats.failed += 1
+                    self._fail(doc)
+                finally:
+                    stats.busy_s += time.perf_counter() - t - blocked
+
+        await asyncio.gather(*(worker() for _ in range(stats.workers)))
+        if outbox is not None:
+            for _ in range(next_workers):
+                await outbox.put(_DONE)
+
+    def _fail(self, doc: _Doc) -> None:
+        if not doc.failed:
+            doc.failed = True
+            self._docs_failed += 1
+
+    async def _do_extract(self, doc: _Doc, emit: Emit) -> None:
+        stored = doc.stored
+        await self.chroma.delete_file_chunks(stored.user_id, stored.id)
+
+        batch: list[PageChunk] = []
+        chunks = self.ingestion.iter_chunks(Path(stored.local_path), stored.mime, stored.sha256)
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if doc.failed:
+                    # батч уже упал на следующей стадии — дальше парсить незачем
+                    return
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    await self._emit_batch(doc, batch, emit)
+                    batch = []
+        if batch:
+            await self._emit_batch(doc, batch, emit)
+
+        doc.extracted = True
+        if doc.chunks == 0:
+            logger.warning("No text extracted for file_id=%s (%s)", stored.id, stored.orig_name)
+        await self._maybe_finish(doc)
+
+    async def _emit_batch(self, doc: _Doc, chunks: list[PageChunk], emit: Emit) -> None:
+        b = _Batch(doc, doc.chunks, chunks)
+        doc.chunks += len(chunks)
+        doc.pending += 1
+        await emit(b)
+
+    async def _do_embed(self, b: _Batch, emit: Emit) -> None:
+        if b.doc.failed:
+            return
+        b.embeddings = await self.ollama.embed([text for text, _, _ in b.chunks], priority=BACKGROUND)
+        await emit(b)
+
+    async def _do_upsert(self, b: _Batch, emit: Emit) -> None:
+        if b.doc.failed:
+            return
+        await upsert_file_chunks(self.chroma, b.doc.stored, b.chunks, b.embeddings, b.first_index)
+        self._chunks_done += len(b.chunks)
+        b.doc.pending -= 1
+        await self._maybe_finish(b.doc)
+
+    async def _maybe_finish(self, doc: _Doc) -> None:
+        # документ готов, когда извлечён целиком и все его батчи записаны
+        if doc.failed or not doc.extracted or doc.pending:
+            return
+        await mark_indexed(doc.stored, doc.chunks)  # чекпоинт в манифесте
+        self._docs_done += 1
+        logger.info("Reindexed file_id=%s chunks=%s name=%s", doc.stored.id, doc.chunks, doc.stored.orig_name)
+
+    def progress(self) -> dict[str, Any]:
+        return {"docs": self._docs_done, "chunks": self._chunks_done}
@@ -1,14 +1,179 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import math
 import re
+import threading
+import time
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Hashable
 
 from tg_assistant.config import settings
+from tg_assistant.services.chroma_service import ChromaListener, match_where
 from tg_assistant.services.ollama_service import OllamaService
 
+logger = logging.getLogger(__name__)
 
 _INT_RE = re.compile(r"\d+")
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+ENGINES = ("oneshot", "pointwise")
+
+# Шаблон Qwen3-Reranker: модель отвечает одним токеном yes/no, думать не даём (пустой <think>)
+POINTWISE_INSTRUCTION = "Given a user request, judge whether the document is what the user is looking for"
+POINTWISE_PROMPT = (
+    "<|im_start|>system\n"
+    "Judge whether the Document meets the requirements based on the Query and the Instruct provided. "
+    'Note that the answer can only be "yes" or "no".<|im_end|>\n'
+    "<|im_start|>user\n"
+    "<Instruct>: {instruction}\n<Query>: {query}\n<Document>: {document}<|im_end|>\n"
+    "<|im_start|>assistant\n<think>\n\n</think>\n\n"
+)
+POINTWISE_TOP_LOGPROBS = 20
+
+
+def yes_probability(data: dict[str, Any]) -> float:
+    """
+    P(yes) / (P(yes) + P(no)) по logprobs первого токена ответа /api/generate.
+    Если logprobs нет (старый Ollama) — 1.0 / 0.0 по тексту ответа.
+    """
+    logprobs = data.get("logprobs") or []
+    if logprobs:
+        first = logprobs[0]
+        best: dict[str, float] = {}
+        for cand in [first, *(first.get("top_logprobs") or [])]:
+            tok = str(cand.get("token", "")).strip().lower()
+            if tok in ("yes", "no"):
+                best[tok] = max(best.get(tok, -math.inf), float(cand["logprob"]))
+        if best:
+            p_yes = math.exp(best.get("yes", -math.inf))
+            p_no = math.exp(best.get("no", -math.inf))
+            return p_yes / (p_yes + p_no) if p_yes + p_no > 0 else 0.0
+    return 1.0 if (data.get("response") or "").strip().lower().startswith("yes") else 0.0
+
+
+def normalize_query(query: str) -> str:
+    """«Почти одинаковые» вопросы: регистр, пунктуация и лишние пробелы не важны."""
+    return " ".join(_NON_WORD_RE.sub(" ", query.lower()).split())
+
+
+@dataclass
+class _CachedRerank:
+    order: list[tuple[str, float | None]]  # (id хита, rerank_score) в порядке результата
+    metadatas: list[dict[str, Any]]  # метаданные кандидатов — для инвалидации по where
+    created_at: float
+
+
+class RerankCache(ChromaListener):
+    """
+    LRU + TTL кэш результатов rerank: (модель, движок, нормализованный запрос, отсортированные id кандидатов).
+    Подписан на ChromaService: запись сбрасывается, как только любой из кандидатов перезаписан или удалён.
+    """
+
+    def __init__(self, max_size: int | None = None, ttl_s: int | None = None):
+        self.max_size = max_size or settings.rerank_cache_size
+        self.ttl_s = ttl_s or settings.rerank_cache_ttl_s
+        self._entries: OrderedDict[Hashable, _CachedRerank] = OrderedDict()
+        self._by_doc: dict[str, set[Hashable]] = {}  # id чанка -> ключи записей, где он кандидат
+        self._lock = threading.Lock()
+        self.stats: Counter[str] = Counter()  # hit / miss / expired / evict / invalidate
+
+    @staticmethod
+    def key(model: str, engine: str, query: str, hits: list[dict[str, Any]]) -> Hashable:
+        return (model, engine, normalize_query(query), tuple(sorted(h["id"] for h in hits)))
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hit"] + self.stats["miss"]
+        return self.stats["hit"] / lookups if lookups else 0.0
+
+    def get(self, key: Hashable, hits: list[dict[str, Any]]) -> list[dict[str, Any]] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created_at >= self.ttl_s:
+                self._remove(key)
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["miss"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats["hit"] += 1
+            lookups = self.stats["hit"] + self.stats["miss"]
+        if lookups % 100 == 0:
+            logger.info("rerank cache: hit_rate=%.2f %s", self.hit_rate(), dict(self.stats))
+        if entry is None:
+            return None
+
+        # тексты берём из свежих хитов, из кэша — только порядок и оценки
+        by_id = {h["id"]: h for h in hits}
+        out: list[dict[str, Any]] = []
+        for hit_id, score in entry.order:
+            h = by_id[hit_id]
+            out.append(h if score is None else {**h, "rerank_score": score})
+        return out
+
+    def put(self, key: Hashable, hits: list[dict[str, Any]], result: list[dict[str, Any]]) -> None:
+        entry = _CachedRerank(
+            order=[(h["id"], h.get("rerank_score")) for h in result],
+            metadatas=[h.get("metadata") or {} for h in hits],
+            created_at=time.monotonic(),
+        )
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            for h in hits:
+                self._by_doc.setdefault(h["id"], set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.stats["evict"] += 1
+
+    def _remove(self, key: Hashable) -> None:
+        if self._entries.pop(key, None) is None:
+            return
+        for doc_id in key[-1]:
+            keys = self._by_doc.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_doc[doc_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_doc.clear()
+
+    # --- синхронизация с ChromaService ---
+
+    def on_upsert(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        with self._lock:
+            doomed = {key for doc_id in ids for key in self._by_doc.get(doc_id, ())}
+            for key in doomed:
+                self._remove(key)
+            self.stats["invalidate"] += len(doomed)
+
+    def on_delete(self, user_id: int, where: dict[str, Any]) -> None:
+        with self._lock:
+            doomed = [
+                key
+                for key, entry in self._entries.items()
+                if any(m.get("user_id", user_id) == user_id and match_where(m, where) for m in entry.metadatas)
+            ]
+            for key in doomed:
+                self._remove(key)
+            self.stats["invalidate"] += len(doomed)
+
+    def on_drop(self, user_id: int) -> None:
+        # id чанков не привязаны к пользователю — проще сбросить всё (удаление коллекции — редкость)
+        self.clear()
 
 
 @dataclass
@@ -18,9 +183,57 @@ class RerankItem:
 
 
 class RerankService:
-    def __init__(self, ollama: OllamaService, model: str | None = None):
+    def __init__(
+        self,
+        ollama: OllamaService,
+        model: str | None = None,
+        engine: str | None = None,
+        concurrency: int | None = None,
+        cache: RerankCache | None = None,
+    ):
         self.ollama = ollama
         self.model = model or settings.ollama_rerank_model
+        self.engine = engine or settings.rerank_engine
+        if self.engine not in ENGINES:
+            raise ValueError(f"unknown rerank engine: {self.engine}")
+        self._sem = asyncio.Semaphore(concurrency or settings.rerank_concurrency)
+        if cache is None and settings.rerank_cache_enabled:
+            cache = RerankCache()
+        self.cache = cache
+
+    async def rerank_hits(
+        self,
+        query: str,
+        hits: list[dict[str, Any]],
+        *,
+        max_items: int = 8,
+        timeout_s: int = 240,
+    ) -> list[dict[str, Any]]:
+        """
+        Rerank выбранным в настройках движком. У pointwise в хитах есть rerank_score (0..1).
+        Повторный запрос с теми же кандидатами отдаётся из кэша.
+        """
+        hits = hits[:max_items]
+        if len(hits) <= 1 and self.engine == "oneshot":
+            return hits
+
+        key = None
+        if self.cache is not None:
+            key = RerankCache.key(self.model, self.engine, query, hits)
+            cached = self.cache.get(key, hits)
+            if cached is not None:
+                return cached
+
+        if self.engine == "pointwise":
+            result, complete = await self.rerank_hits_pointwise(query, hits, max_items=max_items, timeout_s=timeout_s)
+        else:
+            result, complete = await self.rerank_hits_oneshot(query, hits, max_items=max_items, timeout_s=timeout_s)
+
+        # деградировавший результат (не все пары оценены, ответ модели не разобран) не кэшируем:
+        # иначе случайный таймаут на час выкинет чанк из контекста
+        if self.cache is not None and result and complete:
+            self.cache.put(key, hits, result)
+        return result
 
     async def rerank_hits_oneshot(
         self,
@@ -30,14 +243,15 @@ class RerankService:
         max_items: int = 8,
         max_doc_chars: int = 700,
         timeout_s: int = 240,
-    ) -> list[dict[str, Any]]:
+    ) -> tuple[list[dict[str, Any]], bool]:
         """
         One-shot rerank: 1 запрос к модели, которая возвращает порядок кандидатов.
-        Возвращает hits, отсортированные (лучший -> хуже).
+        Возвращает (hits, отсортированные лучший -> хуже; удалось ли разобрать ответ модели).
+        Если не удалось — hits в исходном порядке.
         """
         hits = hits[:max_items]
         if len(hits) <= 1:
-            return hits
+            return hits, True
 
         blocks: list[str] = []
         for idx, h in enumerate(hits, start=1):
@@ -70,10 +284,58 @@ class RerankService:
                 order.append(n)
 
         if not order:
-            return hits
+            logger.warning("oneshot rerank: no candidate indices in model reply %r", (out or "")[:200])
+            return hits, False
 
         for i in range(1, len(hits) + 1):
             if i not in seen:
                 order.append(i)
 
-        return [hits[i - 1] for i in order]
+        return [hits[i - 1] for i in order], True
+
+    async def score_pair(self, query: str, document: str, *, timeout_s: int = 60) -> float:
+        """Вероятность того, что документ отвечает на запрос (0..1)."""
+        prompt = POINTWISE_PROMPT.format(instruction=POINTWISE_INSTRUCTION, query=query, document=document)
+        async with self._sem:
+            data = await self.ollama.generate(
+                prompt,
+                model=self.model,
+                raw=True,
+                options={"num_predict": 1, "temperature": 0},
+                top_logprobs=POINTWISE_TOP_LOGPROBS,
+                timeout_s=timeout_s,
+            )
+        return yes_probability(data)
+
+    async def rerank_hits_pointwise(
+        self,
+        query: str,
+        hits: list[dict[str, Any]],
+        *,
+        max_items: int = 8,
+        max_doc_chars: int = 2000,
+        timeout_s: int = 240,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """
+        Pointwise rerank: каждая пара (запрос, кандидат) оценивается отдельно, параллельно
+        (не больше rerank_concurrency запросов). Возвращает (копии hits с rerank_score, лучший первым;
+        все ли пары оценены). Кандидат, которого не удалось оценить, получает 0 и уходит в конец.
+        """
+        hits = hits[:max_items]
+        if not hits:
+            return [], True
+
+        async def score(h: dict[str, Any]) -> float | None:
+            meta = h.get("metadata") or {}
+            title = meta.get("filename") or meta.get("title") or meta.get("url")
+            doc = (h.get("text") or "")[:max_doc_chars].strip()
+            try:
+                return await self.score_pair(query, f"{title}\n{doc}" if title else doc, timeout_s=timeout_s)
+            except Exception:
+                logger.warning("pointwise rerank failed for hit=%s", h.get("id"), exc_info=True)
+                return None
+
+        scores = await asyncio.gather(*(score(h) for h in hits))
+        scored = [{**h, "rerank_score": 0.0 if sc is None else sc} for h, sc in zip(hits, scores)]
+        scored.sort(key=lambda h: h["rerank_score"], reverse=True)
+        return scored, all(sc is not None for sc in scores)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from tg_assistant.config import settings
+from tg_assistant.services.document_parser import EXTRACTOR_VERSION, Page
+
+logger = logging.getLogger(__name__)
+
+_READ_SIZE = 64 * 1024
+
+# Формат: записи "<номер страницы>\t<текст>\f" подряд, всё в gzip.
+# Экстрактор гарантирует, что в тексте страницы нет \f.
+
+
+def text_cache_path(sha256: str) -> Path:
+    """Сайдкар с извлечённым текстом: один на содержимое файла и версию экстрактора."""
+    return Path(settings.data_dir) / "text_cache" / sha256[:2] / f"{sha256}.v{EXTRACTOR_VERSION}.txt.gz"
+
+
+def _parse_record(record: str) -> Page:
+    page_no, _, text = record.partition("\t")
+    return int(page_no), text
+
+
+def iter_cached_pages(sha256: str) -> Iterator[Page] | None:
+    """Постраничное чтение кэша без загрузки всего текста в память; None — кэша нет."""
+    path = text_cache_path(sha256)
+    try:
+        f = gzip.open(path, "rt", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+    def _iter() -> Iterator[Page]:
+        tail = ""
+        with f:
+            while True:
+                piece = f.read(_READ_SIZE)
+                if not piece:
+                    break
+                *records, tail = (tail + piece).split("\f")
+                for r in records:
+                    yield _parse_record(r)
+        if tail:
+            raise EOFError(f"truncated text cache entry {path}")
+
+    return _iter()
+
+
+def read_cached_pages(sha256: str) -> list[Page] | None:
+    it = iter_cached_pages(sha256)
+    if it is None:
+        return None
+    try:
+        return list(it)
+    except (OSError, EOFError, ValueError, UnicodeDecodeError):
+        logger.warning("text cache: broken entry for sha256=%s, ignoring", sha256)
+        return None
+
+
+class CachedPagesWriter:
+    """Пишет страницы в кэш по мере извлечения; файл появляется только после commit()."""
+
+    def __init__(self, sha256: str):
+        self.path = text_cache_path(sha256)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{id(self)}.tmp")
+        self._f = gzip.open(self._tmp, "wt", encoding="utf-8", compresslevel=6)
+
+    def write(self, pages: Iterable[Page]) -> None:
+        for page_no, text in pages:
+            self._f.write(f"{page_no}\t{text}\f")
+
+    def commit(self) -> None:
+        self._f.close()
+        # переименование атомарно — читатель не увидит недописанный gzip
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def write_cached_pages(sha256: str, pages: Iterable[Page]) -> None:
+    writer = CachedPagesWriter(sha256)
+    try:
+        writer.write(pages)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from tg_assistant.config import settings
+from tg_assistant.services.chroma_service import ChromaListener, ChromaService, match_where
+
+logger = logging.getLogger(__name__)
+
+_LOAD_PAGE = 1000
+
+
+@dataclass
+class _UserIndex:
+    space: str
+    ids: list[str]
+    matrix: np.ndarray  # (n, dim) float32
+    sqnorms: np.ndarray  # (n,) — ||x||^2 для L2
+    documents: list[str]
+    metadatas: list[dict[str, Any]]
+    loaded_at: float
+    masks: dict[str, np.ndarray] = field(default_factory=dict)  # кэш where -> маска строк
+
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.sqnorms.nbytes + sum(len(d) for d in self.documents)
+
+    def _reindex(self) -> None:
+        self.sqnorms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.masks.clear()
+
+
+class VectorMirror(ChromaListener):
+    """
+    Копия векторов пользователя в памяти процесса: точный top-k на NumPy вместо HTTP-запроса в Chroma.
+    Chroma остаётся источником истины: зеркало грузится лениво при первом поиске, обновляется
+    через подписку на upsert/delete ChromaService и вытесняется по LRU при превышении бюджета памяти.
+    Пользователи больше max_rows не зеркалируются — их поиск идёт в Chroma.
+    """
+
+    def __init__(
+        self,
+        chroma: ChromaService,
+        budget_mb: int | None = None,
+        max_rows: int | None = None,
+        ttl_s: int | None = None,
+    ):
+        self.chroma = chroma
+        self.budget_bytes = (budget_mb or settings.vector_mirror_budget_mb) * 1024 * 1024
+        self.max_rows = max_rows or settings.vector_mirror_max_rows
+        self.ttl_s = ttl_s or settings.vector_mirror_ttl_s
+        self._users: OrderedDict[int, _UserIndex] = OrderedDict()
+        self._too_big: dict[int, float] = {}  # user_id -> когда проверяли
+        self._lock = threading.RLock()
+        self._load_locks: dict[int, threading.Lock] = {}
+        self._dirty: set[int] = set()  # изменения во время загрузки — результат загрузки выбрасываем
+        self.stats: Counter[str] = Counter()  # hit / miss / load / evict / skip_big
+
+    def _fresh(self, user_id: int) -> bool:
+        idx = self._users.get(user_id)
+        return idx is not None and time.monotonic() - idx.loaded_at < self.ttl_s
+
+    def is_ready(self, user_id: int) -> bool:
+        """Можно ли ответить на поиск без Chroma (или загрузка заведомо бессмысленна)."""
+        with self._lock:
+            if self._fresh(user_id):
+                return True
+            checked = self._too_big.get(user_id)
+            return checked is not None and time.monotonic() - checked < self.ttl_s
+
+    def load(self, user_id: int) -> bool:
+        """Синхронная загрузка коллекции из Chroma (вызывать из потока). False — не зеркалируем."""
+        with self._lock:
+            lock = self._load_locks.setdefault(user_id, threading.Lock())
+        with lock:
+            if self.is_ready(user_id):
+                return user_id in self._users
+
+            with self._lock:
+                self._dirty.discard(user_id)
+            col = self.chroma.get_user_collection(user_id)
+            self.chroma.requests["count"] += 1
+            n = col.count()
+            if n > self.max_rows:
+                with self._lock:
+                    self._too_big[user_id] = time.monotonic()
+                    self._users.pop(user_id, None)
+                self.stats["skip_big"] += 1
+                logger.info("vector mirror: user=%s has %s rows > %s, using Chroma", user_id, n, self.max_rows)
+                return False
+
+            t0 = time.perf_counter()
+            ids: list[str] = []
+            blocks: list[np.ndarray] = []
+            documents: list[str] = []
+            metadatas: list[dict[str, Any]] = []
+            for offset in range(0, n, _LOAD_PAGE):
+                self.chroma.requests["get"] += 1
+                page = col.get(
+                    limit=_LOAD_PAGE,
+                    offset=offset,
+                    include=["embeddings", "documents", "metadatas"],
+                )
+                ids.extend(page["ids"])
+                # сразу во float32: список питоновских float на порядок тяжелее матрицы
+                blocks.append(np.asarray(page["embeddings"], dtype=np.float32).reshape(len(page["ids"]), -1))
+                documents.extend(d or "" for d in page["documents"])
+                metadatas.extend(m or {} for m in page["metadatas"])
+
+            space = (col.metadata or {}).get("hnsw:space", "l2")
+            matrix = np.concatenate(blocks) if blocks else np.zeros((0, 0), np.float32)
+            idx = _UserIndex(space, ids, matrix, np.empty(0, np.float32), documents, metadatas, time.monotonic())
+            idx._reindex()
+
+            with self._lock:
+                if user_id in self._dirty:
+                    # пока читали, коллекция поменялась — не рискуем отдать устаревшее
+                    self._dirty.discard(user_id)
+                    self._users.pop(user_id, None)
+                    logger.info("vector mirror: user=%s changed during load, retry later", user_id)
+                    return False
+                self._too_big.pop(user_id, None)
+                self._users[user_id] = idx
+                self._users.move_to_end(user_id)
+                self.stats["load"] += 1
+                self._evict()
+            logger.info(
+                "vector mirror: loaded user=%s rows=%s %.1f MB in %.2fs",
+                user_id, len(ids), idx.nbytes() / 1024 / 1024, time.perf_counter() - t0,
+            )
+            return True
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(i.nbytes() for i in self._users.values())
+
+    def _evict(self) -> None:
+        total = sum(i.nbytes() for i in self._users.values())
+        while total > self.budget_bytes and len(self._users) > 1:
+            user_id, idx = self._users.popitem(last=False)
+            total -= idx.nbytes()
+            self.stats["evict"] += 1
+            logger.info("vector mirror: evicted user=%s", user_id)
+
+    def query(
+        self,
+        user_id: int,
+        query_embedding: list[float],
+        n_results: int,
+        where: dict | None = None,
+    ) -> list[dict[str, Any]] | None:
+        """Результат в формате ChromaService.query_by_embedding; None — пользователя нет в зеркале."""
+        with self._lock:
+            if not self._fresh(user_id):
+                self.stats["miss"] += 1
+                return None
+            idx = self._users[user_id]
+            self._users.move_to_end(user_id)
+            self.stats["hit"] += 1
+
+            rows = np.arange(len(idx.ids))
+            if where:
+                key = json.dumps(where, sort_keys=True)
+                mask = idx.masks.get(key)
+                if mask is None:
+                    mask = np.fromiter((match_where(m, where) for m in idx.metadatas), bool, len(idx.ids))
+                    idx.masks[key] = mask
+                rows = np.flatnonzero(mask)
+            if rows.size == 0 or n_results <= 0:
+                return []
+
+            q = np.asarray(query_embedding, dtype=np.float32)
+            # скаляры по всей матрице дешевле, чем копировать отфильтрованные строки
+            dots = (idx.matrix @ q)[rows]
+            if idx.space == "cosine":
+                norms = np.sqrt(idx.sqnorms[rows]) * float(np.linalg.norm(q))
+                dist = 1.0 - dots / np.maximum(norms, 1e-12)
+            elif idx.space == "ip":
+                dist = 1.0 - dots
+            else:  # l2 в Chroma — квадрат евклидова расстояния
+                dist = idx.sqnorms[rows] - 2.0 * dots + float(q @ q)
+
+            k = min(n_results, rows.size)
+            top = np.argpartition(dist, k - 1)[:k] if k < rows.size else np.arange(rows.size)
+            top = top[np.argsort(dist[top], kind="stable")]
+            return [
+                {
+                    "id": idx.ids[rows[i]],
+                    "text": idx.documents[rows[i]],
+                    "metadata": idx.metadatas[rows[i]],
+                    "distance": float(dist[i]),
+                }
+                for i in top
+            ]
+
+    # --- синхронизация с ChromaService ---
+
+    def on_upsert(
+        self,
+        user_id: int,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        with self._lock:
+            self._dirty.add(user_id)
+            idx = self._users.get(user_id)
+            if idx is None:
+                return
+            try:
+                self._apply_upsert(idx, ids, embeddings, documents, metadatas)
+            except Exception:
+                # зеркало могло остаться наполовину обновлённым — выкидываем, перечитаем из Chroma
+                self._users.pop(user_id, None)
+                raise
+            if len(idx.ids) > self.max_rows:
+                self._users.pop(user_id, None)
+            else:
+                self._evict()
+
+    @staticmethod
+    def _apply_upsert(
+        idx: _UserIndex,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        pos = {doc_id: i for i, doc_id in enumerate(idx.ids)}
+        new_rows: list[int] = []
+        for j, doc_id in enumerate(ids):
+            i = pos.get(doc_id)
+            if i is None:
+                new_rows.append(j)
+                continue
+            idx.matrix[i] = embeddings[j]
+            idx.documents[i] = documents[j]
+            idx.metadatas[i] = metadatas[j]
+        if new_rows:
+            idx.ids.extend(ids[j] for j in new_rows)
+            idx.documents.extend(documents[j] for j in new_rows)
+            idx.metadatas.extend(metadatas[j] for j in new_rows)
+            add = np.asarray([embeddings[j] for j in new_rows], dtype=np.float32)
+            idx.matrix = np.vstack([idx.matrix, add]) if idx.matrix.size else add
+        idx._reindex()
+
+    def on_delete(self, user_id: int, where: dict[str, Any]) -> None:
+        with self._lock:
+            self._dirty.add(user_id)
+            idx = self._users.get(user_id)
+            if idx is None:
+                return
+            keep = [i for i, m in enumerate(idx.metadatas) if not match_where(m, where)]
+            if len(keep) == len(idx.ids):
+                return
+            idx.ids = [idx.ids[i] for i in keep]
+            idx.documents = [idx.documents[i] for i in keep]
+            idx.metadatas = [idx.metadatas[i] for i in keep]
+            idx.matrix = idx.matrix[keep]
+            idx._reindex()
+
+    def on_drop(self, user_id: int) -> None:
+        with self._lock:
+            self._dirty.add(user_id)
+            self._users.pop(user_id, None)
+            self._too_big.pop(user_id, None)
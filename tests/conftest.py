@@ -0,0 +1,5 @@
+import os
+
+# Settings читаются при импорте tg_assistant.config: тестам не нужны ни токен, ни дисковый кэш
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ["EMBED_CACHE_ENABLED"] = "false"
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from tg_assistant.services.ollama_service import EmbedBatcher
+
+
+class BadInput(Exception):
+    pass
+
+
+class NodeDown(Exception):
+    pass
+
+
+class FakeEmbed:
+    """post для EmbedBatcher: вектор — длина текста; «FAIL» в запросе роняет весь запрос."""
+
+    def __init__(self, error: type[Exception] = BadInput) -> None:
+        self.error = error
+        self.requests: list[list[str]] = []
+
+    async def __call__(self, texts: list[str], model: str, timeout_s: int, priority: str) -> list[list[float]]:
+        self.requests.append(texts)
+        if "FAIL" in texts:
+            raise self.error("bad input")
+        return [[float(len(t))] for t in texts]
+
+
+def make_batcher(post: FakeEmbed) -> EmbedBatcher:
+    return EmbedBatcher(post, window_s=0.01, max_batch=64, node_failure=lambda e: isinstance(e, NodeDown))
+
+
+async def test_calls_in_one_window_share_a_request():
+    post = FakeEmbed()
+    batcher = make_batcher(post)
+
+    a, b = await asyncio.gather(batcher.embed(["a", "bb"], "m", 10), batcher.embed(["ccc"], "m", 10))
+
+    assert (a, b) == ([[1.0], [2.0]], [[3.0]])
+    assert len(post.requests) == 1
+
+
+async def test_bad_input_fails_only_its_caller():
+    post = FakeEmbed()
+    batcher = make_batcher(post)
+
+    bad, good = await asyncio.gather(
+        batcher.embed(["FAIL", "a"], "m", 10),
+        batcher.embed(["b"], "m", 10),
+        return_exceptions=True,
+    )
+
+    assert isinstance(bad, BadInput)
+    assert good == [[1.0]]
+    assert batcher.stats["isolated"] == 1
+
+
+async def test_node_failure_fails_the_whole_part():
+    post = FakeEmbed(error=NodeDown)
+    batcher = make_batcher(post)
+
+    results = await asyncio.gather(
+        batcher.embed(["FAIL", "a"], "m", 10),
+        batcher.embed(["b"], "m", 10),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(r, NodeDown) for r in results)
+    assert len(post.requests) == 1
+
+
+async def test_short_response_fails_callers_instead_of_hanging():
+    async def short(texts: list[str], model: str, timeout_s: int, priority: str) -> list[list[float]]:
+        return [[0.0]] * (len(texts) - 1)
+
+    batcher = EmbedBatcher(short, window_s=0.01, max_batch=64)
+
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(batcher.embed(["a", "b"], "m", 10), timeout=1)
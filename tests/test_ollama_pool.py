@@ -0,0 +1,186 @@
+import asyncio
+from collections import Counter
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from tg_assistant.services.ollama_pool import NoBackendError, OllamaPool
+from tg_assistant.services.ollama_scheduler import PRIORITIES, OllamaScheduler
+from tg_assistant.services.ollama_service import OllamaService
+
+
+class StubOllama:
+    """Локальный HTTP-сервер с /api/embed и /api/chat; умеет отвечать ошибкой и с задержкой."""
+
+    def __init__(self) -> None:
+        self.fail_status: int | None = None
+        self.delay_s = 0.0
+        self.hits: Counter[str] = Counter()
+        app = web.Application()
+        app.router.add_post("/api/embed", self.embed)
+        app.router.add_post("/api/chat", self.chat)
+        self.server = TestServer(app)
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+    async def _handle(self, request: web.Request) -> tuple[dict, web.Response | None]:
+        self.hits[request.path] += 1
+        body = await request.json()
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        if self.fail_status is not None:
+            return body, web.json_response({"error": "boom"}, status=self.fail_status)
+        return body, None
+
+    async def embed(self, request: web.Request) -> web.Response:
+        body, error = await self._handle(request)
+        if error is not None:
+            return error
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return web.json_response({"embeddings": [[1.0, 0.0] for _ in texts]})
+
+    async def chat(self, request: web.Request) -> web.Response:
+        body, error = await self._handle(request)
+        if error is not None:
+            return error
+        content = {"intent": "qa", "query": "q"} if body.get("format") else "ok"
+        return web.json_response({"message": {"role": "assistant", "content": content}, "done": True})
+
+
+@pytest.fixture
+async def stubs():
+    nodes = [StubOllama(), StubOllama()]
+    for node in nodes:
+        await node.server.start_server()
+    yield nodes
+    for node in nodes:
+        await node.server.close()
+
+
+@pytest.fixture
+async def make_service():
+    services: list[OllamaService] = []
+
+    def make(pool: OllamaPool) -> OllamaService:
+        service = OllamaService(embed_batching=False, pool=pool)
+        # допуск не должен ограничивать параллелизм: проверяется распределение по узлам
+        service.scheduler = OllamaScheduler(max_inflight=8, limits=dict.fromkeys(PRIORITIES, 8))
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        await service.close()
+
+
+def make_pool(stubs: list[StubOllama], breaker_failures: int = 2, cooldown_s: float = 60.0) -> OllamaPool:
+    return OllamaPool([(s.url, None) for s in stubs], breaker_failures=breaker_failures, cooldown_s=cooldown_s)
+
+
+async def test_requests_spread_by_least_outstanding(stubs, make_service):
+    for node in stubs:
+        node.delay_s = 0.2
+    ollama = make_service(make_pool(stubs))
+
+    await asyncio.gather(*(ollama.embed([f"text {i}"]) for i in range(4)))
+
+    assert [node.hits["/api/embed"] for node in stubs] == [2, 2]
+
+
+async def test_node_ejected_after_breaker_failures(stubs, make_service):
+    bad, good = stubs
+    bad.fail_status = 500
+    pool = make_pool(stubs, breaker_failures=2)
+    ollama = make_service(pool)
+
+    for _ in range(2):
+        # chat не идемпотентен: ошибка узла уходит вызывающему, а не на другой узел
+        with pytest.raises(aiohttp.ClientResponseError):
+            await ollama.chat([{"role": "user", "content": "hi"}])
+    assert pool.state(pool.endpoints[0]) == "open"
+
+    for _ in range(3):
+        assert await ollama.chat([{"role": "user", "content": "hi"}]) == "ok"
+    assert bad.hits["/api/chat"] == 2
+    assert good.hits["/api/chat"] == 3
+
+
+async def test_chat_is_not_retried_on_another_node(stubs, make_service):
+    bad, good = stubs
+    bad.fail_status = 503
+    ollama = make_service(make_pool(stubs))
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await ollama.chat([{"role": "user", "content": "hi"}])
+
+    assert bad.hits["/api/chat"] == 1
+    assert good.hits["/api/chat"] == 0
+
+
+async def test_idempotent_calls_retry_on_another_node(stubs, make_service):
+    bad, good = stubs
+    bad.fail_status = 500
+    pool = make_pool(stubs, breaker_failures=5)
+    ollama = make_service(pool)
+
+    assert await ollama.embed(["hello"]) == [[1.0, 0.0]]
+    assert await ollama.classify_intent("найди договор") == {"intent": "qa", "query": "q"}
+
+    assert bad.hits == Counter({"/api/embed": 1, "/api/chat": 1})
+    assert good.hits == Counter({"/api/embed": 1, "/api/chat": 1})
+    assert pool.endpoints[0].failures == 2
+
+
+async def test_recovery_after_cooldown_sends_a_single_probe(stubs, make_service):
+    bad, good = stubs
+    bad.fail_status = 500
+    pool = make_pool(stubs, breaker_failures=1, cooldown_s=0.2)
+    ollama = make_service(pool)
+    await ollama.embed(["eject"])  # ошибка на первом узле, повтор на втором
+    assert pool.state(pool.endpoints[0]) == "open"
+
+    bad.fail_status = None
+    bad.delay_s = 0.2
+    await asyncio.sleep(0.25)
+    assert pool.state(pool.endpoints[0]) == "half_open"
+    bad.hits.clear()
+    good.hits.clear()
+
+    # пока пробный запрос в полёте, остальные идут на здоровый узел
+    await asyncio.gather(*(ollama.embed([f"text {i}"]) for i in range(4)))
+    assert bad.hits["/api/embed"] == 1
+    assert good.hits["/api/embed"] == 3
+
+    # проба успешна — узел снова в ротации
+    assert pool.state(pool.endpoints[0]) == "closed"
+    assert pool.endpoints[0].stats["probes"] == 1
+    await asyncio.gather(*(ollama.embed([f"more {i}"]) for i in range(4)))
+    assert bad.hits["/api/embed"] == 3
+
+
+async def test_failed_probe_ejects_node_again(stubs, make_service):
+    bad, good = stubs
+    bad.fail_status = 500
+    pool = make_pool(stubs, breaker_failures=1, cooldown_s=0.2)
+    ollama = make_service(pool)
+    await ollama.embed(["eject"])
+
+    await asyncio.sleep(0.25)
+    await ollama.embed(["probe"])  # проба падает, запрос повторяется на втором узле
+
+    assert bad.hits["/api/embed"] == 2
+    assert pool.state(pool.endpoints[0]) == "open"
+    assert pool.endpoints[0].stats["ejections"] == 2
+
+
+async def test_no_backend_for_model(stubs, make_service):
+    pool = OllamaPool([(stubs[0].url, frozenset({"nomic-embed-text"}))])
+    ollama = make_service(pool)
+
+    with pytest.raises(NoBackendError):
+        await ollama.embed(["hello"], model="some-other-model")
+    assert stubs[0].hits["/api/embed"] == 0
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from tg_assistant.services.ollama_scheduler import BACKGROUND, INTERACTIVE, OllamaScheduler
+
+
+async def hold(scheduler: OllamaScheduler, priority: str, seconds: float, timeout_s: float = 10.0) -> float:
+    async with scheduler.slot(priority, timeout_s) as remaining_s:
+        await asyncio.sleep(seconds)
+    return remaining_s
+
+
+async def test_background_waits_out_busy_chat_instead_of_failing():
+    scheduler = OllamaScheduler(max_inflight=2, limits={INTERACTIVE: 2, BACKGROUND: 1}, queue_timeouts={BACKGROUND: 5.0})
+    chats = [asyncio.create_task(hold(scheduler, INTERACTIVE, 0.3)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    # очередь дольше timeout_s, но бюджет HTTP-запроса отсчитывается от допуска
+    remaining_s = await hold(scheduler, BACKGROUND, 0.0, timeout_s=0.1)
+
+    assert remaining_s == pytest.approx(0.1, abs=0.05)
+    assert scheduler.counters[BACKGROUND]["timeouts"] == 0
+    await asyncio.gather(*chats)
+
+
+async def test_background_gives_up_after_queue_timeout():
+    scheduler = OllamaScheduler(max_inflight=1, limits={INTERACTIVE: 1, BACKGROUND: 1}, queue_timeouts={BACKGROUND: 0.1})
+    chat = asyncio.create_task(hold(scheduler, INTERACTIVE, 0.5))
+    await asyncio.sleep(0)
+
+    with pytest.raises(TimeoutError):
+        await hold(scheduler, BACKGROUND, 0.0, timeout_s=10.0)
+
+    assert scheduler.counters[BACKGROUND]["timeouts"] == 1
+    await chat
+
+
+async def test_interactive_queue_time_counts_against_timeout():
+    scheduler = OllamaScheduler(max_inflight=1, limits={INTERACTIVE: 1, BACKGROUND: 1})
+    chat = asyncio.create_task(hold(scheduler, INTERACTIVE, 0.3))
+    await asyncio.sleep(0)
+
+    with pytest.raises(TimeoutError):
+        await hold(scheduler, INTERACTIVE, 0.0, timeout_s=0.1)
+    await chat
+
+
+def test_default_limits_leave_a_slot_for_background():
+    scheduler = OllamaScheduler()
+
+    assert scheduler.limits[INTERACTIVE] < scheduler.max_inflight